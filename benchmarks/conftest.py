@@ -0,0 +1,80 @@
+"""
+Synthetic scenes and parameter sweeps of the benchmarks.
+
+The quick sweep runs by default; ``--sweep=full`` runs every kernel size from 3
+to 21, scene sizes from 1024² to 16384² and stacks of 5 to 50 images, which
+needs a machine with ~32 GB of memory for the largest scenes.
+"""
+
+import numpy as np
+import pytest
+
+SWEEPS = {
+    "quick": {
+        "kernel_size": [3, 7, 15],
+        "scene_size": [1024],
+        "nr_of_images": [5],
+    },
+    "full": {
+        "kernel_size": [3, 5, 7, 9, 11, 13, 15, 17, 19, 21],
+        "scene_size": [1024, 2048, 4096, 8192, 16384],
+        "nr_of_images": [5, 10, 20, 50],
+    },
+}
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--sweep", choices=sorted(SWEEPS), default="quick", help="parameter sweep of the benchmarks"
+    )
+    parser.addoption("--sweep-rounds", type=int, default=3, help="timed rounds of each benchmark")
+
+
+def pytest_generate_tests(metafunc):
+    sweep = SWEEPS[metafunc.config.getoption("sweep")]
+    for name, values in sweep.items():
+        if name in metafunc.fixturenames:
+            metafunc.parametrize(name, values, ids=[f"{name}={value}" for value in values])
+
+
+@pytest.fixture(scope="session")
+def rounds(request):
+    return request.config.getoption("sweep_rounds")
+
+
+def synthetic_scene(size, seed=0):
+    # gamma distributed speckle around a VV / VH backscatter, and the incidence
+    # angle of an IW swath across the columns
+    rng = np.random.default_rng(seed)
+    vv = rng.gamma(4.0, 0.1 / 4, size=(size, size))
+    vh = rng.gamma(4.0, 0.02 / 4, size=(size, size))
+    angle = np.broadcast_to(np.linspace(29.0, 47.0, size), (size, size))
+    return np.stack([vv, vh, angle])
+
+
+@pytest.fixture(scope="session")
+def scenes():
+    # scenes of each size, generated once for all the benchmarks
+    cache = {}
+
+    def get(size, seed=0):
+        if (size, seed) not in cache:
+            cache.clear()
+            cache[size, seed] = synthetic_scene(size, seed)
+        return cache[size, seed]
+
+    return get
+
+
+@pytest.fixture(scope="session")
+def dems():
+    cache = {}
+
+    def get(size):
+        if size not in cache:
+            cache.clear()
+            x = np.arange(size, dtype=float)
+            cache[size] = 300 * np.sin(x / 60)[None, :] * np.cos(x / 90)[:, None]
+        return cache[size]
+
+    return get
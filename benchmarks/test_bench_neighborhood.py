@@ -0,0 +1,15 @@
+"""Benchmarks of the window sum strategies of the local backend, their crossover sets the dispatch."""
+
+import numpy as np
+import pytest
+
+from gee_s1_processing.local import neighborhood as nb
+
+
+@pytest.mark.parametrize("strategy", nb.WINDOW_STRATEGIES)
+def test_window_sums(benchmark, rounds, scenes, strategy, kernel_size):
+    # the count, sum and sum of squares of one band, as in window_stats
+    band = scenes(1024)[0]
+    stack = np.stack([np.ones_like(band), band, band * band])
+    benchmark.group = f"WINDOW SUMS {kernel_size}x{kernel_size} 1024"
+    benchmark.pedantic(nb.box_sum, (stack, kernel_size // 2, strategy), rounds=rounds)
@@ -0,0 +1,41 @@
+"""Benchmarks of the mono-temporal and multi-temporal speckle filters of the local backend."""
+
+import pytest
+
+from gee_s1_processing.local import multitemporal as mt
+from gee_s1_processing.local import speckle_filter as sf
+
+BANDS = ["VV", "VH", "angle"]
+# the Refined Lee windows are fixed, it does not depend on the kernel size
+KERNEL_FILTERS = ["BOXCAR", "LEE", "GAMMA MAP", "LEE SIGMA"]
+FILTERS = [*KERNEL_FILTERS, "REFINED LEE"]
+
+
+@pytest.mark.parametrize("speckle_filter", KERNEL_FILTERS)
+def test_mono_kernel_size(benchmark, rounds, scenes, speckle_filter, kernel_size):
+    scene = scenes(1024)
+    benchmark.group = f"MONO {speckle_filter} 1024"
+    benchmark.pedantic(
+        sf.spatial_filter, (scene, kernel_size, speckle_filter, BANDS), rounds=rounds
+    )
+
+
+@pytest.mark.parametrize("speckle_filter", FILTERS)
+def test_mono_scene_size(benchmark, rounds, scenes, speckle_filter, scene_size):
+    scene = scenes(scene_size)
+    benchmark.group = f"MONO {speckle_filter} 7x7"
+    benchmark.pedantic(sf.spatial_filter, (scene, 7, speckle_filter, BANDS), rounds=rounds)
+
+
+@pytest.mark.parametrize("speckle_filter", FILTERS)
+def test_multi_nr_of_images(benchmark, rounds, scenes, speckle_filter, nr_of_images):
+    # the filter only reads the scenes, the same scene is pushed at every date
+    scene = scenes(1024)
+
+    def run():
+        stream = ((t, 1, scene) for t in range(nr_of_images))
+        for _ in mt.MultiTemporal_Filter(stream, 7, speckle_filter, nr_of_images, BANDS):
+            pass
+
+    benchmark.group = f"MULTI {speckle_filter} 1024 7x7"
+    benchmark.pedantic(run, rounds=rounds)
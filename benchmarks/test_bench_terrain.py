@@ -0,0 +1,21 @@
+"""Benchmarks of the terrain flattening and border noise masking of the local backend."""
+
+import pytest
+
+from gee_s1_processing.local import pipeline as lp
+from gee_s1_processing.local import terrain_flattening as trf
+
+BANDS = ["VV", "VH", "angle"]
+
+
+@pytest.mark.parametrize("model", ["VOLUME", "DIRECT"])
+def test_terrain_flattening(benchmark, rounds, scenes, dems, model, scene_size):
+    scene, dem = scenes(scene_size), dems(scene_size)
+    benchmark.group = f"TERRAIN FLATTENING {model}"
+    benchmark.pedantic(trf.slope_correction, (scene, BANDS, model, 30, dem), rounds=rounds)
+
+
+def test_border_noise(benchmark, rounds, scenes, scene_size):
+    scene = scenes(scene_size)
+    benchmark.group = "BORDER NOISE"
+    benchmark.pedantic(lp.border_noise, (scene[2],), rounds=rounds)
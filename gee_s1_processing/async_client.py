@@ -0,0 +1,302 @@
+"""
+Description: Asynchronous Earth Engine client for concurrent value and pixel
+requests on the outputs of the package.
+
+``getInfo`` and ``computePixels`` block on the HTTP round trip of each call.
+``AsyncClient`` sends the same REST requests (``value:compute`` and
+``image:computePixels``) from one pooled ``aiohttp`` session: at most
+``max_concurrency`` requests are in flight, and the rate limited (429) and
+unavailable (5xx) responses are retried with an exponential backoff, or after
+their Retry-After delay. A 429 response pauses all the requests of the client,
+so that a burst does not keep hitting the quota. ``map_values`` and
+``map_pixels`` evaluate one pipeline definition over many AOIs or dates
+concurrently.
+
+It needs the ``async`` extra (``pip install gee_s1_processing[async]``).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+from typing import TYPE_CHECKING, Any
+
+import aiohttp
+import ee
+
+from . import tracing
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable, Sequence
+
+    import numpy as np
+    from ee.computedobject import ComputedObject
+    from ee.image import Image
+
+DEFAULT_URL = "https://earthengine.googleapis.com/v1"
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+
+def pixel_grid(
+    x: float, y: float, width: int, height: int, scale: float, crs: str = "EPSG:4326"
+) -> dict[str, Any]:
+    """
+    Pixel grid of a ``computePixels`` request.
+
+    Parameters
+    ----------
+    x : float
+        Coordinate of the left edge of the grid in the crs
+    y : float
+        Coordinate of the top edge of the grid in the crs
+    width : int
+        Number of columns
+    height : int
+        Number of rows
+    scale : float
+        Pixel size in the units of the crs
+    crs : str
+        Coordinate reference system of the grid
+
+    Returns
+    -------
+    dict[str, Any]
+        The "grid" of the request, north up
+
+    """
+    return {
+        "dimensions": {"width": int(width), "height": int(height)},
+        "affineTransform": {
+            "scaleX": scale,
+            "shearX": 0,
+            "translateX": x,
+            "shearY": 0,
+            "scaleY": -scale,
+            "translateY": y,
+        },
+        "crsCode": crs,
+    }
+
+
+def _expression(obj: ComputedObject | dict) -> dict:
+    # an already encoded expression is sent as is
+    if isinstance(obj, dict):
+        return obj
+    return ee.serializer.encode(obj, for_cloud_api=True)
+
+
+class AsyncClient:
+    """
+    Pooled and rate limit aware asynchronous Earth Engine client.
+
+    Used as an async context manager, which opens and closes the session.
+
+    Parameters
+    ----------
+    project : str
+        Cloud project of the requests
+    base_url : str
+        Root of the REST API, e.g. a local server in the tests
+    credentials : Any
+        google.auth credentials, e.g. ``ee.data.get_persistent_credentials()``;
+        the requests are not authorized if None
+    max_concurrency : int
+        Maximum number of requests in flight
+    max_retries : int
+        Maximum number of retries of a request
+    backoff : float
+        Delay in seconds before the first retry, doubled at each retry
+    timeout : float
+        Timeout of a request in seconds
+
+    """
+
+    def __init__(
+        self,
+        project: str,
+        base_url: str = DEFAULT_URL,
+        credentials: Any = None,
+        max_concurrency: int = 10,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        timeout: float = 300.0,
+    ):
+        if max_concurrency <= 0:
+            raise ValueError("ERROR!!! max_concurrency not correctly defined")
+        self.project = project
+        self.base_url = base_url.rstrip("/")
+        self.credentials = credentials
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._session: aiohttp.ClientSession | None = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # time of the event loop before which no request is sent, after a 429
+        self._resume_at = 0.0
+
+    async def __aenter__(self) -> AsyncClient:
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        return self
+
+    async def __aexit__(self, *args: object) -> None:
+        await self._session.close()
+        self._session = None
+
+    async def _headers(self) -> dict[str, str]:
+        if self.credentials is None:
+            return {}
+        if not self.credentials.valid:
+            from google.auth.transport.requests import Request
+
+            await asyncio.to_thread(self.credentials.refresh, Request())
+        return {"Authorization": f"Bearer {self.credentials.token}"}
+
+    async def _post(self, method: str, body: dict[str, Any]) -> bytes:
+        if self._session is None:
+            raise ValueError("ERROR!!! the client is used outside of its context")
+        url = f"{self.base_url}/projects/{self.project}/{method}"
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            with tracing.span("ee.request", method=method) as span:
+                for attempt in range(self.max_retries + 1):
+                    pause = self._resume_at - loop.time()
+                    if pause > 0:
+                        await asyncio.sleep(pause)
+                    delay = self.backoff * 2**attempt
+                    span.set(attempts=attempt + 1)
+                    try:
+                        async with self._session.post(
+                            url, json=body, headers=await self._headers()
+                        ) as response:
+                            span.set(status=response.status)
+                            if response.status == 200:
+                                data = await response.read()
+                                tracing.metric("ee.request.bytes", len(data), method=method)
+                                return data
+                            message = await response.text()
+                            if response.status not in RETRY_STATUSES:
+                                raise ee.EEException(_error_message(message))
+                            retry_after = response.headers.get("Retry-After", "")
+                            if retry_after.replace(".", "", 1).isdigit():
+                                delay = float(retry_after)
+                            if response.status == 429:
+                                self._resume_at = max(self._resume_at, loop.time() + delay)
+                    except aiohttp.ClientConnectionError as error:
+                        message = str(error)
+                    if attempt < self.max_retries:
+                        await asyncio.sleep(delay)
+                raise ee.EEException(_error_message(message))
+
+    async def compute_value(self, obj: ComputedObject | dict) -> Any:
+        """
+        Value of an object, as ``getInfo``.
+
+        Parameters
+        ----------
+        obj : ComputedObject | dict
+            Object to compute, or its encoded expression
+
+        Returns
+        -------
+        Any
+            The computed value
+
+        """
+        data = await self._post("value:compute", {"expression": _expression(obj)})
+        return json.loads(data)["result"]
+
+    async def compute_pixels(
+        self,
+        image: Image | dict,
+        grid: dict[str, Any] | None = None,
+        band_ids: Sequence[str] | None = None,
+    ) -> np.ndarray:
+        """
+        Pixels of an image, as ``ee.data.computePixels`` with the NUMPY_NDARRAY format.
+
+        Parameters
+        ----------
+        image : Image | dict
+            Image to compute, or its encoded expression
+        grid : dict[str, Any] | None
+            Pixel grid of the request, see ``pixel_grid``
+        band_ids : Sequence[str] | None
+            Bands to compute, all if None
+
+        Returns
+        -------
+        np.ndarray
+            (rows, cols) structured array with one field per band
+
+        """
+        import numpy as np
+
+        body: dict[str, Any] = {"expression": _expression(image), "fileFormat": "NPY"}
+        if grid is not None:
+            body["grid"] = grid
+        if band_ids is not None:
+            body["bandIds"] = list(band_ids)
+        return np.load(io.BytesIO(await self._post("image:computePixels", body)))
+
+    async def map_values(
+        self, build: Callable[[Any], ComputedObject], items: Iterable[Any]
+    ) -> list[Any]:
+        """
+        Values of a pipeline over many items, e.g. AOIs or dates, concurrently.
+
+        Parameters
+        ----------
+        build : Callable[[Any], ComputedObject]
+            Pipeline definition, builds the object of an item
+        items : Iterable[Any]
+            The items
+
+        Returns
+        -------
+        list[Any]
+            Value of each item, in order
+
+        """
+        return await asyncio.gather(*(self.compute_value(build(item)) for item in items))
+
+    async def map_pixels(
+        self,
+        build: Callable[[Any], tuple[Image, dict[str, Any]]],
+        items: Iterable[Any],
+        band_ids: Sequence[str] | None = None,
+    ) -> list[np.ndarray]:
+        """
+        Pixels of a pipeline over many items, e.g. AOIs or dates, concurrently.
+
+        Parameters
+        ----------
+        build : Callable[[Any], tuple[Image, dict[str, Any]]]
+            Pipeline definition, builds the image and the pixel grid of an item
+        items : Iterable[Any]
+            The items
+        band_ids : Sequence[str] | None
+            Bands to compute, all if None
+
+        Returns
+        -------
+        list[np.ndarray]
+            Pixels of each item, in order
+
+        """
+        requests = [build(item) for item in items]
+        return await asyncio.gather(
+            *(self.compute_pixels(image, grid, band_ids) for image, grid in requests)
+        )
+
+
+def _error_message(text: str) -> str:
+    # {"error": {"code": ..., "message": ..., "status": ...}} from the REST API
+    try:
+        return json.loads(text)["error"]["message"]
+    except (ValueError, KeyError, TypeError):
+        return text
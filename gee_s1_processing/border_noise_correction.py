@@ -107,3 +107,25 @@ def f_mask_edges(image: Image) -> Image:
     # output = maskEdge(output)
     output = helper.db_to_lin(output)
     return output.set("system:time_start", image.get("system:time_start"))
+
+
+def mask_border_noise(image: Image) -> Image:
+    """
+    Mask out border noise artefacts, as f_mask_edges, in a single pass.
+
+    The angle masks do not depend on the backscatter scale, so the image is
+    not converted to dB and back, and its properties are left to the caller.
+
+    Parameters
+    ----------
+    image : Image
+        image to apply the border noise correction to
+
+    Returns
+    -------
+    Image
+        Corrected image
+
+    """
+    ang = image.select(["angle"])
+    return image.updateMask(ang.gt(30.63993).And(ang.lt(45.23993)))
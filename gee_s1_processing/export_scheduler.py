@@ -0,0 +1,462 @@
+"""
+Description: Scheduler of the export tasks of a processed collection.
+
+A processed collection is split into chunks, by date range (``date_chunks``)
+and / or relative orbit (``orbit_chunks``), and each chunk is exported by one
+task. ``ExportScheduler`` keeps at most ``max_running`` tasks submitted, polls
+their state and resubmits the failed ones with an exponential backoff, up to
+``max_attempts``. Its state is saved to a JSON file after every step, so an
+interrupted run resumes where it stopped: completed chunks are not exported
+again and submitted tasks are polled instead of being resubmitted.
+
+The tasks are submitted through a task service: ``EETaskService`` for Earth
+Engine, or any object with the same ``start`` and ``status`` methods, e.g. a
+local fake for the tests.
+"""
+
+from __future__ import annotations
+
+import datetime
+import json
+import os
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import ee
+
+from . import tracing
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable, Sequence
+
+    from ee.image import Image
+    from ee.imagecollection import ImageCollection
+
+STATE_VERSION = 1
+# Earth Engine task states
+ACTIVE_STATES = ["UNSUBMITTED", "READY", "RUNNING", "CANCEL_REQUESTED"]
+# task state of each state of an Earth Engine operation
+OPERATION_STATES = {
+    "PENDING": "READY",
+    "RUNNING": "RUNNING",
+    "CANCELLING": "CANCEL_REQUESTED",
+    "SUCCEEDED": "COMPLETED",
+    "CANCELLED": "CANCELLED",
+    "FAILED": "FAILED",
+}
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """
+    Part of a collection exported by one task.
+
+    Parameters
+    ----------
+    start : str | None
+        First date, inclusive
+    end : str | None
+        Last date, exclusive
+    relativeOrbit : int | None
+        Relative orbit of the images, all if None
+
+    """
+
+    start: str | None = None
+    end: str | None = None
+    relativeOrbit: int | None = None
+
+    @property
+    def name(self) -> str:
+        """Task description of the chunk, unique within a run."""
+        parts = [self.start, self.end, self.relativeOrbit]
+        name = "_".join(["S1", *("" if part is None else str(part) for part in parts)])
+        # descriptions are letters, digits, "-" and "_"
+        return re.sub(r"[^A-Za-z0-9_-]", "-", name)
+
+    def filter(self, collection: ImageCollection) -> ImageCollection:
+        """
+        Images of a collection in the chunk.
+
+        Parameters
+        ----------
+        collection : ImageCollection
+            Collection to split
+
+        Returns
+        -------
+        ImageCollection
+            The images of the chunk
+
+        """
+        if self.start is not None or self.end is not None:
+            collection = collection.filterDate(self.start or "1970-01-01", self.end or "2100-01-01")
+        if self.relativeOrbit is not None:
+            collection = collection.filter(
+                ee.Filter.eq("relativeOrbitNumber_start", self.relativeOrbit)
+            )
+        return collection
+
+
+def date_chunks(start: str, end: str, days: int) -> list[Chunk]:
+    """
+    Split a date range into chunks.
+
+    Parameters
+    ----------
+    start : str
+        First date "YYYY-MM-DD", inclusive
+    end : str
+        Last date "YYYY-MM-DD", exclusive
+    days : int
+        Number of days of each chunk
+
+    Returns
+    -------
+    list[Chunk]
+        Consecutive chunks covering the range
+
+    """
+    if days <= 0:
+        raise ValueError("ERROR!!! days not correctly defined")
+    first, last = datetime.date.fromisoformat(start), datetime.date.fromisoformat(end)
+    chunks = []
+    while first < last:
+        stop = min(first + datetime.timedelta(days=days), last)
+        chunks.append(Chunk(first.isoformat(), stop.isoformat()))
+        first = stop
+    return chunks
+
+
+def orbit_chunks(
+    relativeOrbits: Iterable[int], chunks: Sequence[Chunk] = (Chunk(),)
+) -> list[Chunk]:
+    """
+    Split chunks by relative orbit.
+
+    Parameters
+    ----------
+    relativeOrbits : Iterable[int]
+        Relative orbits, e.g. from ``collection_orbits``
+    chunks : Sequence[Chunk]
+        Chunks to split, e.g. from ``date_chunks``; the whole collection by default
+
+    Returns
+    -------
+    list[Chunk]
+        One chunk per input chunk and relative orbit
+
+    """
+    return [
+        Chunk(chunk.start, chunk.end, int(orbit))
+        for chunk in chunks
+        for orbit in sorted(set(relativeOrbits))
+    ]
+
+
+def collection_orbits(collection: ImageCollection) -> list[int]:
+    """
+    Relative orbits of a collection, with one request.
+
+    Parameters
+    ----------
+    collection : ImageCollection
+        Collection to split
+
+    Returns
+    -------
+    list[int]
+        Sorted relative orbit numbers
+
+    """
+    orbits = tracing.get_info(collection.aggregate_array("relativeOrbitNumber_start").distinct())
+    return sorted(int(orbit) for orbit in orbits)
+
+
+class EETaskService:
+    """
+    Earth Engine batch exports of images.
+
+    Parameters
+    ----------
+    destination : str
+        "ASSET" or "DRIVE"
+    folder : str
+        Asset folder or Drive folder of the exports
+    **export_kwargs : Any
+        Other arguments of ``ee.batch.Export.image.toAsset`` or ``toDrive``,
+        e.g. region, scale, crs and maxPixels
+
+    """
+
+    def __init__(self, destination: str, folder: str, **export_kwargs: Any):
+        if destination not in ["ASSET", "DRIVE"]:
+            raise ValueError("ERROR!!! destination not correctly defined")
+        self.destination = destination
+        self.folder = folder
+        self.export_kwargs = export_kwargs
+
+    def start(self, image: Image, description: str) -> str:
+        """
+        Submit the export of an image.
+
+        Parameters
+        ----------
+        image : Image
+            Image to export
+        description : str
+            Task description, also the asset or file name
+
+        Returns
+        -------
+        str
+            Task id
+
+        """
+        if self.destination == "ASSET":
+            task = ee.batch.Export.image.toAsset(
+                image=image,
+                description=description,
+                assetId=f"{self.folder}/{description}",
+                **self.export_kwargs,
+            )
+        else:
+            task = ee.batch.Export.image.toDrive(
+                image=image,
+                description=description,
+                folder=self.folder,
+                fileNamePrefix=description,
+                **self.export_kwargs,
+            )
+        with tracing.span("ee.export.start", destination=self.destination, description=description):
+            task.start()
+        return task.id
+
+    def status(self, task_ids: Sequence[str]) -> dict[str, dict[str, Any]]:
+        """
+        State of submitted tasks.
+
+        The operations of the project are listed with ``ee.data.listOperations``,
+        one request per page of 500 operations whatever the number of tasks,
+        instead of one request per task.
+
+        Parameters
+        ----------
+        task_ids : Sequence[str]
+            Task ids
+
+        Returns
+        -------
+        dict[str, dict[str, Any]]
+            Status of each task, with its "state" and "error_message". The state
+            is "UNKNOWN" for the tasks that are not listed.
+
+        """
+        with tracing.span("ee.export.status", tasks=len(task_ids)):
+            operations = ee.data.listOperations()
+        statuses = {task_id: {"id": task_id, "state": "UNKNOWN"} for task_id in task_ids}
+        for operation in operations:
+            # operation names are "projects/<project>/operations/<task id>"
+            task_id = operation["name"].rsplit("/", 1)[-1]
+            if task_id not in statuses:
+                continue
+            state = operation.get("metadata", {}).get("state")
+            statuses[task_id]["state"] = OPERATION_STATES.get(state, "UNKNOWN")
+            if operation.get("done") and "error" in operation:
+                statuses[task_id]["error_message"] = operation["error"]["message"]
+        return statuses
+
+
+@dataclass
+class ExportJob:
+    """
+    Export of one chunk.
+
+    Parameters
+    ----------
+    chunk : Chunk
+        The exported chunk
+    state : str
+        "PENDING", "SUBMITTED", "COMPLETED" or "FAILED"
+    task_id : str | None
+        Id of the last submitted task
+    attempts : int
+        Number of submitted tasks
+    next_attempt : float
+        Time before which the chunk is not resubmitted
+    errors : list[str]
+        Error message of each failed attempt
+
+    """
+
+    chunk: Chunk
+    state: str = "PENDING"
+    task_id: str | None = None
+    attempts: int = 0
+    next_attempt: float = 0.0
+    errors: list[str] = field(default_factory=list)
+
+
+class ExportScheduler:
+    """
+    Bounded concurrency exports of the chunks of a collection, with retries.
+
+    Parameters
+    ----------
+    build : Callable[[Chunk], Image]
+        Image exported for a chunk, e.g.
+        ``lambda chunk: chunk.filter(col).toBands()``
+    chunks : Iterable[Chunk]
+        Chunks to export; chunks already in the state file are resumed
+    service : Any
+        Task service with ``start(image, description) -> task id`` and
+        ``status(task_ids) -> {task id: {"state": ..., "error_message": ...}}``
+        methods, such as ``EETaskService``
+    state_path : str | Path | None
+        JSON file of the state of the jobs, None to keep it in memory only
+    max_running : int
+        Maximum number of submitted tasks
+    max_attempts : int
+        Maximum number of attempts of a chunk
+    backoff : float
+        Delay in seconds before the first retry, doubled at each attempt
+    clock : Callable[[], float]
+        Current time in seconds
+
+    """
+
+    def __init__(
+        self,
+        build: Callable[[Chunk], Image],
+        chunks: Iterable[Chunk],
+        service: Any,
+        state_path: str | Path | None = None,
+        max_running: int = 10,
+        max_attempts: int = 5,
+        backoff: float = 60.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        if max_running <= 0:
+            raise ValueError("ERROR!!! max_running not correctly defined")
+        if max_attempts <= 0:
+            raise ValueError("ERROR!!! max_attempts not correctly defined")
+        self.build = build
+        self.service = service
+        self.state_path = None if state_path is None else Path(state_path)
+        self.max_running = max_running
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.clock = clock
+        self.jobs: dict[str, ExportJob] = {}
+        if self.state_path is not None and self.state_path.exists():
+            data = json.loads(self.state_path.read_text())
+            if data.get("version") == STATE_VERSION:
+                for name, job in data["jobs"].items():
+                    job["chunk"] = Chunk(**job["chunk"])
+                    self.jobs[name] = ExportJob(**job)
+        for chunk in chunks:
+            self.jobs.setdefault(chunk.name, ExportJob(chunk))
+
+    def _save(self) -> None:
+        if self.state_path is None:
+            return
+        data = {
+            "version": STATE_VERSION,
+            "jobs": {name: asdict(job) for name, job in self.jobs.items()},
+        }
+        # write then rename, so that an interrupted run never leaves a partial file
+        tmp = self.state_path.with_name(f"{self.state_path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(data, indent=1))
+        tmp.replace(self.state_path)
+
+    def _fail(self, job: ExportJob, error: str, now: float) -> None:
+        job.errors.append(error)
+        if job.attempts >= self.max_attempts:
+            job.state = "FAILED"
+        else:
+            job.state = "PENDING"
+            job.next_attempt = now + self.backoff * 2 ** (job.attempts - 1)
+
+    def step(self) -> int:
+        """
+        Poll the submitted tasks, then submit the pending chunks that are due.
+
+        Returns
+        -------
+        int
+            Number of chunks neither completed nor failed for good
+
+        """
+        now = self.clock()
+        submitted = [job for job in self.jobs.values() if job.state == "SUBMITTED"]
+        if submitted:
+            statuses = self.service.status([job.task_id for job in submitted])
+            for job in submitted:
+                status = statuses.get(job.task_id, {"state": "FAILED"})
+                if status["state"] == "COMPLETED":
+                    job.state = "COMPLETED"
+                elif status["state"] not in ACTIVE_STATES:
+                    # FAILED or CANCELLED, or the task is unknown to the service
+                    error = status.get("error_message") or status["state"]
+                    self._fail(job, error, now)
+
+        running = sum(job.state == "SUBMITTED" for job in self.jobs.values())
+        for job in self.jobs.values():
+            if running >= self.max_running:
+                break
+            if job.state != "PENDING" or job.next_attempt > now:
+                continue
+            job.attempts += 1
+            try:
+                with tracing.span("export.build", chunk=job.chunk.name):
+                    image = self.build(job.chunk)
+                job.task_id = self.service.start(image, job.chunk.name)
+            except ee.EEException as error:
+                # e.g. too many tasks in the queue
+                self._fail(job, str(error), now)
+                continue
+            job.state = "SUBMITTED"
+            running += 1
+            # saved at once: a task started on the server must keep its id if the run stops
+            self._save()
+        self._save()
+        return sum(job.state in ["PENDING", "SUBMITTED"] for job in self.jobs.values())
+
+    def run(
+        self, poll_interval: float = 30.0, sleep: Callable[[float], Any] = time.sleep
+    ) -> dict[str, int]:
+        """
+        Step until every chunk is completed or failed for good.
+
+        Parameters
+        ----------
+        poll_interval : float
+            Delay in seconds between the steps
+        sleep : Callable[[float], Any]
+            Waits for a delay in seconds
+
+        Returns
+        -------
+        dict[str, int]
+            Number of jobs in each state, see ``summary``
+
+        """
+        while self.step():
+            sleep(poll_interval)
+        return self.summary()
+
+    def summary(self) -> dict[str, int]:
+        """
+        Number of jobs in each state.
+
+        Returns
+        -------
+        dict[str, int]
+            Count of the "PENDING", "SUBMITTED", "COMPLETED" and "FAILED" jobs
+
+        """
+        states = ["PENDING", "SUBMITTED", "COMPLETED", "FAILED"]
+        return {state: sum(job.state == state for job in self.jobs.values()) for state in states}
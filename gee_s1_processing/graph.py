@@ -0,0 +1,155 @@
+"""
+Description: Shared subexpressions and folded constants of the expression graphs.
+
+The per-image functions of the package rebuild the same subexpressions, e.g.
+the band names without "angle" and their "_mean" / "_variance" names, in every
+filter and step they call. Within a ``scope``, the builders decorated with
+``memoize`` return the object built by their first call for the same
+arguments, so each subexpression is built once per pipeline. Identical nodes
+are also merged by the serializer, the scope saves the client side build.
+
+Constants are folded on the client: the filters combine Python numbers before
+they enter the graph (e.g. ``1 + eta**2`` instead of
+``ee.Image.constant(1).add(eta.pow(2))``), with the helpers of this module.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import functools
+import math
+from typing import TYPE_CHECKING, Any
+
+import ee
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Generator
+
+    from ee.ee_list import List
+    from ee.image import Image
+
+DEG2RAD = math.pi / 180
+HALF_PI = math.pi / 2
+
+_MEMO: contextvars.ContextVar[dict | None] = contextvars.ContextVar("memo", default=None)
+
+
+@contextlib.contextmanager
+def scope() -> Generator[dict, None, None]:
+    """
+    Share the subexpressions built by the ``memoize`` builders within a block.
+
+    A scope opened inside another one shares its subexpressions.
+
+    Yields
+    ------
+    dict
+        The memoized subexpressions
+
+    """
+    memo = _MEMO.get()
+    if memo is not None:
+        yield memo
+        return
+    memo = {}
+    token = _MEMO.set(memo)
+    try:
+        yield memo
+    finally:
+        _MEMO.reset(token)
+
+
+def memoize(function: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Memoize a graph builder on the identity of its arguments, within a ``scope``.
+
+    Outside a scope the builder is called every time.
+
+    Parameters
+    ----------
+    function : Callable[..., Any]
+        Builder with positional arguments
+
+    Returns
+    -------
+    Callable[..., Any]
+        The memoized builder
+
+    """
+
+    @functools.wraps(function)
+    def wrapper(*args: Any) -> Any:
+        memo = _MEMO.get()
+        if memo is None:
+            return function(*args)
+        # ee objects compare by structure, which walks the graph: use their identity
+        key = (
+            function.__name__,
+            *(arg if isinstance(arg, int | float | str) else id(arg) for arg in args),
+        )
+        if key not in memo:
+            # the arguments are kept alive, so that their ids are not reused
+            memo[key] = (args, function(*args))
+        return memo[key][1]
+
+    return wrapper
+
+
+@memoize
+def constant(value: float) -> Image:
+    """
+    Constant image of a folded value.
+
+    Parameters
+    ----------
+    value : float
+        The value, computed on the client
+
+    Returns
+    -------
+    Image
+        ``ee.Image.constant(value)``
+
+    """
+    return ee.Image.constant(value)
+
+
+@memoize
+def filter_bands(image: Image) -> List:
+    """
+    Bands of an image the filters apply to.
+
+    Parameters
+    ----------
+    image : Image
+        S1 image
+
+    Returns
+    -------
+    List
+        Band names without "angle"
+
+    """
+    return image.bandNames().remove("angle")
+
+
+@memoize
+def suffixed(bandNames: List, suffix: str) -> List:
+    """
+    Band names with a suffix, e.g. the outputs of a reducer.
+
+    Parameters
+    ----------
+    bandNames : List
+        Band names
+    suffix : str
+        Suffix, e.g. "_mean"
+
+    Returns
+    -------
+    List
+        The suffixed band names
+
+    """
+    return bandNames.map(lambda bandName: ee.String(bandName).cat(suffix))
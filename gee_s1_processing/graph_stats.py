@@ -0,0 +1,310 @@
+"""
+Description: Size and complexity of the Earth Engine expression graphs built by the
+processing chain.
+
+The serialized graph drives the client build time and the server side memory
+and "too many concurrent aggregations" errors. ``graph_stats`` reports its node
+count, depth, byte size and the number of the costly ``reduceNeighborhood`` /
+``reduceRegion`` / ``map`` invocations. ``benchmark_matrix`` records these
+numbers for every filter, framework and kernel size, for both terrain
+flattening models and for the full ARD chain, mapped step by step or fused.
+With ``initialize_offline`` the graphs are built without network access or
+credentials, as nothing is sent to the server.
+"""
+
+from __future__ import annotations
+
+import json
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING, Any
+
+import ee
+
+from . import border_noise_correction as bnc
+from . import helper, pipeline
+from . import speckle_filter as sf
+from . import terrain_flattening as trf
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from ee.computedobject import ComputedObject
+    from ee.imagecollection import ImageCollection
+
+SPECKLE_FILTERS = ["BOXCAR", "LEE", "GAMMA MAP", "REFINED LEE", "LEE SIGMA"]
+KERNEL_SIZES = [3, 7, 15]
+TERRAIN_FLATTENING_MODELS = ["DIRECT", "VOLUME"]
+
+
+def initialize_offline(project: str = "offline") -> None:
+    """
+    Initialize the Earth Engine client without network access.
+
+    The algorithm signatures shipped with the earthengine-api test suite replace
+    the ones fetched from the server, which is enough to build and serialize
+    expression graphs. Any request to the server (getInfo, exports...) fails.
+    It relies on private parts of earthengine-api, the ``dev`` extra pins the
+    releases it is tested with.
+
+    Parameters
+    ----------
+    project : str
+        Placeholder cloud project name
+
+    """
+    from ee import apitestcase
+
+    ee.data._install_cloud_api_resource = lambda: None
+    ee.data.getAlgorithms = apitestcase.GetAlgorithms
+    ee.Initialize(None, "", project=project)
+
+
+@dataclass
+class GraphStats:
+    """Size and complexity of a serialized expression graph."""
+
+    nodes: int
+    depth: int
+    bytes: int
+    reduce_neighborhood: int
+    reduce_region: int
+    map: int
+    functions: dict[str, int] = field(default_factory=dict)
+
+    def summary(self) -> dict[str, int]:
+        """Statistics without the per function counts."""
+        stats = asdict(self)
+        del stats["functions"]
+        return stats
+
+
+def graph_stats(obj: ComputedObject) -> GraphStats:
+    """
+    Serialize an Earth Engine object and measure its expression graph.
+
+    Nodes shared by several parts of the graph (``valueReference``) are counted
+    once; the depth is the longest chain of nested values from the result.
+
+    Parameters
+    ----------
+    obj : ComputedObject
+        Image, collection or any computed object
+
+    Returns
+    -------
+    GraphStats
+        Statistics of the serialized graph
+
+    """
+    serialized = obj.serialize()
+    graph = json.loads(serialized)
+    values = graph["values"]
+    functions: Counter[str] = Counter()
+    depths: dict[str, int] = {}
+    nodes = 0
+
+    def reference_depth(name: str) -> int:
+        if name not in depths:
+            # shared node, visited once
+            depths[name] = visit(values[name])
+        return depths[name]
+
+    def visit(value: Any) -> int:
+        nonlocal nodes
+        nodes += 1
+        if "valueReference" in value:
+            nodes -= 1
+            return reference_depth(value["valueReference"])
+        if "functionInvocationValue" in value:
+            invocation = value["functionInvocationValue"]
+            functions[invocation.get("functionName", "<function reference>")] += 1
+            depth = children_depth(invocation["arguments"].values())
+            if "functionReference" in invocation:
+                depth = max(depth, reference_depth(invocation["functionReference"]))
+            return 1 + depth
+        if "functionDefinitionValue" in value:
+            return 1 + reference_depth(value["functionDefinitionValue"]["body"])
+        if "arrayValue" in value:
+            return 1 + children_depth(value["arrayValue"]["values"])
+        if "dictionaryValue" in value:
+            return 1 + children_depth(value["dictionaryValue"]["values"].values())
+        return 1
+
+    def children_depth(children: Iterable[Any]) -> int:
+        return max((visit(child) for child in children), default=0)
+
+    depth = reference_depth(graph["result"])
+    return GraphStats(
+        nodes=nodes,
+        depth=depth,
+        bytes=len(serialized.encode()),
+        reduce_neighborhood=functions["Image.reduceNeighborhood"],
+        reduce_region=functions["Image.reduceRegion"] + functions["Image.reduceRegions"],
+        map=functions["Collection.map"],
+        functions=dict(sorted(functions.items())),
+    )
+
+
+def default_collection() -> ImageCollection:
+    """S1 collection of the test suite, over Paris in 2022."""
+    return (
+        ee.ImageCollection("COPERNICUS/S1_GRD_FLOAT")
+        .filterBounds(ee.Geometry.Point([2.3522, 48.8566]))
+        .filterDate("2022-01-01", "2022-12-31")
+        .filter(ee.Filter.eq("instrumentMode", "IW"))
+    )
+
+
+def speckle_filter_graph(
+    col: ImageCollection,
+    speckle_filter_framework: str,
+    speckle_filter: str,
+    speckle_filter_kernel_size: int,
+    speckle_filter_nr_of_images: int = 10,
+) -> ImageCollection:
+    """
+    Expression built by ``wrapper.speckle_filter_wrapper``, without its band check.
+
+    Parameters
+    ----------
+    col : ImageCollection
+        Collection to filter
+    speckle_filter_framework : str
+    speckle_filter : str
+    speckle_filter_kernel_size : int
+    speckle_filter_nr_of_images : int
+
+    Returns
+    -------
+    ImageCollection
+        Filtered collection
+
+    """
+    if speckle_filter_framework == "MONO":
+        return sf.MonoTemporal_Filter(col, speckle_filter_kernel_size, speckle_filter)
+    return sf.MultiTemporal_Filter(
+        col, speckle_filter_kernel_size, speckle_filter, speckle_filter_nr_of_images
+    )
+
+
+def terrain_normalization_graph(
+    col: ImageCollection,
+    terrain_flattening_model: str,
+    terrain_flattening_additional_layover_shadow_buffer: int = 3,
+    dem: str = "USGS/SRTMGL1_003",
+    terrain_geometry: str | None = None,
+    heading: str = "ANGLE",
+) -> ImageCollection:
+    """
+    Expression built by ``wrapper.terrain_normalization_wrapper``.
+
+    Parameters
+    ----------
+    col : ImageCollection
+        Collection to normalize
+    terrain_flattening_model : str
+    terrain_flattening_additional_layover_shadow_buffer : int
+    dem : str
+    terrain_geometry : str | None
+        None, or "ORBIT" for the terrain geometry shared by the relative orbits
+    heading : str
+        "ANGLE" or "METADATA", the look direction estimate
+
+    Returns
+    -------
+    ImageCollection
+        Normalized collection
+
+    """
+    geometry = None
+    if terrain_geometry == "ORBIT":
+        geometry = trf.orbit_terrain_geometry(col, ee.Image(dem))
+    return trf.slope_correction(
+        col,
+        terrain_flattening_model,
+        ee.Image(dem),
+        terrain_flattening_additional_layover_shadow_buffer,
+        geometry,
+        heading,
+    )
+
+
+def ard_graph(
+    col: ImageCollection,
+    speckle_filter_framework: str,
+    fused: bool,
+    dem: str = "USGS/SRTMGL1_003",
+) -> ImageCollection:
+    """
+    Border noise correction, boxcar filter, volume model and dB conversion.
+
+    Parameters
+    ----------
+    col : ImageCollection
+        Collection to process
+    speckle_filter_framework : str
+    fused : bool
+        Whether the steps are fused by ``pipeline.ard_pipeline`` or mapped one
+        after the other, as by the wrappers
+    dem : str
+
+    Returns
+    -------
+    ImageCollection
+        Processed collection in dB
+
+    """
+    if fused:
+        return pipeline.ard_pipeline(
+            col, SPECKLE_FILTER_FRAMEWORK=speckle_filter_framework, DEM=ee.Image(dem), FORMAT="DB"
+        )
+    col = col.map(bnc.f_mask_edges)
+    col = speckle_filter_graph(col, speckle_filter_framework, "BOXCAR", 3)
+    col = terrain_normalization_graph(col, "VOLUME", dem=dem)
+    return col.map(helper.lin_to_db)
+
+
+def benchmark_matrix(col: ImageCollection | None = None) -> dict[str, dict[str, int]]:
+    """
+    Graph statistics of every wrapper configuration.
+
+    Parameters
+    ----------
+    col : ImageCollection | None
+        Input collection, defaults to ``default_collection()``
+
+    Returns
+    -------
+    dict[str, dict[str, int]]
+        Statistics keyed by "<FRAMEWORK>/<FILTER>/<KERNEL_SIZE>" for the speckle
+        filters, "TERRAIN/<MODEL>" for the terrain flattening and
+        "TERRAIN/<MODEL>/ORBIT" with the terrain geometry shared per orbit,
+        "TERRAIN/<MODEL>/METADATA" with the heading from the scene metadata, and
+        "ARD/<FRAMEWORK>/SEQUENTIAL" and "ARD/<FRAMEWORK>/FUSED" for ``ard_graph``
+
+    """
+    col = default_collection() if col is None else col
+    matrix = {}
+    for framework in ["MONO", "MULTI"]:
+        for speckle_filter in SPECKLE_FILTERS:
+            for kernel_size in KERNEL_SIZES:
+                graph = speckle_filter_graph(col, framework, speckle_filter, kernel_size)
+                key = f"{framework}/{speckle_filter}/{kernel_size}"
+                matrix[key] = graph_stats(graph).summary()
+    for model in TERRAIN_FLATTENING_MODELS:
+        matrix[f"TERRAIN/{model}"] = graph_stats(terrain_normalization_graph(col, model)).summary()
+        graph = terrain_normalization_graph(col, model, terrain_geometry="ORBIT")
+        matrix[f"TERRAIN/{model}/ORBIT"] = graph_stats(graph).summary()
+        graph = terrain_normalization_graph(col, model, heading="METADATA")
+        matrix[f"TERRAIN/{model}/METADATA"] = graph_stats(graph).summary()
+    for framework in ["MONO", "MULTI"]:
+        for name, fused in [("SEQUENTIAL", False), ("FUSED", True)]:
+            graph = ard_graph(col, framework, fused)
+            matrix[f"ARD/{framework}/{name}"] = graph_stats(graph).summary()
+    return matrix
+
+
+if __name__ == "__main__":
+    initialize_offline()
+    print(json.dumps(benchmark_matrix(), indent=1))  # noqa: T201
@@ -0,0 +1,235 @@
+"""
+Description: Look direction (heading) of the Sentinel-1 scenes used by the
+radiometric terrain normalization.
+
+``angle_heading`` is the original estimate: the mean aspect of the incidence
+angle band over the footprint, one ``reduceRegion`` per scene. As the incidence
+angle increases away from the (right looking) satellite, this aspect points
+from far to near range, i.e. 90 degrees left of the ground track.
+``metadata_heading`` derives the same direction from the scene metadata: the
+ground track azimuth of the sun-synchronous orbit at the latitude of the
+footprint centre, for the ascending or descending pass. Scenes without the pass
+property fall back to a value computed once per relative orbit
+(``orbit_headings``). ``heading_consistency`` compares both estimates on a
+sample of scenes.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import TYPE_CHECKING, Any
+
+import ee
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+    from ee.computedobject import ComputedObject
+    from ee.dictionary import Dictionary
+    from ee.ee_number import Number
+    from ee.feature import Feature
+    from ee.featurecollection import FeatureCollection
+    from ee.image import Image
+    from ee.imagecollection import ImageCollection
+
+# Sentinel-1 sun-synchronous orbit
+INCLINATION = 98.18
+# speed of the sub-satellite point and of the Earth surface at the equator, km/s
+GROUND_TRACK_SPEED = 6.77
+EARTH_ROTATION_SPEED = 0.465
+
+
+def look_heading(latitude: float, ascending: bool) -> float:
+    """
+    Heading of a scene from its orbit, evaluated on the client.
+
+    Parameters
+    ----------
+    latitude : float
+        Latitude of the scene centre in degrees
+    ascending : bool
+        Whether the pass is ascending
+
+    Returns
+    -------
+    float
+        Ground track azimuth minus 90 degrees, in (-180, 180]
+
+    """
+    phi = math.radians(latitude)
+    # track azimuth in the inertial frame, clockwise from north. The ground track
+    # turns at |latitude| = 180 - INCLINATION (81.82): scenes beyond it are
+    # given the heading of the turning point, an east-west track
+    sin_azimuth = max(-1.0, min(1.0, math.cos(math.radians(INCLINATION)) / math.cos(phi)))
+    north = GROUND_TRACK_SPEED * math.sqrt(1 - sin_azimuth**2)
+    north = north if ascending else -north
+    # the Earth rotates eastwards under the satellite
+    east = GROUND_TRACK_SPEED * sin_azimuth - EARTH_ROTATION_SPEED * math.cos(phi)
+    heading = math.degrees(math.atan2(east, north)) - 90
+    return heading + 360 if heading <= -180 else heading
+
+
+def angle_heading(image: Image) -> ComputedObject:
+    """
+    Heading of a scene from the aspect of its incidence angle band.
+
+    Parameters
+    ----------
+    image : Image
+        S1 scene with an "angle" band
+
+    Returns
+    -------
+    ComputedObject
+        Mean aspect over the footprint in (-180, 180], 0 if it is null
+
+    """
+    # calculate the look direction
+    heading = ee.Terrain.aspect(image.select("angle")).reduceRegion(
+        ee.Reducer.mean(), image.geometry(), 1000
+    )
+
+    # in case of null values for heading replace with 0
+    heading = ee.Dictionary(heading).combine({"aspect": 0}, False).get("aspect")
+
+    return ee.Algorithms.If(
+        ee.Number(heading).gt(180), ee.Number(heading).subtract(360), ee.Number(heading)
+    )
+
+
+def orbit_headings(collection: ImageCollection) -> Dictionary:
+    """
+    Heading of each relative orbit, from the incidence angle of one of its scenes.
+
+    Parameters
+    ----------
+    collection : ImageCollection
+        S1 scenes
+
+    Returns
+    -------
+    Dictionary
+        ``angle_heading`` of the first scene of each relative orbit, keyed by
+        the orbit number. It is computed once and shared by the scenes
+
+    """
+    orbits = ee.List(collection.aggregate_array("relativeOrbitNumber_start")).distinct()
+
+    def _heading(orbit: Number) -> ComputedObject:
+        scenes = collection.filter(ee.Filter.eq("relativeOrbitNumber_start", orbit))
+        return angle_heading(ee.Image(scenes.first()))
+
+    return ee.Dictionary.fromLists(
+        orbits.map(lambda orbit: ee.Number(orbit).format("%d")), orbits.map(_heading)
+    )
+
+
+def metadata_heading(image: Image, fallback: Dictionary | None = None) -> ComputedObject:
+    """
+    Heading of a scene from its orbit pass and the latitude of its footprint.
+
+    Parameters
+    ----------
+    image : Image
+        S1 scene
+    fallback : Dictionary | None
+        Headings keyed by relative orbit (see ``orbit_headings``) for the scenes
+        without "orbitProperties_pass"; ``angle_heading`` of the scene is used
+        if None
+
+    Returns
+    -------
+    ComputedObject
+        Ground track azimuth minus 90 degrees, in (-180, 180]
+
+    """
+    phi = ee.Number(image.geometry().centroid(1000).coordinates().get(1)).multiply(math.pi / 180)
+    # clamped beyond the turning latitude of the ground track, see look_heading
+    sin_azimuth = ee.Number(math.cos(math.radians(INCLINATION))).divide(phi.cos()).max(-1).min(1)
+    north = ee.Number(1).subtract(sin_azimuth.pow(2)).sqrt().multiply(GROUND_TRACK_SPEED)
+    ascending = ee.String(image.get("orbitProperties_pass")).equals("ASCENDING")
+    north = ee.Number(ee.Algorithms.If(ascending, north, north.multiply(-1)))
+    east = sin_azimuth.multiply(GROUND_TRACK_SPEED).subtract(
+        phi.cos().multiply(EARTH_ROTATION_SPEED)
+    )
+    heading = east.atan2(north).multiply(180 / math.pi).subtract(90)
+    heading = ee.Algorithms.If(heading.lte(-180), heading.add(360), heading)
+
+    if fallback is None:
+        missing = angle_heading(image)
+    else:
+        missing = fallback.get(ee.Number(image.get("relativeOrbitNumber_start")).format("%d"))
+    return ee.Algorithms.If(
+        image.propertyNames().contains("orbitProperties_pass"), heading, missing
+    )
+
+
+def heading_consistency(collection: ImageCollection, sample_size: int = 20) -> FeatureCollection:
+    """
+    Compare ``metadata_heading`` with ``angle_heading`` on a sample of scenes.
+
+    Parameters
+    ----------
+    collection : ImageCollection
+        S1 scenes
+    sample_size : int
+        Number of scenes compared
+
+    Returns
+    -------
+    FeatureCollection
+        One feature per scene with the "metadata_heading", "angle_heading" and
+        their "difference" in degrees, see ``consistency_summary``
+
+    """
+
+    def _compare(image: Image) -> Feature:
+        metadata = ee.Number(metadata_heading(image))
+        angle = ee.Number(angle_heading(image))
+        difference = metadata.subtract(angle).add(540).mod(360).subtract(180)
+        return ee.Feature(
+            None,
+            {
+                "system:index": image.get("system:index"),
+                "relativeOrbitNumber_start": image.get("relativeOrbitNumber_start"),
+                "orbitProperties_pass": image.get("orbitProperties_pass"),
+                "metadata_heading": metadata,
+                "angle_heading": angle,
+                "difference": difference,
+            },
+        )
+
+    scenes = collection.randomColumn("heading_sample", 0).limit(sample_size, "heading_sample")
+    return ee.FeatureCollection(scenes.map(_compare))
+
+
+def consistency_summary(report: dict | Sequence[dict]) -> dict[str, Any]:
+    """
+    Statistics of a heading consistency report.
+
+    Parameters
+    ----------
+    report : dict | Sequence[dict]
+        ``heading_consistency(...).getInfo()`` or its features
+
+    Returns
+    -------
+    dict[str, Any]
+        Number of scenes, mean and maximum absolute difference in degrees, and
+        the mean difference of each relative orbit
+
+    """
+    features = report["features"] if isinstance(report, dict) else report
+    properties = [feature["properties"] for feature in features]
+    differences = [p["difference"] for p in properties]
+    orbits: dict[int, list[float]] = {}
+    for p in properties:
+        orbits.setdefault(p["relativeOrbitNumber_start"], []).append(p["difference"])
+    return {
+        "scenes": len(differences),
+        "mean_abs_difference": sum(map(abs, differences)) / max(len(differences), 1),
+        "max_abs_difference": max(map(abs, differences), default=0.0),
+        "orbit_mean_difference": {
+            orbit: sum(values) / len(values) for orbit, values in sorted(orbits.items())
+        },
+    }
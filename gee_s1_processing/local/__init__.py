@@ -0,0 +1,29 @@
+"""NumPy backend running the S1 processing chain on in-memory arrays."""
+
+from . import (
+    ee_numpy,
+    multitemporal,
+    neighborhood,
+    percentile,
+    pipeline,
+    scratch,
+    speckle_filter,
+    stack,
+    terrain,
+    terrain_flattening,
+    tiling,
+)
+
+__all__ = [
+    "ee_numpy",
+    "multitemporal",
+    "neighborhood",
+    "percentile",
+    "pipeline",
+    "scratch",
+    "speckle_filter",
+    "stack",
+    "terrain",
+    "terrain_flattening",
+    "tiling",
+]
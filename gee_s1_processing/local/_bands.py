@@ -0,0 +1,110 @@
+"""Band layout helpers shared by the local filters."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+
+def as_stack(image: np.ndarray) -> tuple[np.ndarray, bool]:
+    """
+    View a 2-D or (bands, rows, cols) array as a band stack.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Single band or multi band image
+
+    Returns
+    -------
+    tuple[np.ndarray, bool]
+        The (bands, rows, cols) view and whether the input was 2-D
+
+    """
+    image = np.asarray(image)
+    if image.ndim == 2:
+        return image[np.newaxis], True
+    if image.ndim == 3:
+        return image, False
+    raise ValueError("ERROR!!! image must be a 2-D or (bands, rows, cols) array")
+
+
+def filter_bands(bandNames: Sequence[str] | None, nbands: int) -> list[int]:
+    """
+    Indices of the bands a speckle filter applies to, i.e. all but "angle".
+
+    Parameters
+    ----------
+    bandNames : Sequence[str] | None
+        Names of the bands of the image, None if the image has no angle band
+    nbands : int
+        Number of bands of the image
+
+    Returns
+    -------
+    list[int]
+        Indices of the bands to filter
+
+    """
+    if bandNames is None:
+        return list(range(nbands))
+    if len(bandNames) != nbands:
+        raise ValueError("ERROR!!! bandNames does not match the number of bands of the image")
+    return [i for i, name in enumerate(bandNames) if name != "angle"]
+
+
+def output_like(image: np.ndarray, dtype: np.dtype | type | None = None) -> np.ndarray:
+    """
+    Floating point copy of an image the filtered bands are written into.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        (bands, rows, cols) image
+    dtype : np.dtype | type | None
+        Floating point type of the copy, the type of the image if None
+
+    Returns
+    -------
+    np.ndarray
+        Copy of the image, promoted to floating point if needed
+
+    """
+    if dtype is None:
+        dtype = image.dtype if np.issubdtype(image.dtype, np.floating) else np.float64
+    return np.array(image, dtype=dtype, copy=True)
+
+
+def output_into(
+    image: np.ndarray, out: np.ndarray | None, dtype: np.dtype | type | None = None
+) -> np.ndarray:
+    """
+    Array the filtered bands of an image are written into.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        (bands, rows, cols) image
+    out : np.ndarray | None
+        (bands, rows, cols) floating point array of the shape of the image, the
+        image itself to work in place; a copy of the image if None
+    dtype : np.dtype | type | None
+        Floating point type of the copy, see ``output_like``; unused with ``out``
+
+    Returns
+    -------
+    np.ndarray
+        ``out``, holding the image, or ``output_like(image)``
+
+    """
+    if out is None:
+        return output_like(image, dtype)
+    if out.shape != image.shape or not np.issubdtype(out.dtype, np.floating):
+        raise ValueError("ERROR!!! out must be a floating point array of the shape of the image")
+    if not np.shares_memory(out, image):
+        out[...] = image
+    return out
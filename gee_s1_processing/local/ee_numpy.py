@@ -0,0 +1,1115 @@
+"""
+Description: NumPy stand-in for the subset of the Earth Engine API used by the
+processing chain.
+
+``use_local_backend`` swaps the ``ee`` module of ``helper``, ``heading``,
+``speckle_filter``, ``terrain_flattening`` and ``wrapper`` for this module, so
+that their functions run unchanged on local rasters::
+
+    with use_local_backend(assets={"USGS/SRTMGL1_003": dem}):
+        image = from_numpy(stack, ["VV", "VH", "angle"])
+        filtered = to_numpy(speckle_filter.leefilter(image, 7))
+
+Images are evaluated lazily: every operation records a thunk, and the arrays
+of an image are computed once, when ``to_numpy`` or a client side value (e.g.
+``reduceRegion``) needs them. All bands share the grid of the input rasters;
+masked pixels are NaN, so non-finite results, such as divisions by zero, are
+masked as in Earth Engine. Geometries, projections and scales are accepted and
+ignored: everything is computed on the input grid, region reductions use every
+pixel and percentiles are exact rather than histogram based. Kernel weights are
+used as a footprint, except in ``convolve``. ``MultiTemporal_Filter`` queries
+the archive and is not covered, see ``local.multitemporal`` instead.
+"""
+
+from __future__ import annotations
+
+import ast
+import importlib
+import re
+import warnings
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from . import terrain
+from ._bands import as_stack
+from .neighborhood import kernel_segments, kernel_stats, row_cumsums
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Generator, Sequence
+
+# modules of the package whose ``ee`` is swapped by use_local_backend
+_MODULES = ["graph", "helper", "heading", "speckle_filter", "terrain_flattening", "wrapper"]
+_STATE: dict[str, Any] = {"assets": {}, "pixel_size": 10.0}
+
+
+# ---------------------------------------------------------------------------//
+# Client side values
+# ---------------------------------------------------------------------------//
+
+
+class Number(float):
+    """``ee.Number``, evaluated on the client."""
+
+    def add(self, other: float) -> Number:
+        return Number(self + other)
+
+    def subtract(self, other: float) -> Number:
+        return Number(self - other)
+
+    def multiply(self, other: float) -> Number:
+        return Number(self * other)
+
+    def divide(self, other: float) -> Number:
+        return Number(self / other)
+
+    def pow(self, other: float) -> Number:
+        return Number(float(self) ** other)
+
+    def abs(self) -> Number:
+        return Number(abs(float(self)))
+
+    def gt(self, other: float) -> Number:
+        return Number(self > other)
+
+    def gte(self, other: float) -> Number:
+        return Number(self >= other)
+
+    def lt(self, other: float) -> Number:
+        return Number(self < other)
+
+    def lte(self, other: float) -> Number:
+        return Number(self <= other)
+
+    def eq(self, other: float) -> Number:
+        return Number(self == other)
+
+    def getInfo(self) -> float:
+        return float(self)
+
+
+class String(str):
+    """``ee.String``, evaluated on the client."""
+
+    __slots__ = ()
+
+    def cat(self, string2: str) -> String:
+        return String(self + string2)
+
+    def getInfo(self) -> str:
+        return str(self)
+
+
+class List(list):
+    """``ee.List``, evaluated on the client."""
+
+    @staticmethod
+    def repeat(value: Any, count: int) -> List:
+        return List([value] * int(count))
+
+    def remove(self, element: Any) -> List:
+        output = List(self)
+        if element in output:
+            list.remove(output, element)
+        return output
+
+    def cat(self, other: Sequence) -> List:
+        return List([*self, *other])
+
+    def map(self, baseAlgorithm: Callable) -> List:
+        return List(baseAlgorithm(value) for value in self)
+
+    def get(self, index: int) -> Any:
+        return self[int(index)]
+
+    def size(self) -> Number:
+        return Number(len(self))
+
+    def slice(self, start: int, end: int | None = None) -> List:
+        return List(self[int(start) : None if end is None else int(end)])
+
+    def flatten(self) -> List:
+        output = List()
+        for value in self:
+            output += List(value).flatten() if isinstance(value, list) else [value]
+        return output
+
+    def contains(self, element: Any) -> bool:
+        return element in self
+
+    def removeAll(self, other: Sequence) -> List:
+        return List(value for value in self if value not in other)
+
+    def getInfo(self) -> list:
+        return list(self)
+
+
+class Dictionary(dict):
+    """``ee.Dictionary`` with string keys, evaluated on the client."""
+
+    def __init__(self, d: dict | None = None):
+        super().__init__({str(key): value for key, value in (d or {}).items()})
+
+    def get(self, key: str, defaultValue: Any = None) -> Any:
+        if defaultValue is None and str(key) not in self:
+            # as in Earth Engine, the error is only raised if the value is used
+            return _Error(f"Dictionary does not contain key: {key}")
+        return super().get(str(key), defaultValue)
+
+    def contains(self, key: str) -> bool:
+        return str(key) in self
+
+    def combine(self, second: dict, overwrite: bool = True) -> Dictionary:
+        output = Dictionary(self)
+        for key, value in Dictionary(second).items():
+            # null values, e.g. the mean of an empty region, are replaced as well
+            if overwrite or dict.get(output, key) is None:
+                output[key] = value
+        return output
+
+    def toImage(self, names: Sequence[str] | None = None) -> Image:
+        # as in Earth Engine, the bands are sorted by name by default
+        names = sorted(self) if names is None else [str(name) for name in names]
+        return Image.constant([self[name] for name in names]).rename(names)
+
+    def getInfo(self) -> dict:
+        return dict(self)
+
+
+@dataclass(frozen=True)
+class _Error:
+    """Failed computation, raised when an image or a collection is made from it."""
+
+    message: str
+
+
+class Algorithms:
+    """``ee.Algorithms``."""
+
+    @staticmethod
+    def If(condition: Any, trueCase: Any = None, falseCase: Any = None) -> Any:
+        return trueCase if condition else falseCase
+
+
+class Geometry:
+    """Placeholder footprint: images cover the whole input grid."""
+
+
+class Projection:
+    """Placeholder projection: images share the input grid."""
+
+
+# ---------------------------------------------------------------------------//
+# Kernels and reducers
+# ---------------------------------------------------------------------------//
+
+
+class Kernel:
+    """
+    ``ee.Kernel`` in pixel units.
+
+    Parameters
+    ----------
+    weights : np.ndarray
+        2-D weights
+    x : int | None
+        Column of the focus, defaults to the middle column
+    y : int | None
+        Row of the focus, defaults to the middle row
+    normalize : bool
+        Whether ``convolve`` normalizes the weights to sum to 1
+
+    """
+
+    def __init__(
+        self,
+        weights: np.ndarray,
+        x: int | None = None,
+        y: int | None = None,
+        normalize: bool = False,
+    ):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        height, width = self.weights.shape
+        self.x = width // 2 if x is None or x < 0 else int(x)
+        self.y = height // 2 if y is None or y < 0 else int(y)
+        self.normalize = normalize
+
+    @staticmethod
+    def square(
+        radius: float, units: str = "pixels", normalize: bool = True, magnitude: float = 1.0
+    ) -> Kernel:
+        if units != "pixels":
+            raise ValueError("ERROR!!! only kernels in pixels are supported locally")
+        size = 2 * int(radius) + 1
+        return Kernel(np.full((size, size), float(magnitude)), normalize=normalize)
+
+    @staticmethod
+    def fixed(
+        width: int,
+        height: int,
+        weights: Sequence[Sequence[float]],
+        x: int = -1,
+        y: int = -1,
+        normalize: bool = False,
+    ) -> Kernel:
+        weights = np.asarray(weights, dtype=np.float64).reshape(int(height), int(width))
+        return Kernel(weights, x, y, normalize)
+
+    def rotate(self, rotations: int) -> Kernel:
+        # clockwise quarter turns, the focus turns with the weights
+        kernel = self
+        for _ in range(int(rotations) % 4):
+            height = kernel.weights.shape[0]
+            kernel = Kernel(
+                np.rot90(kernel.weights, -1), height - 1 - kernel.y, kernel.x, kernel.normalize
+            )
+        return kernel
+
+    def offsets(self) -> list[tuple[int, int, float]]:
+        """(dy, dx, weight) of the non-zero weights, in row major order."""
+        return [
+            (r - self.y, c - self.x, float(w))
+            for (r, c), w in np.ndenumerate(self.weights)
+            if w != 0
+        ]
+
+
+def _count_distinct(values: np.ndarray, axis: int) -> np.ndarray:
+    ordered = np.sort(values, axis=axis)
+    valid = np.isfinite(ordered)
+    changes = (np.diff(ordered, axis=axis) != 0) & np.take(
+        valid, range(1, ordered.shape[axis]), axis
+    )
+    return changes.sum(axis=axis) + valid.any(axis=axis)
+
+
+_STATISTICS: dict[str, Callable[..., np.ndarray]] = {
+    "mean": lambda v, axis: np.nanmean(v, axis=axis),
+    "variance": lambda v, axis: np.nanvar(v, axis=axis),
+    "stdDev": lambda v, axis: np.nanstd(v, axis=axis),
+    "sum": lambda v, axis: np.nansum(v, axis=axis),
+    "max": lambda v, axis: np.nanmax(v, axis=axis),
+    "min": lambda v, axis: np.nanmin(v, axis=axis),
+    "median": lambda v, axis: np.nanmedian(v, axis=axis),
+    "count": lambda v, axis: np.isfinite(v).sum(axis=axis),
+    "countDistinctNonNull": _count_distinct,
+}
+# reducers whose output is defined without any valid input
+_COUNTS = ["count", "countDistinctNonNull"]
+
+
+class Reducer:
+    """
+    ``ee.Reducer``: a list of (output name, statistic, percentile) outputs.
+
+    Parameters
+    ----------
+    outputs : list[tuple[str, str, float | None]]
+        Outputs of the reducer
+
+    """
+
+    def __init__(self, outputs: list[tuple[str, str, float | None]]):
+        self.outputs = outputs
+
+    @staticmethod
+    def mean() -> Reducer:
+        return Reducer([("mean", "mean", None)])
+
+    @staticmethod
+    def variance() -> Reducer:
+        return Reducer([("variance", "variance", None)])
+
+    @staticmethod
+    def stdDev() -> Reducer:
+        return Reducer([("stdDev", "stdDev", None)])
+
+    @staticmethod
+    def sum() -> Reducer:
+        return Reducer([("sum", "sum", None)])
+
+    @staticmethod
+    def max() -> Reducer:
+        return Reducer([("max", "max", None)])
+
+    @staticmethod
+    def min() -> Reducer:
+        return Reducer([("min", "min", None)])
+
+    @staticmethod
+    def median() -> Reducer:
+        return Reducer([("median", "median", None)])
+
+    @staticmethod
+    def count() -> Reducer:
+        return Reducer([("count", "count", None)])
+
+    @staticmethod
+    def countDistinctNonNull() -> Reducer:
+        return Reducer([("count", "countDistinctNonNull", None)])
+
+    @staticmethod
+    def percentile(
+        percentiles: Sequence[float], outputNames: Sequence[str] | None = None
+    ) -> Reducer:
+        if outputNames is None:
+            outputNames = [f"p{p:g}" for p in percentiles]
+        return Reducer(
+            [(name, "percentile", p) for name, p in zip(outputNames, percentiles, strict=True)]
+        )
+
+    def combine(
+        self, reducer2: Reducer, outputPrefix: str = "", sharedInputs: bool = False
+    ) -> Reducer:
+        return Reducer(
+            self.outputs + [(outputPrefix + name, *output) for name, *output in reducer2.outputs]
+        )
+
+    def names(self) -> list[str]:
+        return [name for name, _, _ in self.outputs]
+
+    def apply(self, values: np.ndarray, axis: int) -> list[np.ndarray]:
+        """
+        Reduce values along an axis, NaN values are skipped.
+
+        Parameters
+        ----------
+        values : np.ndarray
+            Values to reduce
+        axis : int
+            Axis to reduce
+
+        Returns
+        -------
+        list[np.ndarray]
+            One array per output, NaN where no value is valid
+
+        """
+        valid = np.isfinite(values).any(axis=axis)
+        outputs = []
+        with warnings.catch_warnings(), np.errstate(all="ignore"):
+            warnings.simplefilter("ignore", RuntimeWarning)
+            for _, statistic, p in self.outputs:
+                if statistic == "percentile":
+                    output = np.nanpercentile(values, p, axis=axis)
+                else:
+                    output = _STATISTICS[statistic](values, axis)
+                output = np.asarray(output, dtype=np.float64)
+                if statistic not in _COUNTS:
+                    output = np.where(valid, output, np.nan)
+                outputs.append(output)
+        return outputs
+
+
+# ---------------------------------------------------------------------------//
+# Images
+# ---------------------------------------------------------------------------//
+
+
+def _shift(x: np.ndarray, dy: int, dx: int) -> np.ndarray:
+    """``out[i, j] = x[i + dy, j + dx]``, NaN outside the array."""
+    out = np.full(x.shape, np.nan)
+    rows, cols = x.shape
+    out[max(-dy, 0) : rows - max(dy, 0), max(-dx, 0) : cols - max(dx, 0)] = x[
+        max(dy, 0) : rows + min(dy, 0), max(dx, 0) : cols + min(dx, 0)
+    ]
+    return out
+
+
+def _align(a: np.ndarray, b: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # a band of array pixels against a band of scalars
+    if a.ndim == 3 and b.ndim == 2:
+        b = b[..., np.newaxis]
+    elif b.ndim == 3 and a.ndim == 2:
+        a = a[..., np.newaxis]
+    return a, b
+
+
+def _raster(x: np.ndarray) -> np.ndarray:
+    if x.ndim != 2:
+        raise ValueError("ERROR!!! neighbourhood operations need a band of scalar pixels")
+    return x
+
+
+def _unique(name: str, names: Sequence[str]) -> str:
+    # Earth Engine renames duplicated bands foo to foo_1, foo_2...
+    i = 1
+    while f"{name}_{i}" in names:
+        i += 1
+    return f"{name}_{i}"
+
+
+def _divide(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.where(b == 0, np.nan, np.true_divide(a, b))
+
+
+def _compare(operator: Callable) -> Callable:
+    def compare(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        return np.where(np.isnan(a) | np.isnan(b), np.nan, operator(a, b))
+
+    return compare
+
+
+def _logical(operator: Callable) -> Callable:
+    return _compare(lambda a, b: operator(a != 0, b != 0))
+
+
+_EXPRESSION_OPERATORS = {
+    ast.Add: "add",
+    ast.Sub: "subtract",
+    ast.Mult: "multiply",
+    ast.Div: "divide",
+    ast.Pow: "pow",
+}
+
+
+class Image:
+    """
+    ``ee.Image`` evaluated lazily on NumPy arrays.
+
+    Parameters
+    ----------
+    args : Any
+        Image, asset id registered with ``use_local_backend``, raster (see
+        ``from_numpy``), number or list of numbers (constant image), or None for
+        an image without bands
+
+    """
+
+    def __init__(self, args: Any = None):
+        if isinstance(args, _Error):
+            raise ValueError(args.message)
+        if isinstance(args, str):
+            if args not in _STATE["assets"]:
+                raise ValueError(f"ERROR!!! asset {args} not registered with use_local_backend")
+            args = _STATE["assets"][args]
+        elif args is None:
+            args = Image._create([], list)
+        elif isinstance(args, np.ndarray):
+            args = from_numpy(args)
+        elif not isinstance(args, Image):
+            args = Image.constant(args)
+        self._names = args._names
+        # evaluated once, whichever of the two images is evaluated first
+        self._compute = args._data
+        self._cache = None
+        self._properties = dict(args._properties)
+
+    @classmethod
+    def _create(
+        cls,
+        names: Sequence[str],
+        compute: Callable[[], list[np.ndarray]],
+        properties: dict | None = None,
+    ) -> Image:
+        image = object.__new__(cls)
+        image._names = [String(name) for name in names]
+        image._compute = compute
+        image._cache = None
+        image._properties = dict(properties or {})
+        return image
+
+    def _data(self) -> list[np.ndarray]:
+        if self._cache is None:
+            with np.errstate(all="ignore"):
+                self._cache = [np.asarray(x) for x in self._compute()]
+        return self._cache
+
+    def _derive(self, compute: Callable, names: Sequence[str] | None = None) -> Image:
+        """Same bands and properties, other pixel values."""
+        return Image._create(self._names if names is None else names, compute, self._properties)
+
+    def _map_bands(self, function: Callable, names: Sequence[str] | None = None) -> Image:
+        return Image._create(
+            self._names if names is None else names,
+            lambda: [function(x) for x in self._data()],
+        )
+
+    def _binary(self, other: Any, function: Callable) -> Image:
+        other = Image(other)
+        na, nb = len(self._names), len(other._names)
+        if na != nb and 1 not in (na, nb):
+            raise ValueError("ERROR!!! images must have the same number of bands or one band")
+        names = other._names if na == 1 and nb > 1 else self._names
+
+        def compute():
+            a, b = self._data(), other._data()
+            return [function(*_align(a[i % na], b[i % nb])) for i in range(max(na, nb))]
+
+        return Image._create(names, compute)
+
+    # ---- construction
+
+    @staticmethod
+    def constant(value: float | Sequence[float]) -> Image:
+        values = list(value) if isinstance(value, (list, tuple)) else [value]
+        names = [f"constant_{i}" for i in range(len(values))] if len(values) > 1 else ["constant"]
+        return Image._create(names, lambda: [np.asarray(float(v)) for v in values])
+
+    @staticmethod
+    def pixelArea() -> Image:
+        return Image.constant(_STATE["pixel_size"] ** 2).rename("area")
+
+    # ---- arithmetic
+
+    def add(self, image2: Any) -> Image:
+        return self._binary(image2, np.add)
+
+    def subtract(self, image2: Any) -> Image:
+        return self._binary(image2, np.subtract)
+
+    def multiply(self, image2: Any) -> Image:
+        return self._binary(image2, np.multiply)
+
+    def divide(self, image2: Any) -> Image:
+        return self._binary(image2, _divide)
+
+    def pow(self, image2: Any) -> Image:
+        return self._binary(image2, np.power)
+
+    def max(self, image2: Any) -> Image:
+        return self._binary(image2, np.maximum)
+
+    def min(self, image2: Any) -> Image:
+        return self._binary(image2, np.minimum)
+
+    def lt(self, image2: Any) -> Image:
+        return self._binary(image2, _compare(np.less))
+
+    def lte(self, image2: Any) -> Image:
+        return self._binary(image2, _compare(np.less_equal))
+
+    def gt(self, image2: Any) -> Image:
+        return self._binary(image2, _compare(np.greater))
+
+    def gte(self, image2: Any) -> Image:
+        return self._binary(image2, _compare(np.greater_equal))
+
+    def eq(self, image2: Any) -> Image:
+        return self._binary(image2, _compare(np.equal))
+
+    def neq(self, image2: Any) -> Image:
+        return self._binary(image2, _compare(np.not_equal))
+
+    def And(self, image2: Any) -> Image:
+        return self._binary(image2, _logical(np.logical_and))
+
+    def Or(self, image2: Any) -> Image:
+        return self._binary(image2, _logical(np.logical_or))
+
+    def Not(self) -> Image:
+        return self._map_bands(lambda x: np.where(np.isnan(x), np.nan, x == 0))
+
+    def abs(self) -> Image:
+        return self._map_bands(np.abs)
+
+    def sqrt(self) -> Image:
+        return self._map_bands(np.sqrt)
+
+    def exp(self) -> Image:
+        return self._map_bands(np.exp)
+
+    def log(self) -> Image:
+        return self._map_bands(np.log)
+
+    def log10(self) -> Image:
+        return self._map_bands(np.log10)
+
+    def sin(self) -> Image:
+        return self._map_bands(np.sin)
+
+    def cos(self) -> Image:
+        return self._map_bands(np.cos)
+
+    def tan(self) -> Image:
+        return self._map_bands(np.tan)
+
+    def atan(self) -> Image:
+        return self._map_bands(np.arctan)
+
+    def float(self) -> Image:
+        return self._derive(lambda: [x.astype(np.float32) for x in self._data()])
+
+    def double(self) -> Image:
+        return self._derive(lambda: [x.astype(np.float64) for x in self._data()])
+
+    def toByte(self) -> Image:
+        return self._derive(lambda: [np.clip(np.trunc(x), 0, 255) for x in self._data()])
+
+    def unitScale(self, low: float, high: float) -> Image:
+        return self._map_bands(lambda x: (x - low) / (high - low))
+
+    def where(self, test: Any, value: Any) -> Image:
+        test, value = Image(test), Image(value)
+
+        def compute():
+            data, tests, values = self._data(), test._data(), value._data()
+            return [
+                np.where(np.nan_to_num(tests[i % len(tests)]) != 0, values[i % len(values)], x)
+                for i, x in enumerate(data)
+            ]
+
+        return self._derive(compute)
+
+    def expression(self, expression: str, map: dict | None = None) -> Image:
+        variables = dict(map or {})
+
+        def evaluate(node):
+            if isinstance(node, ast.Expression):
+                return evaluate(node.body)
+            if isinstance(node, ast.BinOp) and type(node.op) in _EXPRESSION_OPERATORS:
+                method = _EXPRESSION_OPERATORS[type(node.op)]
+                return getattr(Image(evaluate(node.left)), method)(evaluate(node.right))
+            if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+                return Image(evaluate(node.operand)).multiply(-1)
+            if isinstance(node, ast.Constant):
+                return node.value
+            if isinstance(node, ast.Name) and node.id in variables:
+                return variables[node.id]
+            if isinstance(node, ast.Call) and getattr(node.func, "id", None) == "b":
+                return self.select(evaluate(node.args[0])) if node.args else self
+            raise ValueError(f"ERROR!!! unsupported expression {ast.unparse(node)}")
+
+        return Image(evaluate(ast.parse(expression, mode="eval")))
+
+    # ---- bands and properties
+
+    def bandNames(self) -> List:
+        return List(self._names)
+
+    def select(self, selectors: Any, names: Any = None, *args: Any) -> Image:
+        if isinstance(selectors, (list, tuple)):
+            selectors = list(selectors)
+        else:
+            # varargs selectors
+            selectors = [s for s in (selectors, names, *args) if s is not None]
+            names = None
+        indices = []
+        for selector in selectors:
+            if isinstance(selector, (int, np.integer)):
+                matches = [int(selector)]
+            else:
+                matches = [i for i, n in enumerate(self._names) if re.fullmatch(selector, n)]
+            if not matches:
+                raise ValueError(f"ERROR!!! band {selector} not found in {self._names}")
+            indices += matches
+        return Image._create(
+            [self._names[i] for i in indices] if names is None else names,
+            lambda: [self._data()[i] for i in indices],
+            self._properties,
+        )
+
+    def rename(self, names: str | Sequence[str], *args: str) -> Image:
+        names = [names, *args] if isinstance(names, str) else list(names)
+        if len(names) != len(self._names):
+            raise ValueError("ERROR!!! rename needs one name per band")
+        return Image._create(names, self._data, self._properties)
+
+    def addBands(
+        self, srcImg: Any, names: Sequence[str] | None = None, overwrite: bool = False
+    ) -> Image:
+        src = Image(srcImg)
+        if names is not None:
+            src = src.select(list(names))
+        outputNames = list(self._names)
+        sources = [(self, i) for i in range(len(outputNames))]
+        for j, name in enumerate(src._names):
+            if name in outputNames and overwrite:
+                # replaced in place
+                sources[outputNames.index(name)] = (src, j)
+                continue
+            if name in outputNames:
+                name = _unique(name, outputNames)
+            outputNames.append(name)
+            sources.append((src, j))
+        return Image._create(
+            outputNames, lambda: [image._data()[i] for image, i in sources], self._properties
+        )
+
+    def get(self, property: str) -> Any:
+        return self._properties.get(property)
+
+    def set(self, *args: Any) -> Image:
+        properties = args[0] if len(args) == 1 else dict(zip(args[::2], args[1::2], strict=True))
+        output = self._derive(self._data)
+        output._properties.update(properties)
+        return output
+
+    def copyProperties(
+        self,
+        source: Image | None = None,
+        properties: Sequence[str] | None = None,
+        exclude: Sequence[str] | None = None,
+    ) -> Image:
+        copied = {} if source is None else dict(source._properties)
+        if properties is not None:
+            copied = {key: copied[key] for key in properties if key in copied}
+        for key in exclude or []:
+            copied.pop(key, None)
+        return self.set(copied)
+
+    def getInfo(self) -> dict:
+        return {"bands": [{"id": name} for name in self._names], "properties": self._properties}
+
+    # ---- masks
+
+    def updateMask(self, mask: Any) -> Image:
+        mask = Image(mask)
+
+        def compute():
+            data, masks = self._data(), mask._data()
+            output = []
+            for i, x in enumerate(data):
+                x, m = _align(x, masks[i % len(masks)])
+                output.append(np.where(np.nan_to_num(m) != 0, x, np.nan))
+            return output
+
+        return self._derive(compute)
+
+    def mask(self, mask: Any = None) -> Image:
+        if mask is None:
+            return self._map_bands(lambda x: np.isfinite(x).astype(np.float64))
+        return self.updateMask(mask)
+
+    def unmask(self, value: Any = None, sameFootprint: bool = True) -> Image:
+        value = Image(0 if value is None else value)
+
+        def compute():
+            data, values = self._data(), value._data()
+            return [np.where(np.isnan(x), values[i % len(values)], x) for i, x in enumerate(data)]
+
+        return self._derive(compute)
+
+    # ---- geometry: images cover the input grid
+
+    def geometry(self, maxError: float | None = None) -> Geometry:
+        return Geometry()
+
+    def projection(self) -> Projection:
+        return Projection()
+
+    def clip(self, geometry: Any) -> Image:
+        return self
+
+    def resample(self, mode: str = "bilinear") -> Image:
+        return self
+
+    def reproject(self, crs: Any, crsTransform: Any = None, scale: float | None = None) -> Image:
+        return self
+
+    # ---- neighbourhoods
+
+    def reduceNeighborhood(
+        self,
+        reducer: Reducer,
+        kernel: Kernel,
+        inputWeight: str = "kernel",
+        skipMasked: bool = True,
+        optimization: str | None = None,
+    ) -> Image:
+        names = [f"{band}_{name}" for band in self._names for name in reducer.names()]
+        offsets = kernel.offsets()
+        pad = max(max(abs(dy), abs(dx)) for dy, dx, _ in offsets)
+        moments = {"mean", "variance", "stdDev", "sum", "count"}
+
+        def compute():
+            output = []
+            for x in self._data():
+                x = _raster(x)
+                if {statistic for _, statistic, _ in reducer.outputs} <= moments:
+                    # window sums, whatever the kernel size
+                    segments = kernel_segments(kernel.weights != 0, (kernel.y, kernel.x))
+                    mean, variance, count = kernel_stats(row_cumsums(x, pad), pad, segments)
+                    statistics = {
+                        "mean": mean,
+                        "variance": variance,
+                        "stdDev": np.sqrt(variance),
+                        "sum": np.where(count > 0, mean * count, np.nan),
+                        "count": count,
+                    }
+                    stats = [statistics[statistic] for _, statistic, _ in reducer.outputs]
+                else:
+                    values = np.stack([_shift(x, dy, dx) for dy, dx, _ in offsets])
+                    stats = reducer.apply(values, axis=0)
+                if skipMasked:
+                    stats = [np.where(np.isnan(x), np.nan, s) for s in stats]
+                output += stats
+            return output
+
+        return Image._create(names, compute)
+
+    def neighborhoodToBands(self, kernel: Kernel) -> Image:
+        offsets = kernel.offsets()
+        names = [f"{band}_{dx}_{dy}" for band in self._names for dy, dx, _ in offsets]
+        return Image._create(
+            names,
+            lambda: [_shift(_raster(x), dy, dx) for x in self._data() for dy, dx, _ in offsets],
+        )
+
+    def convolve(self, kernel: Kernel) -> Image:
+        offsets = kernel.offsets()
+
+        def band(x):
+            values = np.stack([_shift(_raster(x), dy, dx) for dy, dx, _ in offsets])
+            weights = np.array([w for _, _, w in offsets])[:, np.newaxis, np.newaxis]
+            valid = np.isfinite(values)
+            total = np.where(valid, values * weights, 0).sum(axis=0)
+            if kernel.normalize:
+                total = _divide(total, np.where(valid, weights, 0).sum(axis=0))
+            return np.where(np.isnan(x), np.nan, total)
+
+        return self._map_bands(band)
+
+    def fastDistanceTransform(
+        self, neighborhood: int = 256, units: str = "pixels", metric: str = "squared_euclidean"
+    ) -> Image:
+        if units != "pixels" or metric != "squared_euclidean":
+            raise ValueError("ERROR!!! only squared euclidean distances in pixels are supported")
+        return self._map_bands(
+            lambda x: terrain.fast_distance_transform(np.nan_to_num(_raster(x)) != 0, neighborhood)
+        )
+
+    # ---- reductions
+
+    def reduce(self, reducer: Reducer) -> Image:
+        def compute():
+            return reducer.apply(np.stack(np.broadcast_arrays(*self._data())), axis=0)
+
+        return Image._create(reducer.names(), compute)
+
+    def reduceRegion(
+        self,
+        reducer: Reducer,
+        geometry: Any = None,
+        scale: float | None = None,
+        crs: Any = None,
+        crsTransform: Any = None,
+        bestEffort: bool = False,
+        maxPixels: float = 1e7,
+        tileScale: float = 1,
+    ) -> Dictionary:
+        output = Dictionary()
+        for band, x in zip(self._names, self._data(), strict=True):
+            for name, value in zip(reducer.names(), reducer.apply(x.ravel(), axis=0), strict=True):
+                key = band if len(reducer.outputs) == 1 else f"{band}_{name}"
+                output[key] = None if np.isnan(value) else Number(value)
+        return output
+
+    # ---- array pixels
+
+    def toArray(self, axis: int = 0) -> Image:
+        def compute():
+            array = np.stack(np.broadcast_arrays(*self._data()), axis=-1)
+            # masked if any band is masked
+            return [np.where(np.isnan(array).any(axis=-1, keepdims=True), np.nan, array)]
+
+        return Image._create(["array"], compute)
+
+    def arraySort(self, keys: Any = None) -> Image:
+        return self._derive(lambda: [np.sort(x, axis=-1) for x in self._data()])
+
+    def arraySlice(
+        self, axis: int = 0, start: int = 0, end: int | None = None, step: int = 1
+    ) -> Image:
+        return self._derive(lambda: [x[..., start:end:step] for x in self._data()])
+
+    def arrayReduce(
+        self, reducer: Reducer, axes: Sequence[int], fieldAxis: int | None = None
+    ) -> Image:
+        return self._derive(
+            lambda: [reducer.apply(x, axis=-1)[0][..., np.newaxis] for x in self._data()]
+        )
+
+    def arrayProject(self, axes: Sequence[int]) -> Image:
+        return self
+
+    def arrayFlatten(
+        self, coordinateLabels: Sequence[Sequence[str]], separator: str = "_"
+    ) -> Image:
+        labels = list(coordinateLabels[0])
+        return Image._create(labels, lambda: [self._data()[0][..., i] for i in range(len(labels))])
+
+
+class ImageCollection:
+    """
+    ``ee.ImageCollection`` of in-memory images.
+
+    Parameters
+    ----------
+    args : Any
+        Images or collection
+
+    """
+
+    def __init__(self, args: Any):
+        if isinstance(args, _Error):
+            raise ValueError(args.message)
+        if isinstance(args, ImageCollection):
+            args = args._images
+        elif isinstance(args, str):
+            raise ValueError("ERROR!!! only in-memory collections are supported locally")
+        self._images = [Image(image) for image in args]
+
+    def map(self, algorithm: Callable[[Image], Image]) -> ImageCollection:
+        return ImageCollection([algorithm(image) for image in self._images])
+
+    def first(self) -> Image:
+        return self._images[0]
+
+    def size(self) -> Number:
+        return Number(len(self._images))
+
+    def toList(self, count: int, offset: int = 0) -> List:
+        return List(self._images[int(offset) : int(offset) + int(count)])
+
+    def select(self, *args: Any) -> ImageCollection:
+        return self.map(lambda image: image.select(*args))
+
+    def _band_names(self) -> list[str]:
+        # union of the band names, in the order they first appear
+        return list(dict.fromkeys(band for image in self._images for band in image._names))
+
+    def _reduce(self, reducer: Reducer, names: Sequence[str]) -> Image:
+        # as in Earth Engine, each band is reduced by name over the images that have it
+        def compute():
+            data = [dict(zip(image._names, image._data(), strict=True)) for image in self._images]
+            return [
+                output
+                for band in self._band_names()
+                for output in reducer.apply(
+                    np.stack(np.broadcast_arrays(*(x[band] for x in data if band in x))), axis=0
+                )
+            ]
+
+        return Image._create(names, compute)
+
+    def reduce(self, reducer: Reducer) -> Image:
+        names = [f"{band}_{name}" for band in self._band_names() for name in reducer.names()]
+        return self._reduce(reducer, names)
+
+    def sum(self) -> Image:
+        return self._reduce(Reducer.sum(), self._band_names())
+
+    def mean(self) -> Image:
+        return self._reduce(Reducer.mean(), self._band_names())
+
+    def toBands(self) -> Image:
+        names = [f"{i}_{band}" for i, image in enumerate(self._images) for band in image._names]
+        return Image._create(names, lambda: [x for image in self._images for x in image._data()])
+
+
+class Terrain:
+    """``ee.Terrain`` on the grid of the input, with the pixel size of ``use_local_backend``."""
+
+    @staticmethod
+    def slope(input: Image) -> Image:
+        return Image._create(
+            ["slope"], lambda: [terrain.slope(_raster(input._data()[0]), _STATE["pixel_size"])]
+        )
+
+    @staticmethod
+    def aspect(input: Image) -> Image:
+        return Image._create(
+            ["aspect"], lambda: [terrain.aspect(_raster(input._data()[0]), _STATE["pixel_size"])]
+        )
+
+
+# ---------------------------------------------------------------------------//
+# Conversion and backend selection
+# ---------------------------------------------------------------------------//
+
+
+def from_numpy(
+    array: np.ndarray, bandNames: Sequence[str] | None = None, properties: dict | None = None
+) -> Image:
+    """
+    Image of a local raster.
+
+    Parameters
+    ----------
+    array : np.ndarray
+        2-D or (bands, rows, cols) raster, NaN marks masked pixels
+    bandNames : Sequence[str] | None
+        Names of the bands, defaults to "b1", "b2"...
+    properties : dict | None
+        Image properties, e.g. "system:time_start"
+
+    Returns
+    -------
+    Image
+        Image of the raster
+
+    """
+    stack, _ = as_stack(np.asarray(array, dtype=np.float64))
+    if bandNames is None:
+        bandNames = [f"b{i + 1}" for i in range(stack.shape[0])]
+    if len(bandNames) != stack.shape[0]:
+        raise ValueError("ERROR!!! bandNames does not match the number of bands of the image")
+    return Image._create(bandNames, lambda: list(stack), properties)
+
+
+def to_numpy(image: Image) -> np.ndarray:
+    """
+    Evaluate an image.
+
+    Parameters
+    ----------
+    image : Image
+        Image to evaluate
+
+    Returns
+    -------
+    np.ndarray
+        (bands, rows, cols) array, NaN where the image is masked
+
+    """
+    data = Image(image)._data()
+    if any(x.ndim > 2 for x in data):
+        raise ValueError("ERROR!!! array images must be flattened before conversion")
+    return np.stack(np.broadcast_arrays(*data))
+
+
+@contextmanager
+def use_local_backend(
+    assets: dict[str, Image | np.ndarray] | None = None, pixel_size: float = 10.0
+) -> Generator[Any, None, None]:
+    """
+    Run the Earth Engine functions of the package on local rasters.
+
+    The ``ee`` module of the package modules is replaced by this one until the
+    context exits. The swap is global: do not use Earth Engine from other
+    threads meanwhile.
+
+    Parameters
+    ----------
+    assets : dict[str, Image | np.ndarray] | None
+        Images returned by ``ee.Image(asset_id)``, e.g. the DEM; 2-D arrays
+        become single band "elevation" images
+    pixel_size : float
+        Pixel spacing in meters of the local grid
+
+    Yields
+    ------
+    Any
+        This module, to use in place of ``ee``
+
+    """
+    facade = importlib.import_module(__name__)
+    modules = [importlib.import_module(f"gee_s1_processing.{name}") for name in _MODULES]
+    saved_modules = [module.ee for module in modules]
+    saved_state = dict(_STATE)
+    _STATE["assets"] = {
+        key: value if isinstance(value, Image) else from_numpy(value, ["elevation"])
+        for key, value in (assets or {}).items()
+    }
+    _STATE["pixel_size"] = pixel_size
+    for module in modules:
+        module.ee = facade
+    try:
+        yield facade
+    finally:
+        for module, ee in zip(modules, saved_modules, strict=True):
+            module.ee = ee
+        _STATE.update(saved_state)
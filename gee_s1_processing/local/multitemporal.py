@@ -0,0 +1,203 @@
+"""
+Description: Streaming version of the Quegan multi-temporal speckle filter of
+gee_s1_processing.speckle_filter.MultiTemporal_Filter, for in-memory arrays.
+
+S. Quegan and J. J. Yu, “Filtering of multichannel SAR images,”
+IEEE Trans Geosci. Remote Sensing, vol. 39, Nov. 2001.
+
+Scenes are pushed in acquisition order. Each scene is spatially filtered once,
+its ``image / filtered`` ratio is added to the rolling sum of its relative orbit
+and the ratio of the scene leaving the window is subtracted, so a new
+acquisition costs one spatial filter and O(1) accumulator updates per pixel.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from ._bands import as_stack, filter_bands, output_like
+from .speckle_filter import spatial_filter
+
+if TYPE_CHECKING:
+    from collections.abc import Hashable, Iterable, Iterator, Sequence
+
+
+@dataclass
+class _OrbitWindow:
+    """Rolling accumulators of one relative orbit."""
+
+    ratios: deque = field(default_factory=deque)
+    ratio_sum: np.ndarray | None = None
+    count: np.ndarray | None = None
+    # scenes waiting for the first window to fill, see QueganStream.push
+    pending: list = field(default_factory=list)
+    filled: bool = False
+
+
+class QueganStream:
+    """
+    Incremental Quegan filter over a time series of co-registered scenes.
+
+    For every relative orbit, the window holds the last ``NR_OF_IMAGES`` scenes,
+    the current one included, as in the Earth Engine version. At the start of an
+    orbit, when fewer scenes are available, the Earth Engine version completes
+    the window with later acquisitions: the first scenes are then held back and
+    returned once the window is full, or by ``flush``.
+
+    Memory is one window: the ``NR_OF_IMAGES`` ratio images needed to remove the
+    oldest scene, plus a sum and a count accumulator per orbit.
+
+    Parameters
+    ----------
+    KERNEL_SIZE : int
+        Spatial Neighbourhood window. Positive odd integer.
+    SPECKLE_FILTER : str
+        Type of speckle filter
+    NR_OF_IMAGES : int
+        Number of images to use in multi-temporal filtering. Positive integer.
+    bandNames : Sequence[str] | None
+        Names of the bands of the scenes; an "angle" band is left unfiltered
+
+    """
+
+    def __init__(
+        self,
+        KERNEL_SIZE: int,
+        SPECKLE_FILTER: str,
+        NR_OF_IMAGES: int,
+        bandNames: Sequence[str] | None = None,
+    ):
+        if NR_OF_IMAGES <= 0:
+            raise ValueError("ERROR!!! NR_OF_IMAGES not correctly defined")
+        self.KERNEL_SIZE = KERNEL_SIZE
+        self.SPECKLE_FILTER = SPECKLE_FILTER
+        self.NR_OF_IMAGES = NR_OF_IMAGES
+        self.bandNames = bandNames
+        self._windows: dict[Any, _OrbitWindow] = {}
+
+    def push(
+        self, image: np.ndarray, relativeOrbit: Hashable, key: Hashable = None
+    ) -> list[tuple[Hashable, np.ndarray]]:
+        """
+        Add the next acquisition of an orbit and return the scenes filtered so far.
+
+        Parameters
+        ----------
+        image : np.ndarray
+            2-D or (bands, rows, cols) scene in linear scale, NaN marks masked pixels
+        relativeOrbit : Hashable
+            Relative orbit number of the scene
+        key : Hashable
+            Identifier returned with the filtered scene
+
+        Returns
+        -------
+        list[tuple[Hashable, np.ndarray]]
+            (key, filtered scene) pairs, empty while the first window of the
+            orbit is filling
+
+        """
+        stack, squeeze = as_stack(image)
+        bands = filter_bands(self.bandNames, stack.shape[0])
+        window = self._windows.setdefault(relativeOrbit, _OrbitWindow())
+        if window.ratio_sum is None:
+            window.ratio_sum = np.zeros((len(bands), *stack.shape[1:]))
+            window.count = np.zeros((len(bands), *stack.shape[1:]), dtype=np.int32)
+
+        # the only spatial filter run for this scene
+        filtered = spatial_filter(stack, self.KERNEL_SIZE, self.SPECKLE_FILTER, self.bandNames)
+        valid = np.isfinite(stack[bands])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.true_divide(stack[bands], filtered[bands])
+        ratio[~np.isfinite(ratio)] = 0
+        window.ratio_sum += ratio
+        window.count += valid
+        window.ratios.append((ratio, valid))
+        if len(window.ratios) > self.NR_OF_IMAGES:
+            old_ratio, old_valid = window.ratios.popleft()
+            window.ratio_sum -= old_ratio
+            window.count -= old_valid
+
+        scene = (key, stack, filtered, squeeze)
+        if window.filled:
+            return [self._output(window, bands, *scene)]
+        window.pending.append(scene)
+        if len(window.ratios) == self.NR_OF_IMAGES:
+            return self._release(window, bands)
+        return []
+
+    def flush(self) -> list[tuple[Hashable, np.ndarray]]:
+        """
+        Return the scenes of orbits with fewer acquisitions than NR_OF_IMAGES.
+
+        Returns
+        -------
+        list[tuple[Hashable, np.ndarray]]
+            (key, filtered scene) pairs filtered with all the scenes of their orbit
+
+        """
+        output = []
+        for window in self._windows.values():
+            if window.pending:
+                bands = filter_bands(self.bandNames, window.pending[0][1].shape[0])
+                output += self._release(window, bands)
+        return output
+
+    def _release(self, window: _OrbitWindow, bands: list[int]) -> list:
+        window.filled = True
+        output = [self._output(window, bands, *scene) for scene in window.pending]
+        window.pending = []
+        return output
+
+    @staticmethod
+    def _output(
+        window: _OrbitWindow,
+        bands: list[int],
+        key: Hashable,
+        stack: np.ndarray,
+        filtered: np.ndarray,
+        squeeze: bool,
+    ) -> tuple[Hashable, np.ndarray]:
+        output = output_like(stack)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            output[bands] = filtered[bands] / window.count * window.ratio_sum
+        return key, output[0] if squeeze else output
+
+
+def MultiTemporal_Filter(
+    scenes: Iterable[tuple[Hashable, Hashable, np.ndarray]],
+    KERNEL_SIZE: int,
+    SPECKLE_FILTER: str,
+    NR_OF_IMAGES: int,
+    bandNames: Sequence[str] | None = None,
+) -> Iterator[tuple[Hashable, np.ndarray]]:
+    """
+    A wrapper function for the streaming multi-temporal filter.
+
+    Parameters
+    ----------
+    scenes : Iterable[tuple[Hashable, Hashable, np.ndarray]]
+        (key, relative orbit, image) of each scene, in acquisition order
+    KERNEL_SIZE : int
+        Spatial Neighbourhood window. Positive odd integer.
+    SPECKLE_FILTER : str
+        Type of speckle filter
+    NR_OF_IMAGES : int
+        Number of images to use in multi-temporal filtering. Positive integer.
+    bandNames : Sequence[str] | None
+        Names of the bands of the scenes; an "angle" band is left unfiltered
+
+    Yields
+    ------
+    tuple[Hashable, np.ndarray]
+        (key, filtered scene), in the order the scenes become available
+
+    """
+    stream = QueganStream(KERNEL_SIZE, SPECKLE_FILTER, NR_OF_IMAGES, bandNames)
+    for key, relativeOrbit, image in scenes:
+        yield from stream.push(image, relativeOrbit, key)
+    yield from stream.flush()
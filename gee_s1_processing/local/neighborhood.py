@@ -0,0 +1,334 @@
+"""
+Description: Windowed statistics for the local speckle filters.
+
+The square window sums are computed with one of three strategies:
+
+- "DIRECT" adds the shifted rows then the shifted columns of the window, 2 *
+  KERNEL_SIZE additions per pixel without any cumulative sum
+- "RUNNING" takes the running sums along the columns then the rows, as
+  differences of cumulative sums, at a cost per pixel independent of the
+  kernel size
+- "INTEGRAL" reads them from a summed-area table (integral image), also
+  independent of the kernel size
+
+"AUTO" picks DIRECT up to ``DIRECT_MAX_KERNEL`` and RUNNING beyond, the
+crossover measured with ``benchmarks/test_bench_neighborhood.py``; the integral
+image was slower than the running sums at every size. The strategies agree up
+to round-off. Masked pixels are stored as NaN and, as with
+``ee.Image.reduceNeighborhood``, they are skipped in the window and masked in
+the output.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+from .. import tracing
+
+WINDOW_STRATEGIES = ["DIRECT", "RUNNING", "INTEGRAL"]
+# largest kernel the direct sums are faster for
+DIRECT_MAX_KERNEL = 9
+
+
+def half_width(KERNEL_SIZE: int) -> int:
+    """
+    Half width of the square kernel ``ee.Kernel.square(KERNEL_SIZE / 2, "pixels")``.
+
+    Parameters
+    ----------
+    KERNEL_SIZE : int
+        Neighbourhood window size. Positive integer.
+
+    Returns
+    -------
+    int
+        Number of pixels on each side of the centre pixel
+
+    """
+    if KERNEL_SIZE <= 0:
+        raise ValueError("ERROR!!! KERNEL_SIZE not correctly defined")
+    return int(KERNEL_SIZE // 2)
+
+
+def integral_image(x: np.ndarray) -> np.ndarray:
+    """
+    Summed-area table of a 2-D array with a leading row and column of zeros.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        2-D array
+
+    Returns
+    -------
+    np.ndarray
+        (rows + 1, cols + 1) float64 table where ``sat[i, j] == x[:i, :j].sum()``
+
+    """
+    sat = np.zeros((x.shape[0] + 1, x.shape[1] + 1), dtype=np.float64)
+    np.cumsum(x, axis=0, dtype=np.float64, out=sat[1:, 1:])
+    np.cumsum(sat[1:, 1:], axis=1, out=sat[1:, 1:])
+    return sat
+
+
+def window_strategy(KERNEL_SIZE: int, strategy: str = "AUTO") -> str:
+    """
+    Strategy of the window sums of a kernel size.
+
+    Parameters
+    ----------
+    KERNEL_SIZE : int
+        Neighbourhood window size. Positive integer.
+    strategy : str
+        "AUTO", or one of ``WINDOW_STRATEGIES`` to force it
+
+    Returns
+    -------
+    str
+        One of ``WINDOW_STRATEGIES``
+
+    """
+    if strategy == "AUTO":
+        return "DIRECT" if KERNEL_SIZE <= DIRECT_MAX_KERNEL else "RUNNING"
+    if strategy not in WINDOW_STRATEGIES:
+        raise ValueError("ERROR!!! strategy not correctly defined")
+    return strategy
+
+
+def _direct_sums(x: np.ndarray, half: int) -> np.ndarray:
+    # the square window is separable: add the shifted rows, then the shifted columns,
+    # clipped at the edges without a padded copy
+    sums = np.array(x, dtype=np.float64)
+    for d in range(1, half + 1):
+        sums[..., d:, :] += x[..., :-d, :]
+        sums[..., :-d, :] += x[..., d:, :]
+    columns = sums.copy()
+    for d in range(1, half + 1):
+        columns[..., d:] += sums[..., :-d]
+        columns[..., :-d] += sums[..., d:]
+    return columns
+
+
+def _running_sums(x: np.ndarray, half: int) -> np.ndarray:
+    # running sums along the columns then the rows: differences of the cumulative
+    # sums of the array padded with half + 1 zeros before and half zeros after
+    rows, cols = x.shape[-2:]
+    size = 2 * half + 1
+    lead = [(0, 0)] * (x.ndim - 2)
+    cs = np.cumsum(np.pad(x, [*lead, (half + 1, half), (0, 0)]), axis=-2, dtype=np.float64)
+    sums = cs[..., size : size + rows, :] - cs[..., :rows, :]
+    cs = np.cumsum(np.pad(sums, [*lead, (0, 0), (half + 1, half)]), axis=-1)
+    return cs[..., size : size + cols] - cs[..., :cols]
+
+
+def _integral_sums(x: np.ndarray, half: int) -> np.ndarray:
+    rows, cols = x.shape[-2:]
+    r0 = np.clip(np.arange(rows) - half, 0, rows)
+    r1 = np.clip(np.arange(rows) + half + 1, 0, rows)
+    c0 = np.clip(np.arange(cols) - half, 0, cols)
+    c1 = np.clip(np.arange(cols) + half + 1, 0, cols)
+    sums = []
+    for band in x.reshape(-1, rows, cols):
+        sat = integral_image(band)
+        sums.append(
+            sat[np.ix_(r1, c1)] - sat[np.ix_(r0, c1)] - sat[np.ix_(r1, c0)] + sat[np.ix_(r0, c0)]
+        )
+    return np.reshape(sums, x.shape)
+
+
+_WINDOW_SUMS = {"DIRECT": _direct_sums, "RUNNING": _running_sums, "INTEGRAL": _integral_sums}
+
+
+def box_sum(
+    x: np.ndarray, half: int, strategy: str = "AUTO", out: np.ndarray | None = None
+) -> np.ndarray:
+    """
+    Sum of an array over a (2 * half + 1) square window, clipped at the edges.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        2-D array, or stack of 2-D arrays along the leading axes
+    half : int
+        Half width of the window
+    strategy : str
+        "AUTO", or one of ``WINDOW_STRATEGIES``, see ``window_strategy``
+    out : np.ndarray | None
+        Array of the shape of ``x`` the sums are written into, e.g. ``x``
+        itself. The 2-D arrays of a stack are then summed one at a time, so
+        that only the temporaries of one of them are allocated.
+
+    Returns
+    -------
+    np.ndarray
+        float64 window sums, same shape as ``x``, or ``out``
+
+    """
+    strategy = window_strategy(2 * half + 1, strategy)
+    with tracing.span("local.window_sums", kernel_size=2 * half + 1, strategy=strategy):
+        if out is None:
+            return _WINDOW_SUMS[strategy](x, half)
+        for index in np.ndindex(x.shape[:-2]):
+            out[index] = _WINDOW_SUMS[strategy](x[index], half)
+        return out
+
+
+def window_stats(
+    x: np.ndarray, KERNEL_SIZE: int, strategy: str = "AUTO"
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Windowed mean, population variance and number of valid pixels.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        2-D array, NaN marks masked pixels
+    KERNEL_SIZE : int
+        Neighbourhood window size. Positive odd integer.
+    strategy : str
+        Strategy of the window sums, "AUTO" or one of ``WINDOW_STRATEGIES``
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray, np.ndarray]
+        mean, variance and count; mean and variance are NaN where the centre
+        pixel is masked or the window holds no valid pixel. They have the
+        floating point type of ``x`` (float64 otherwise), the sums are
+        accumulated in float64.
+
+    """
+    half = half_width(KERNEL_SIZE)
+    dtype = x.dtype if np.issubdtype(x.dtype, np.floating) else np.float64
+    valid = np.isfinite(x)
+    # the three sums share one call of the strategy, in place in one float64 stack
+    stack = np.zeros((3, *x.shape), dtype=np.float64)
+    stack[0] = valid
+    np.copyto(stack[1], x, where=valid)
+    np.multiply(stack[1], stack[1], out=stack[2])
+    count, total, total_sq = box_sum(stack, half, strategy, out=stack)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.divide(total, count, out=total)
+        variance = np.divide(total_sq, count, out=total_sq)
+        variance -= mean * mean
+    # round-off can make the variance of flat windows slightly negative
+    np.maximum(variance, 0.0, out=variance)
+    masked = ~valid | (count == 0)
+    mean[masked] = np.nan
+    variance[masked] = np.nan
+    return mean.astype(dtype, copy=False), variance.astype(dtype, copy=False), count
+
+
+def row_cumsums(x: np.ndarray, pad: int) -> np.ndarray:
+    """
+    Row-wise cumulative sums of the values, squared values and valid pixel counts.
+
+    The array is zero padded by ``pad`` pixels on every side so that kernels up
+    to ``2 * pad + 1`` pixels wide can be evaluated everywhere, and a leading
+    zero column is added so that ``cs[..., r, c1 + 1] - cs[..., r, c0]`` is the
+    sum over columns ``c0`` to ``c1`` of padded row ``r``.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        2-D array, NaN marks masked pixels
+    pad : int
+        Padding on each side
+
+    Returns
+    -------
+    np.ndarray
+        (3, rows + 2 * pad, cols + 2 * pad + 1) float64 array
+
+    """
+    rows, cols = x.shape
+    valid = np.isfinite(x)
+    cs = np.zeros((3, rows + 2 * pad, cols + 2 * pad + 1), dtype=np.float64)
+    inner = (slice(pad, pad + rows), slice(pad + 1, pad + cols + 1))
+    np.copyto(cs[0][inner], x, where=valid)
+    np.multiply(cs[0][inner], cs[0][inner], out=cs[1][inner])
+    cs[2][inner] = valid
+    np.cumsum(cs, axis=2, out=cs)
+    return cs
+
+
+def kernel_segments(
+    weights: np.ndarray, focus: tuple[int, int] | None = None
+) -> list[tuple[int, int, int]]:
+    """
+    Split a binary kernel into horizontal runs of ones.
+
+    Parameters
+    ----------
+    weights : np.ndarray
+        2-D binary kernel
+    focus : tuple[int, int] | None
+        (row, column) of the kernel pixel aligned with the output pixel,
+        defaults to the middle pixel
+
+    Returns
+    -------
+    list[tuple[int, int, int]]
+        (dy, dx0, dx1) offsets of each run relative to the kernel focus
+
+    """
+    if focus is None:
+        focus = (weights.shape[0] // 2, weights.shape[1] // 2)
+    focus_row, focus_col = focus
+    segments = []
+    for r, row in enumerate(np.asarray(weights, dtype=bool)):
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], row.astype(np.int8), [0]))))
+        for start, stop in zip(edges[::2], edges[1::2], strict=True):
+            segments.append((r - focus_row, int(start) - focus_col, int(stop) - 1 - focus_col))
+    return segments
+
+
+def kernel_stats(
+    cs: np.ndarray,
+    pad: int,
+    segments: list[tuple[int, int, int]],
+    rows: np.ndarray | None = None,
+    cols: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Mean, population variance and count over a kernel, read from row cumulative sums.
+
+    Parameters
+    ----------
+    cs : np.ndarray
+        Output of ``row_cumsums``
+    pad : int
+        Padding used to build ``cs``
+    segments : list[tuple[int, int, int]]
+        Output of ``kernel_segments``
+    rows : np.ndarray | None
+        1-D row indices of the pixels to evaluate, None for every pixel
+    cols : np.ndarray | None
+        1-D column indices of the pixels to evaluate, None for every pixel
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray, np.ndarray]
+        mean, variance and count; NaN where the kernel holds no valid pixel
+
+    """
+    height = cs.shape[1] - 2 * pad
+    width = cs.shape[2] - 2 * pad - 1
+    if rows is None:
+        sums = np.zeros((3, height, width))
+        for dy, dx0, dx1 in segments:
+            r = slice(pad + dy, pad + dy + height)
+            sums += cs[:, r, pad + dx1 + 1 : pad + dx1 + 1 + width]
+            sums -= cs[:, r, pad + dx0 : pad + dx0 + width]
+    else:
+        flat = cs.reshape(3, -1)
+        index = (rows + pad) * cs.shape[2] + cols + pad
+        sums = np.zeros((3, index.size))
+        for dy, dx0, dx1 in segments:
+            offset = dy * cs.shape[2]
+            sums += flat[:, index + (offset + dx1 + 1)]
+            sums -= flat[:, index + (offset + dx0)]
+    total, total_sq, count = sums
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = total / count
+        variance = np.maximum(total_sq / count - mean * mean, 0.0)
+    return mean, variance, count
@@ -0,0 +1,95 @@
+"""
+Description: Single pass, fixed memory percentiles of backscatter images.
+
+Values are accumulated tile by tile in a histogram with fixed bins in dB, so the
+memory used does not depend on the scene size and the tiles do not have to be
+kept. The percentile is interpolated linearly within the bin holding the
+requested rank. With the default 0.005 dB bins the relative error against the
+exact (sorted) percentile is below 10 ** (0.005 / 10) - 1 = 0.12 %, and is in
+practice a few hundredths of a percent. Values outside [min_db, max_db) are
+counted in the first or last bin.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+
+class StreamingPercentile:
+    """
+    Per band histogram percentiles of linear backscatter accumulated tile by tile.
+
+    Parameters
+    ----------
+    nbands : int
+        Number of bands of the tiles
+    bin_width_db : float
+        Width of the histogram bins in dB
+    min_db : float
+        Lower edge of the first bin in dB
+    max_db : float
+        Upper edge of the last bin in dB
+
+    """
+
+    def __init__(
+        self, nbands: int, bin_width_db: float = 0.005, min_db: float = -60.0, max_db: float = 40.0
+    ):
+        if bin_width_db <= 0 or max_db <= min_db:
+            raise ValueError("ERROR!!! histogram bins not correctly defined")
+        self.bin_width_db = bin_width_db
+        self.min_db = min_db
+        self.nbins = int(np.ceil((max_db - min_db) / bin_width_db))
+        self.counts = np.zeros((nbands, self.nbins), dtype=np.int64)
+
+    def update(self, tile: np.ndarray) -> None:
+        """
+        Add the valid pixels of a tile to the histograms.
+
+        Parameters
+        ----------
+        tile : np.ndarray
+            (bands, rows, cols) or 2-D tile in linear scale, NaN marks masked pixels
+
+        """
+        tile = np.asarray(tile)
+        if tile.ndim == 2:
+            tile = tile[np.newaxis]
+        for band, values in zip(self.counts, tile, strict=True):
+            values = values[np.isfinite(values)]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                db = 10 * np.log10(values)
+            index = np.floor((db - self.min_db) / self.bin_width_db)
+            # non-positive values give -inf / nan and go to the first bin
+            index = np.clip(np.nan_to_num(index, nan=0, neginf=0), 0, self.nbins - 1)
+            band += np.bincount(index.astype(np.intp), minlength=self.nbins)
+
+    def percentile(self, p: float) -> np.ndarray:
+        """
+        Percentile of each band, in linear scale.
+
+        Parameters
+        ----------
+        p : float
+            Percentile in [0, 100]
+
+        Returns
+        -------
+        np.ndarray
+            One value per band, NaN for bands without valid pixels
+
+        """
+        result = np.full(self.counts.shape[0], np.nan)
+        for i, counts in enumerate(self.counts):
+            total = counts.sum()
+            if total == 0:
+                continue
+            # rank of the percentile among the sorted values, as np.percentile
+            rank = p / 100 * (total - 1)
+            cumulative = np.cumsum(counts)
+            b = int(np.searchsorted(cumulative, rank, side="right"))
+            below = cumulative[b] - counts[b]
+            fraction = (rank - below + 0.5) / counts[b]
+            db = self.min_db + (b + fraction) * self.bin_width_db
+            result[i] = 10 ** (db / 10)
+        return result
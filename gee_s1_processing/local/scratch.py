@@ -0,0 +1,115 @@
+"""
+Description: Reusable work arrays of the local processing.
+
+The filters and the terrain flattening need full tile temporaries (window
+statistics, weights, angles). Within ``use_pool`` they take them from a
+``ScratchPool`` by name instead of allocating new ones: a buffer is reused by
+every later request of the same name, shape and dtype, e.g. by the next tile of
+the same size in a worker process. Outside a pool, ``buffer`` allocates.
+
+A buffer is only valid until the next request of its name. Its content is left
+from the previous use, so it has to be fully written (``out=``) before it is
+read.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import contextvars
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+
+_POOL: contextvars.ContextVar[ScratchPool | None] = contextvars.ContextVar("pool", default=None)
+
+
+class ScratchPool:
+    """Named work arrays, reused across tiles of the same shape."""
+
+    def __init__(self):
+        self._buffers: dict[str, np.ndarray] = {}
+
+    def get(self, name: str, shape: tuple[int, ...], dtype: np.dtype | type) -> np.ndarray:
+        """
+        Work array of a name, reused if its shape and dtype match.
+
+        Parameters
+        ----------
+        name : str
+            Name of the buffer, unique within the processing of a tile
+        shape : tuple[int, ...]
+            Shape of the buffer
+        dtype : np.dtype | type
+            Data type of the buffer
+
+        Returns
+        -------
+        np.ndarray
+            Uninitialized array
+
+        """
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != tuple(shape) or buffer.dtype != dtype:
+            buffer = self._buffers[name] = np.empty(shape, dtype=dtype)
+        return buffer
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the buffers of the pool, in bytes."""
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+    def clear(self) -> None:
+        """Release the buffers."""
+        self._buffers.clear()
+
+
+@contextlib.contextmanager
+def use_pool(pool: ScratchPool | None = None) -> Generator[ScratchPool, None, None]:
+    """
+    Take the work arrays from a pool within a block.
+
+    Parameters
+    ----------
+    pool : ScratchPool | None
+        The pool, a new one if None
+
+    Yields
+    ------
+    ScratchPool
+        The pool
+
+    """
+    pool = ScratchPool() if pool is None else pool
+    token = _POOL.set(pool)
+    try:
+        yield pool
+    finally:
+        _POOL.reset(token)
+
+
+def buffer(name: str, shape: tuple[int, ...], dtype: np.dtype | type) -> np.ndarray:
+    """
+    Work array from the current pool, or a new one outside ``use_pool``.
+
+    Parameters
+    ----------
+    name : str
+        Name of the buffer, see ``ScratchPool.get``
+    shape : tuple[int, ...]
+        Shape of the buffer
+    dtype : np.dtype | type
+        Data type of the buffer
+
+    Returns
+    -------
+    np.ndarray
+        Uninitialized array
+
+    """
+    pool = _POOL.get()
+    if pool is None:
+        return np.empty(shape, dtype=dtype)
+    return pool.get(name, shape, dtype)
@@ -0,0 +1,655 @@
+"""
+Description: NumPy versions of the mono-temporal speckle filters of
+gee_s1_processing.speckle_filter, for in-memory arrays.
+
+Images are 2-D arrays or (bands, rows, cols) stacks in linear scale, masked
+pixels are NaN. When ``bandNames`` is given, the "angle" band is passed through
+unchanged, as in the Earth Engine versions, and the output keeps the band
+layout of the input.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from . import scratch
+from ._bands import as_stack, filter_bands, output_into
+from .neighborhood import (
+    box_sum,
+    half_width,
+    kernel_segments,
+    kernel_stats,
+    row_cumsums,
+    window_stats,
+)
+from .percentile import StreamingPercentile
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+
+def _divide(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Element-wise division masking (NaN) the pixels divided by zero, like ``ee.Image.divide``.
+
+    Parameters
+    ----------
+    a : np.ndarray
+        Numerator
+    b : np.ndarray
+        Denominator
+
+    Returns
+    -------
+    np.ndarray
+        Quotient
+
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = np.true_divide(a, b)
+    out[b == 0] = np.nan
+    return out
+
+
+def _boxcar(band: np.ndarray, KERNEL_SIZE: int) -> np.ndarray:
+    mean, _, _ = window_stats(band, KERNEL_SIZE)
+    return mean
+
+
+def _lee(band: np.ndarray, KERNEL_SIZE: int) -> np.ndarray:
+    # S1-GRD images are multilooked 5 times in range
+    enl = 5
+    # Compute the speckle standard deviation
+    eta = 1.0 / math.sqrt(enl)
+
+    # MMSE estimator
+    z_bar, varz, _ = window_stats(band, KERNEL_SIZE)
+    # Estimate weight b = varx / varz, in place in the type of the statistics
+    b = scratch.buffer("lee_weight", band.shape, z_bar.dtype)
+    np.multiply(z_bar, z_bar, out=b)
+    b *= -(eta**2)
+    b += varz
+    b /= 1 + eta**2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        b /= varz
+        b[varz == 0] = np.nan
+
+        # if b is negative set it to zero
+        b[b < 0] = 0
+    # (1 - b) * |z_bar| + b * band, written over the statistics
+    np.abs(z_bar, out=z_bar)
+    output = np.subtract(band, z_bar, out=varz)
+    output *= b
+    output += z_bar
+    return output
+
+
+def _gammamap(band: np.ndarray, KERNEL_SIZE: int) -> np.ndarray:
+    enl = 5
+    z, ci, _ = window_stats(band, KERNEL_SIZE)
+    # noise coefficient of variation (or noise sigma)
+    cu = 1.0 / math.sqrt(enl)
+    # threshold for the observed coefficient of variation
+    cmax = math.sqrt(2.0) * cu
+
+    # in place in the type of the statistics, the variance becomes ci
+    alpha = scratch.buffer("gamma_alpha", band.shape, z.dtype)
+    rHat = scratch.buffer("gamma_rhat", band.shape, z.dtype)
+    q = scratch.buffer("gamma_q", band.shape, z.dtype)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # local observed coefficient of variation
+        np.sqrt(ci, out=ci)
+        ci /= z
+        ci[z == 0] = np.nan
+
+        # alpha = (1 + cu**2) / (ci**2 - cu**2)
+        np.multiply(ci, ci, out=alpha)
+        alpha -= cu**2
+        zero = alpha == 0
+        np.divide(1 + cu**2, alpha, out=alpha)
+        alpha[zero] = np.nan
+
+        # Implements the Gamma MAP filter described in equation 11 in Lopez et al. 1990
+        # q = z**2 * (z * alpha - enl - 1) ** 2 + 4 * alpha * enl * band * z
+        np.multiply(z, alpha, out=q)
+        q -= enl + 1
+        q *= q
+        q *= z
+        q *= z
+        np.multiply(alpha, band, out=rHat)
+        rHat *= z
+        rHat *= 4 * enl
+        q += rHat
+        np.sqrt(q, out=q)
+        # rHat = (z * (alpha - enl - 1) + sqrt(q)) / (2 * alpha)
+        np.subtract(alpha, enl + 1, out=rHat)
+        rHat *= z
+        rHat += q
+        rHat /= alpha
+        rHat /= 2
+        rHat[alpha == 0] = np.nan
+
+        # homogenous region ->> boxcar, textured medium ->> Gamma MAP, strong signal ->> retain
+        # written over the mean, which is kept where ci <= cu
+        np.copyto(z, rHat, where=(ci > cu) & (ci < cmax))
+        np.copyto(z, band, where=ci >= cmax)
+        z[np.isnan(ci)] = np.nan
+    return z
+
+
+def _row_blocks(rows: int, block_rows: int, halo: int):
+    """
+    Split the rows of a scene into blocks read with a halo.
+
+    Parameters
+    ----------
+    rows : int
+        Number of rows of the scene
+    block_rows : int
+        Number of rows of each block
+    halo : int
+        Number of rows read on each side of a block
+
+    Yields
+    ------
+    tuple[slice, slice]
+        Rows written by the block and rows read for it, relative to the read rows
+
+    """
+    for r0 in range(0, rows, block_rows):
+        r1 = min(r0 + block_rows, rows)
+        a0 = max(r0 - halo, 0)
+        yield slice(r0, r1), slice(a0, min(r1 + halo, rows)), slice(r0 - a0, r1 - a0)
+
+
+# Offsets of the 3x3 windows sampled inside the 7x7 window, in neighborhoodToBands order
+_SAMPLE_OFFSETS = [(2 * (k // 3) - 2, 2 * (k % 3) - 2) for k in range(9)]
+# Samples whose difference gives each of the 4 gradients
+_GRADIENT_PAIRS = [(1, 7), (6, 2), (3, 5), (0, 8)]
+
+
+def _directional_segments() -> list[list[tuple[int, int, int]]]:
+    """
+    Row runs of the 8 directional 7x7 kernels of Refined Lee, direction 1 first.
+
+    Returns
+    -------
+    list[list[tuple[int, int, int]]]
+        ``kernel_segments`` of each directional kernel
+
+    """
+    rect = np.zeros((7, 7), dtype=bool)
+    rect[3:] = True
+    diag = np.tril(np.ones((7, 7), dtype=bool))
+    kernels = []
+    for i in range(4):
+        # ee.Kernel.rotate turns clockwise
+        kernels += [np.rot90(rect, -i), np.rot90(diag, -i)]
+    return [kernel_segments(kernel) for kernel in kernels]
+
+
+_SEGMENTS_3x3 = kernel_segments(np.ones((3, 3), dtype=bool))
+_SEGMENTS_DIRECTIONS = _directional_segments()
+# Kernel half width of Refined Lee, i.e. the halo needed by a block of rows
+REFINED_LEE_HALO = 3
+
+
+def _refined_lee_block(x: np.ndarray) -> np.ndarray:
+    """
+    Refined Lee on one block of rows.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        2-D block in linear scale, including the halo rows
+
+    Returns
+    -------
+    np.ndarray
+        Filtered block
+
+    """
+    rows, cols = x.shape
+    pad = REFINED_LEE_HALO
+    # one set of cumulative sums serves the 3x3 and the directional statistics
+    cs = row_cumsums(x, pad)
+    invalid = ~np.isfinite(x)
+
+    mean3, var3, _ = kernel_stats(cs, pad, _SEGMENTS_3x3)
+    mean3[invalid] = np.nan
+    var3[invalid] = np.nan
+
+    # the 9 sampled windows are strided views, no band is materialised per neighbour
+    mean_p = np.pad(mean3, 2, constant_values=np.nan)
+    var_p = np.pad(var3, 2, constant_values=np.nan)
+    sample_mean = [
+        mean_p[2 + dy : 2 + dy + rows, 2 + dx : 2 + dx + cols] for dy, dx in _SAMPLE_OFFSETS
+    ]
+    sample_var = [
+        var_p[2 + dy : 2 + dy + rows, 2 + dx : 2 + dx + cols] for dy, dx in _SAMPLE_OFFSETS
+    ]
+
+    # Determine the 4 gradients and the maximum one
+    gradients = [np.abs(sample_mean[a] - sample_mean[b]) for a, b in _GRADIENT_PAIRS]
+    max_gradient = np.maximum.reduce(gradients)
+
+    # Determine the 8 directions. As in the Earth Engine version, the directions of
+    # tied gradients are summed.
+    centre = sample_mean[4]
+    directions = np.zeros((rows, cols), dtype=np.int8)
+    for i, (a, b) in enumerate(_GRADIENT_PAIRS):
+        step = np.where(sample_mean[a] - centre > centre - sample_mean[b], i + 1, i + 5)
+        directions += np.where(gradients[i] == max_gradient, step, 0).astype(np.int8)
+
+    # Calculate localNoiseVariance
+    sample_stats = np.stack(
+        [_divide(v, m * m) for m, v in zip(sample_mean, sample_var, strict=True)]
+    )
+    sigmaV = np.partition(sample_stats, 4, axis=0)[:5].mean(axis=0)
+    sigmaV[np.isnan(sample_stats).any(axis=0)] = np.nan
+    del sample_stats
+
+    # Directional statistics, only evaluated for the pixels facing each direction
+    dir_mean = np.full((rows, cols), np.nan)
+    dir_var = np.full((rows, cols), np.nan)
+    for direction, segments in enumerate(_SEGMENTS_DIRECTIONS, start=1):
+        ii, jj = np.nonzero(directions == direction)
+        dir_mean[ii, jj], dir_var[ii, jj], _ = kernel_stats(cs, pad, segments, ii, jj)
+    dir_mean[invalid] = np.nan
+
+    # A finally generate the filtered value
+    varX = (dir_var - dir_mean * dir_mean * sigmaV) / (sigmaV + 1.0)
+    b = _divide(varX, dir_var)
+    return dir_mean + b * (x - dir_mean)
+
+
+def _refined_lee(band: np.ndarray, block_rows: int) -> np.ndarray:
+    output = np.empty(band.shape, dtype=np.result_type(band.dtype, np.float32))
+    for write, read, inner in _row_blocks(band.shape[0], block_rows, REFINED_LEE_HALO):
+        output[write] = _refined_lee_block(band[read])[inner]
+    return output
+
+
+# Lookup table (J.S.Lee et al 2009) for range and eta values for intensity (4 looks)
+_LEE_SIGMA_LUT = {
+    0.5: {"I1": 0.694, "I2": 1.385, "eta": 0.1921},
+    0.6: {"I1": 0.630, "I2": 1.495, "eta": 0.2348},
+    0.7: {"I1": 0.560, "I2": 1.627, "eta": 0.2825},
+    0.8: {"I1": 0.480, "I2": 1.804, "eta": 0.3354},
+    0.9: {"I1": 0.378, "I2": 2.094, "eta": 0.3991},
+    0.95: {"I1": 0.302, "I2": 2.360, "eta": 0.4391},
+}
+
+
+def _leesigma_block(x: np.ndarray, KERNEL_SIZE: int, z98: float) -> np.ndarray:
+    """
+    Lee Sigma on one block of rows: both MMSE passes read the block once.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        2-D block in linear scale, including the halo rows
+    KERNEL_SIZE : int
+        Neighbourhood window size. Positive odd integer.
+    z98 : float
+        98th percentile of the band over the scene
+
+    Returns
+    -------
+    np.ndarray
+        Filtered block
+
+    """
+    # parameters
+    Tk = 7  # number of bright pixels in a 3x3 window
+    sigma = 0.9
+    enl = 4
+    target_kernel = 3
+
+    # select the strong scatterers to retain. K mirrors countDistinctNonNull, i.e.
+    # the number of distinct values (bright / not bright) in the 3x3 window
+    valid = np.isfinite(x)
+    with np.errstate(invalid="ignore"):
+        brightPixel = x >= z98
+    nbright = box_sum(brightPixel, half_width(target_kernel))
+    nvalid = box_sum(valid, half_width(target_kernel))
+    K = (nbright > 0).astype(np.int8) + (nvalid - nbright > 0)
+    retainPixel = (Tk <= K) & valid
+
+    # MMSE applied to estimate the apriori mean within a 3x3 local window
+    eta = 1.0 / math.sqrt(enl)
+    z_bar, varz, _ = window_stats(x, target_kernel)
+    varx = (varz - np.abs(z_bar) ** 2 * eta**2) / (1 + eta**2)
+    b = _divide(varx, varz)
+    xTilde = (1 - b) * np.abs(z_bar) + b * x
+
+    # step 3: compute the sigma range
+    lut = _LEE_SIGMA_LUT[sigma]
+    I1 = lut["I1"] * xTilde
+    I2 = lut["I2"] * xTilde
+    nEta = lut["eta"]
+
+    # step 3: apply MMSE filter for pixels in the sigma range
+    with np.errstate(invalid="ignore"):
+        mask = (x >= I1) | (x <= I2)
+    z = np.where(mask, x, np.nan)
+    z_bar, varz, _ = window_stats(z, KERNEL_SIZE)
+    varx = (varz - np.abs(z_bar) ** 2 * nEta**2) / (1 + nEta**2)
+    b = _divide(varx, varz)
+    # if b is negative set it to zero
+    b[b < 0] = 0
+    xHat = (1 - b) * np.abs(z_bar) + b * z
+
+    # merge the retained pixels and the filtered pixels
+    return np.where(retainPixel, x, xHat)
+
+
+def _apply(
+    image: np.ndarray,
+    bandNames: Sequence[str] | None,
+    out: np.ndarray | None,
+    band_filter,
+    *args,
+) -> np.ndarray:
+    """
+    Run a single band filter over all bands but "angle".
+
+    Parameters
+    ----------
+    image : np.ndarray
+        2-D or (bands, rows, cols) image
+    bandNames : Sequence[str] | None
+        Names of the bands of the image
+    out : np.ndarray | None
+        Array the output is written into, see ``_bands.output_into``
+    band_filter : Callable
+        Filter applied to each 2-D band
+    *args
+        Extra arguments of ``band_filter``
+
+    Returns
+    -------
+    np.ndarray
+        Filtered image with the layout of the input
+
+    """
+    stack, squeeze = as_stack(image)
+    output = output_into(stack, None if out is None else as_stack(out)[0])
+    for i in filter_bands(bandNames, stack.shape[0]):
+        output[i] = band_filter(output[i], *args)
+    return output[0] if squeeze else output
+
+
+def boxcar(
+    image: np.ndarray,
+    KERNEL_SIZE: int,
+    bandNames: Sequence[str] | None = None,
+    out: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    Apply boxcar filter to one image.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image to be filtered, 2-D or (bands, rows, cols)
+    KERNEL_SIZE : int
+        Neighbourhood window size. Positive odd integer.
+    bandNames : Sequence[str] | None
+        Names of the bands of the image; an "angle" band is left unfiltered
+    out : np.ndarray | None
+        Array the output is written into, e.g. the image itself to filter it in
+        place; a new array if None
+
+    Returns
+    -------
+    np.ndarray
+        Filtered Image
+
+    """
+    return _apply(image, bandNames, out, _boxcar, KERNEL_SIZE)
+
+
+def leefilter(
+    image: np.ndarray,
+    KERNEL_SIZE: int,
+    bandNames: Sequence[str] | None = None,
+    out: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    Lee Filter applied to one image.
+    It is implemented as described in
+    J. S. Lee, “Digital image enhancement and noise filtering by use of local statistics,”
+    IEEE Pattern Anal. Machine Intell., vol. PAMI-2, pp. 165–168, Mar. 1980.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image to be filtered, 2-D or (bands, rows, cols)
+    KERNEL_SIZE : int
+        Neighbourhood window size. Positive odd integer.
+    bandNames : Sequence[str] | None
+        Names of the bands of the image; an "angle" band is left unfiltered
+    out : np.ndarray | None
+        Array the output is written into, e.g. the image itself to filter it in
+        place; a new array if None
+
+    Returns
+    -------
+    np.ndarray
+        Filtered Image
+
+    """
+    return _apply(image, bandNames, out, _lee, KERNEL_SIZE)
+
+
+def gammamap(
+    image: np.ndarray,
+    KERNEL_SIZE: int,
+    bandNames: Sequence[str] | None = None,
+    out: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    Gamma Maximum a-posterior Filter applied to one image. It is implemented as described in
+    Lopes A., Nezry, E., Touzi, R., and Laur, H., 1990.
+    Maximum A Posteriori Speckle Filtering and First Order texture Models in SAR Images.
+    International  Geoscience  and  Remote  Sensing  Symposium (IGARSS).
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image to be filtered, 2-D or (bands, rows, cols)
+    KERNEL_SIZE : int
+        Neighbourhood window size. Positive odd integer.
+    bandNames : Sequence[str] | None
+        Names of the bands of the image; an "angle" band is left unfiltered
+    out : np.ndarray | None
+        Array the output is written into, e.g. the image itself to filter it in
+        place; a new array if None
+
+    Returns
+    -------
+    np.ndarray
+        Filtered Image
+
+    """
+    return _apply(image, bandNames, out, _gammamap, KERNEL_SIZE)
+
+
+def RefinedLee(
+    image: np.ndarray,
+    bandNames: Sequence[str] | None = None,
+    block_rows: int = 256,
+    out: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    Refined Lee filter applied to one image, following the Earth Engine
+    implementation modified from Guido Lemoine.
+
+    The image is processed in blocks of ``block_rows`` rows plus a 3 pixel halo, so
+    memory is bounded by the block size. The 3x3 and directional statistics of a
+    block share one set of row cumulative sums and the 9 sampled 3x3 windows are
+    strided views, so there is no per-neighbour band expansion. As in Earth Engine,
+    pixels whose sampled windows hold masked pixels are masked.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image to be filtered, 2-D or (bands, rows, cols), in linear scale
+    bandNames : Sequence[str] | None
+        Names of the bands of the image; an "angle" band is left unfiltered
+    block_rows : int
+        Number of rows processed at once
+    out : np.ndarray | None
+        Array the output is written into, e.g. the image itself to filter it in
+        place; a new array if None
+
+    Returns
+    -------
+    np.ndarray
+        Filtered Image
+
+    """
+    if block_rows <= 0:
+        raise ValueError("ERROR!!! block_rows not correctly defined")
+    return _apply(image, bandNames, out, _refined_lee, block_rows)
+
+
+def percentile_98(
+    image: np.ndarray, bandNames: Sequence[str] | None = None, block_rows: int = 256
+) -> np.ndarray:
+    """
+    Approximate 98th percentile of each filtered band, computed in a single pass.
+
+    The scene is read block by block into fixed size dB histograms, see
+    ``gee_s1_processing.local.percentile`` for the accuracy.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        2-D or (bands, rows, cols) image in linear scale
+    bandNames : Sequence[str] | None
+        Names of the bands of the image; no percentile is computed for "angle"
+    block_rows : int
+        Number of rows read at once
+
+    Returns
+    -------
+    np.ndarray
+        One value per band, NaN for the "angle" band
+
+    """
+    stack, _ = as_stack(image)
+    bands = filter_bands(bandNames, stack.shape[0])
+    histogram = StreamingPercentile(len(bands))
+    for r0 in range(0, stack.shape[1], block_rows):
+        histogram.update(stack[bands, r0 : r0 + block_rows])
+    z98 = np.full(stack.shape[0], np.nan)
+    z98[bands] = histogram.percentile(98)
+    return z98
+
+
+def leesigma(
+    image: np.ndarray,
+    KERNEL_SIZE: int,
+    bandNames: Sequence[str] | None = None,
+    z98: Sequence[float] | None = None,
+    block_rows: int = 256,
+    out: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    Implements the improved lee sigma filter to one image.
+    It is implemented as described in, Lee, J.-S. Wen, J.-H. Ainsworth, T.L. Chen, K.-S. Chen, A.J.
+    Improved sigma filter for speckle filtering of SAR imagery.
+    IEEE Trans. Geosci. Remote Sens. 2009, 47, 202–213.
+
+    The 98th percentile is taken from ``z98`` or, when not given, from a single
+    pass histogram (``percentile_98``) instead of an exact full scene reduction.
+    The filter then reads each block of rows once, with a halo of
+    KERNEL_SIZE // 2 + 1 rows, and computes both the 3x3 a-priori mean and the
+    sigma range MMSE estimate from it.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image to be filtered, 2-D or (bands, rows, cols), in linear scale
+    KERNEL_SIZE : int
+        Neighbourhood window size. Positive odd integer.
+    bandNames : Sequence[str] | None
+        Names of the bands of the image; an "angle" band is left unfiltered
+    z98 : Sequence[float] | None
+        98th percentile of each band, as returned by ``percentile_98``
+    block_rows : int
+        Number of rows processed at once
+    out : np.ndarray | None
+        Array the output is written into, e.g. the image itself to filter it in
+        place; a new array if None
+
+    Returns
+    -------
+    np.ndarray
+        Filtered Image
+
+    """
+    if block_rows <= 0:
+        raise ValueError("ERROR!!! block_rows not correctly defined")
+    stack, squeeze = as_stack(image)
+    if z98 is None:
+        z98 = percentile_98(stack, bandNames, block_rows)
+    halo = half_width(KERNEL_SIZE) + 1
+    output = output_into(stack, None if out is None else as_stack(out)[0])
+    for i in filter_bands(bandNames, stack.shape[0]):
+        # the halo rows of the next block are read from the unfiltered band
+        band = stack[i].copy() if np.shares_memory(output, stack) else stack[i]
+        for write, read, inner in _row_blocks(stack.shape[1], block_rows, halo):
+            output[i, write] = _leesigma_block(band[read], KERNEL_SIZE, z98[i])[inner]
+    return output[0] if squeeze else output
+
+
+def spatial_filter(
+    image: np.ndarray,
+    KERNEL_SIZE: int,
+    SPECKLE_FILTER: str,
+    bandNames: Sequence[str] | None = None,
+    out: np.ndarray | None = None,
+    z98: Sequence[float] | None = None,
+) -> np.ndarray:
+    """
+    Apply the speckle filter named as in the wrappers to one image.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image to be filtered, 2-D or (bands, rows, cols), in linear scale
+    KERNEL_SIZE : int
+        Spatial Neighbourhood window. Positive odd integer.
+    SPECKLE_FILTER : str
+        Type of speckle filter
+    bandNames : Sequence[str] | None
+        Names of the bands of the image; an "angle" band is left unfiltered
+    out : np.ndarray | None
+        Array the output is written into, e.g. the image itself to filter it in
+        place; a new array if None
+    z98 : Sequence[float] | None
+        98th percentile of each band for the "LEE SIGMA" filter, see ``leesigma``
+
+    Returns
+    -------
+    np.ndarray
+        Filtered Image
+
+    """
+    if SPECKLE_FILTER == "BOXCAR":
+        return boxcar(image, KERNEL_SIZE, bandNames, out)
+    if SPECKLE_FILTER == "LEE":
+        return leefilter(image, KERNEL_SIZE, bandNames, out)
+    if SPECKLE_FILTER == "GAMMA MAP":
+        return gammamap(image, KERNEL_SIZE, bandNames, out)
+    if SPECKLE_FILTER == "REFINED LEE":
+        return RefinedLee(image, bandNames, out=out)
+    if SPECKLE_FILTER == "LEE SIGMA":
+        return leesigma(image, KERNEL_SIZE, bandNames, z98, out=out)
+    raise ValueError("ERROR!!! SPECKLE_FILTER not correctly defined")
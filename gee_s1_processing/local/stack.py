@@ -0,0 +1,390 @@
+"""
+Description: Memory-mapped multi-temporal stacks of co-registered scenes.
+
+A stack is a directory with a (time, band, row, col) ``stack.npy`` array and an
+``index.json`` sidecar holding the band names and the date, relative orbit and
+polarisations of each scene. ``Stack.open`` maps the array without reading it:
+``Stack.window`` and ``Stack.scenes`` return views of a spatial window of the
+scenes, so only the pages of that window are read from disk, and
+``stack_filter`` feeds the multi-temporal filter with the time slices the
+selected scenes depend on.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from .multitemporal import QueganStream
+from .tiling import speckle_filter_halo
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator, Sequence
+
+STACK_FILE = "stack.npy"
+INDEX_FILE = "index.json"
+
+
+@dataclass(frozen=True)
+class SceneMetadata:
+    """
+    Metadata of one scene of a stack.
+
+    Parameters
+    ----------
+    date : str
+        ISO 8601 acquisition time, e.g. "2022-01-03T17:45:12"
+    relativeOrbit : int
+        Relative orbit number
+    polarisation : tuple[str, ...]
+        Polarisations acquired, the other bands of the scene are NaN
+
+    """
+
+    date: str
+    relativeOrbit: int
+    polarisation: tuple[str, ...]
+
+
+class Stack:
+    """
+    Time series of co-registered scenes stored as a memory-mapped array.
+
+    Parameters
+    ----------
+    directory : str | Path
+        Directory of the stack
+    data : np.ndarray
+        (time, band, row, col) memory-mapped array
+    bandNames : Sequence[str]
+        Names of the bands
+    scenes : Sequence[SceneMetadata | None]
+        Metadata of each time slice, None if it is not written yet
+
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        data: np.ndarray,
+        bandNames: Sequence[str],
+        scenes: Sequence[SceneMetadata | None],
+    ):
+        if len(bandNames) != data.shape[1] or len(scenes) != data.shape[0]:
+            raise ValueError("ERROR!!! the index does not match the stack")
+        self.directory = Path(directory)
+        self.data = data
+        self.bandNames = list(bandNames)
+        self.metadata = list(scenes)
+
+    @classmethod
+    def create(
+        cls,
+        directory: str | Path,
+        n_scenes: int,
+        bandNames: Sequence[str],
+        shape: tuple[int, int],
+        dtype: np.dtype | type = np.float32,
+    ) -> Stack:
+        """
+        Create an empty stack, filled with ``write``.
+
+        Parameters
+        ----------
+        directory : str | Path
+            Directory of the stack, created if needed
+        n_scenes : int
+            Number of scenes
+        bandNames : Sequence[str]
+            Names of the bands of the scenes
+        shape : tuple[int, int]
+            Number of rows and columns of the scenes
+        dtype : np.dtype | type
+            Data type of the array
+
+        Returns
+        -------
+        Stack
+            The writable stack
+
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        data = np.lib.format.open_memmap(
+            directory / STACK_FILE, "w+", dtype, (n_scenes, len(bandNames), *shape)
+        )
+        stack = cls(directory, data, bandNames, [None] * n_scenes)
+        stack._save_index()
+        return stack
+
+    @classmethod
+    def open(cls, directory: str | Path, mode: str = "r") -> Stack:
+        """
+        Map an existing stack.
+
+        Parameters
+        ----------
+        directory : str | Path
+            Directory of the stack
+        mode : str
+            "r" for read-only, "r+" to write scenes
+
+        Returns
+        -------
+        Stack
+            The stack, no data is read until it is accessed
+
+        """
+        if mode not in ["r", "r+"]:
+            raise ValueError("ERROR!!! mode not correctly defined")
+        directory = Path(directory)
+        index = json.loads((directory / INDEX_FILE).read_text())
+        scenes = [
+            None
+            if scene is None
+            else SceneMetadata(scene["date"], scene["relativeOrbit"], tuple(scene["polarisation"]))
+            for scene in index["scenes"]
+        ]
+        data = np.load(directory / STACK_FILE, mmap_mode=mode)
+        return cls(directory, data, index["bandNames"], scenes)
+
+    def _save_index(self) -> None:
+        index = {
+            "version": 1,
+            "bandNames": self.bandNames,
+            "scenes": [None if scene is None else asdict(scene) for scene in self.metadata],
+        }
+        # write then rename, so that readers never see a partial index
+        path = self.directory / INDEX_FILE
+        tmp = path.with_name(f"{INDEX_FILE}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(index, indent=1))
+        tmp.replace(path)
+
+    def write(self, t: int, image: np.ndarray, metadata: SceneMetadata) -> None:
+        """
+        Write one scene.
+
+        Parameters
+        ----------
+        t : int
+            Time index of the scene
+        image : np.ndarray
+            (band, row, col) scene
+        metadata : SceneMetadata
+            Metadata of the scene
+
+        """
+        self.data[t] = image
+        self.metadata[t] = metadata
+
+    def flush(self) -> None:
+        """Write the scenes and the index to disk."""
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
+        self._save_index()
+
+    def select(
+        self,
+        relativeOrbit: int | None = None,
+        start: str | None = None,
+        end: str | None = None,
+    ) -> list[int]:
+        """
+        Time indices of the scenes matching the metadata, in acquisition order.
+
+        Parameters
+        ----------
+        relativeOrbit : int | None
+            Relative orbit of the scenes, all if None
+        start : str | None
+            First ISO 8601 date, inclusive
+        end : str | None
+            Last ISO 8601 date, exclusive
+
+        Returns
+        -------
+        list[int]
+            Indices of the written scenes sorted by date
+
+        """
+        times = [
+            t
+            for t, scene in enumerate(self.metadata)
+            if scene is not None
+            and (relativeOrbit is None or scene.relativeOrbit == relativeOrbit)
+            and (start is None or scene.date >= start)
+            and (end is None or scene.date < end)
+        ]
+        return sorted(times, key=lambda t: self.metadata[t].date)
+
+    def window(self, t: int, rows: slice = slice(None), cols: slice = slice(None)) -> np.ndarray:
+        """
+        Spatial window of one scene, without copy.
+
+        Parameters
+        ----------
+        t : int
+            Time index of the scene
+        rows : slice
+            Rows of the window
+        cols : slice
+            Columns of the window
+
+        Returns
+        -------
+        np.ndarray
+            (band, row, col) view of the stack
+
+        """
+        return self.data[t, :, rows, cols]
+
+    def scenes(
+        self,
+        times: Sequence[int] | None = None,
+        rows: slice = slice(None),
+        cols: slice = slice(None),
+    ) -> Iterator[tuple[int, int, np.ndarray]]:
+        """
+        Spatial window of a series of scenes, in the input format of the local
+        ``multitemporal.MultiTemporal_Filter``.
+
+        Parameters
+        ----------
+        times : Sequence[int] | None
+            Time indices of the scenes, all the written scenes if None
+        rows : slice
+            Rows of the window
+        cols : slice
+            Columns of the window
+
+        Yields
+        ------
+        tuple[int, int, np.ndarray]
+            (time index, relative orbit, view of the window) of each scene
+
+        """
+        for t in self.select() if times is None else times:
+            yield t, self.metadata[t].relativeOrbit, self.window(t, rows, cols)
+
+
+def temporal_neighbours(stack: Stack, times: Sequence[int], NR_OF_IMAGES: int) -> list[int]:
+    """
+    Scenes the multi-temporal filter of a set of scenes depends on.
+
+    Parameters
+    ----------
+    stack : Stack
+        The stack
+    times : Sequence[int]
+        Time indices of the filtered scenes
+    NR_OF_IMAGES : int
+        Number of images to use in multi-temporal filtering. Positive integer.
+
+    Returns
+    -------
+    list[int]
+        Time indices, in acquisition order, of the scenes and of the previous
+        NR_OF_IMAGES - 1 acquisitions of their orbit, or of the first
+        NR_OF_IMAGES acquisitions at the start of the orbit
+
+    """
+    needed = set()
+    orbits: dict[int, list[int]] = {}
+    for t in stack.select():
+        orbits.setdefault(stack.metadata[t].relativeOrbit, []).append(t)
+    for t in times:
+        orbit = orbits[stack.metadata[t].relativeOrbit]
+        rank = orbit.index(t)
+        first = rank + 1 - NR_OF_IMAGES
+        needed.update(orbit[first : rank + 1] if first >= 0 else orbit[:NR_OF_IMAGES])
+    return sorted(needed, key=lambda t: stack.metadata[t].date)
+
+
+def stack_filter(
+    stack: Stack,
+    KERNEL_SIZE: int,
+    SPECKLE_FILTER: str,
+    NR_OF_IMAGES: int,
+    times: Sequence[int] | None = None,
+    rows: slice = slice(None),
+    cols: slice = slice(None),
+) -> Iterator[tuple[int, np.ndarray]]:
+    """
+    Multi-temporal filter of a spatial window of the scenes of a stack.
+
+    Only the window of the scenes the filtered ones depend on is read, see
+    ``temporal_neighbours``, widened by the halo of the speckle filter and
+    clipped at the scene edges as the tiles of ``tiling.tiles``; the result is
+    the window of the filter run over the whole series and the whole scenes.
+
+    Parameters
+    ----------
+    stack : Stack
+        The stack
+    KERNEL_SIZE : int
+        Spatial Neighbourhood window. Positive odd integer.
+    SPECKLE_FILTER : str
+        Type of speckle filter
+    NR_OF_IMAGES : int
+        Number of images to use in multi-temporal filtering. Positive integer.
+    times : Sequence[int] | None
+        Time indices of the scenes to filter, e.g. from ``Stack.select``; all
+        the written scenes if None
+    rows : slice
+        Rows of the window
+    cols : slice
+        Columns of the window
+
+    Yields
+    ------
+    tuple[int, np.ndarray]
+        (time index, filtered window), in the order the scenes become available
+
+    """
+    times = stack.select() if times is None else times
+    selected = set(times)
+    halo = speckle_filter_halo(SPECKLE_FILTER, KERNEL_SIZE)
+    read_rows, inner_rows = _halo_window(rows, stack.data.shape[2], halo)
+    read_cols, inner_cols = _halo_window(cols, stack.data.shape[3], halo)
+    stream = QueganStream(KERNEL_SIZE, SPECKLE_FILTER, NR_OF_IMAGES, stack.bandNames)
+    for t, relativeOrbit, image in stack.scenes(
+        temporal_neighbours(stack, times, NR_OF_IMAGES), read_rows, read_cols
+    ):
+        for key, filtered in stream.push(image, relativeOrbit, t):
+            if key in selected:
+                yield key, filtered[..., inner_rows, inner_cols]
+    for key, filtered in stream.flush():
+        if key in selected:
+            yield key, filtered[..., inner_rows, inner_cols]
+
+
+def _halo_window(window: slice, n: int, halo: int) -> tuple[slice, slice]:
+    """
+    Window read with a halo along one axis.
+
+    Parameters
+    ----------
+    window : slice
+        Window of the axis, with a step of 1
+    n : int
+        Length of the axis
+    halo : int
+        Number of pixels read on each side of the window, clipped at the edges
+
+    Returns
+    -------
+    tuple[slice, slice]
+        Slice read along the axis, and slice of the window in the read one
+
+    """
+    start, stop, step = window.indices(n)
+    if step != 1:
+        raise ValueError("ERROR!!! window not correctly defined")
+    stop = max(start, stop)
+    read = slice(max(start - halo, 0), min(stop + halo, n))
+    return read, slice(start - read.start, stop - read.start)
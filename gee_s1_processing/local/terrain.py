@@ -0,0 +1,122 @@
+"""
+Description: NumPy versions of the terrain operators used by
+gee_s1_processing.terrain_flattening: ``ee.Terrain.slope``, ``ee.Terrain.aspect``
+and ``ee.Image.fastDistanceTransform``.
+
+Rasters are 2-D arrays on a square grid, masked pixels are NaN. As in Earth
+Engine, the gradients use the 4-connected neighbours of each pixel, so the
+outer rows and columns are masked.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+
+def gradients(dem: np.ndarray, pixel_size: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Eastward and northward elevation gradients, by central differences.
+
+    Parameters
+    ----------
+    dem : np.ndarray
+        2-D elevation, north up
+    pixel_size : float
+        Pixel spacing in the units of the elevation
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        dz/dx (east) and dz/dy (north), NaN on the edges
+
+    """
+    dzdx = np.full(dem.shape, np.nan)
+    dzdy = np.full(dem.shape, np.nan)
+    dzdx[1:-1, 1:-1] = (dem[1:-1, 2:] - dem[1:-1, :-2]) / (2 * pixel_size)
+    # rows run southwards
+    dzdy[1:-1, 1:-1] = (dem[:-2, 1:-1] - dem[2:, 1:-1]) / (2 * pixel_size)
+    return dzdx, dzdy
+
+
+def slope(dem: np.ndarray, pixel_size: float) -> np.ndarray:
+    """
+    Terrain slope in degrees.
+
+    Parameters
+    ----------
+    dem : np.ndarray
+        2-D elevation, north up
+    pixel_size : float
+        Pixel spacing in the units of the elevation
+
+    Returns
+    -------
+    np.ndarray
+        Slope in [0, 90)
+
+    """
+    dzdx, dzdy = gradients(dem, pixel_size)
+    return np.degrees(np.arctan(np.hypot(dzdx, dzdy)))
+
+
+def aspect(dem: np.ndarray, pixel_size: float) -> np.ndarray:
+    """
+    Terrain aspect in degrees: direction the slope faces, clockwise from north.
+
+    Parameters
+    ----------
+    dem : np.ndarray
+        2-D elevation, north up
+    pixel_size : float
+        Pixel spacing in the units of the elevation
+
+    Returns
+    -------
+    np.ndarray
+        Aspect in [0, 360), 0 on flat terrain
+
+    """
+    dzdx, dzdy = gradients(dem, pixel_size)
+    # + 0.0 turns -0.0 into 0.0, so that flat terrain faces north
+    return np.degrees(np.arctan2(-dzdx + 0.0, -dzdy + 0.0)) % 360
+
+
+def fast_distance_transform(features: np.ndarray, neighborhood: int) -> np.ndarray:
+    """
+    Squared euclidean distance in pixels to the nearest feature pixel.
+
+    The distance is separable: the distance along the rows is computed first,
+    then combined along the columns, each pass within ``neighborhood`` pixels.
+
+    Parameters
+    ----------
+    features : np.ndarray
+        2-D boolean array of the feature pixels
+    neighborhood : int
+        Search distance in pixels
+
+    Returns
+    -------
+    np.ndarray
+        float32 squared distance, exact as the squared distances are integers;
+        pixels without a feature in the neighbourhood get
+        ``2 * neighborhood ** 2 + 1``, more than any distance inside it
+
+    """
+    features = np.asarray(features, dtype=bool)
+    rows, cols = features.shape
+    # distance along the rows
+    dx = np.where(features, np.float32(0), np.float32(np.inf))
+    for d in range(1, min(neighborhood, cols - 1) + 1):
+        hit = np.zeros(features.shape, dtype=bool)
+        hit[:, d:] |= features[:, :-d]
+        hit[:, :-d] |= features[:, d:]
+        dx[hit & (dx > d)] = d
+    dx2 = np.multiply(dx, dx, out=dx)
+    # combined along the columns
+    distance = dx2.copy()
+    for d in range(1, min(neighborhood, rows - 1) + 1):
+        np.minimum(distance[d:], dx2[:-d] + d * d, out=distance[d:])
+        np.minimum(distance[:-d], dx2[d:] + d * d, out=distance[:-d])
+    distance[~np.isfinite(distance)] = 2 * neighborhood**2 + 1
+    return distance
@@ -0,0 +1,291 @@
+"""
+Description: NumPy version of the angular-based radiometric slope correction of
+gee_s1_processing.terrain_flattening, for in-memory arrays.
+
+Vollrath, A., Mullissa, A., & Reiche, J. (2020).
+Angular-Based Radiometric Slope Correction for Sentinel-1 on Google Earth Engine.
+Remote Sensing, 12(11), [1867]. https://doi.org/10.3390/rs12111867
+
+Images are (bands, rows, cols) stacks with an "angle" band, on the grid of the
+DEM, masked pixels are NaN. The slope and aspect of the DEM (the terrain
+geometry) do not depend on the scene: ``TerrainGeometryCache`` keeps them on
+disk for each DEM, projection and footprint, so that the scenes of a relative
+orbit only compute the angle dependent parts.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from . import scratch, terrain
+from ._bands import as_stack, filter_bands, output_into
+from .speckle_filter import _row_blocks
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Sequence
+
+# search distance in pixels of the layover and shadow buffer, as fastDistanceTransform(30)
+EROSION_NEIGHBORHOOD = 30
+
+
+def terrain_geometry(dem: np.ndarray, pixel_size: float) -> np.ndarray:
+    """
+    Scene independent terrain geometry.
+
+    Parameters
+    ----------
+    dem : np.ndarray
+        2-D elevation on the grid of the scenes, north up
+    pixel_size : float
+        Pixel spacing in meters
+
+    Returns
+    -------
+    np.ndarray
+        (2, rows, cols) slope steepness (alpha_s) and slope aspect (phi_s) in
+        radians, the aspect counted anticlockwise in (-pi, pi]
+
+    """
+    alpha_sRad = np.radians(terrain.slope(dem, pixel_size))
+    aspect = terrain.aspect(dem, pixel_size)
+    # masked aspects give a zero angle, as the unmask() of the Earth Engine version
+    phi_s = np.where(aspect > 180, aspect - 360, np.nan_to_num(aspect))
+    return np.stack([alpha_sRad, -np.radians(phi_s)])
+
+
+class TerrainGeometryCache:
+    """
+    Terrain geometries stored as .npy files, keyed by DEM, projection and footprint.
+
+    Parameters
+    ----------
+    directory : str | Path
+        Directory of the cached arrays, created if needed
+
+    """
+
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(dem_id: str, crs: str, footprint: Sequence[float], pixel_size: float) -> str:
+        """
+        Cache key of a terrain geometry.
+
+        Parameters
+        ----------
+        dem_id : str
+            Identifier of the DEM, e.g. its asset id or path
+        crs : str
+            Coordinate reference system of the grid
+        footprint : Sequence[float]
+            Bounds of the grid in the crs
+        pixel_size : float
+            Pixel spacing in meters
+
+        Returns
+        -------
+        str
+            sha256 of the parameters
+
+        """
+        parameters = json.dumps([dem_id, crs, [float(x) for x in footprint], float(pixel_size)])
+        return hashlib.sha256(parameters.encode()).hexdigest()
+
+    def get(
+        self,
+        dem_id: str,
+        crs: str,
+        footprint: Sequence[float],
+        pixel_size: float,
+        load_dem: Callable[[], np.ndarray],
+    ) -> np.ndarray:
+        """
+        Cached terrain geometry, computed and stored on the first request.
+
+        Parameters
+        ----------
+        dem_id : str
+            Identifier of the DEM
+        crs : str
+            Coordinate reference system of the grid
+        footprint : Sequence[float]
+            Bounds of the grid in the crs
+        pixel_size : float
+            Pixel spacing in meters
+        load_dem : Callable[[], np.ndarray]
+            Returns the DEM on the grid, only called on a cache miss
+
+        Returns
+        -------
+        np.ndarray
+            (2, rows, cols) terrain geometry, see ``terrain_geometry``
+
+        """
+        path = self.directory / f"{self.key(dem_id, crs, footprint, pixel_size)}.npy"
+        if path.exists():
+            return np.load(path, mmap_mode="r")
+        geometry = terrain_geometry(load_dem(), pixel_size)
+        # write then rename, so that concurrent runs never read a partial file
+        tmp = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npy")
+        np.save(tmp, geometry)
+        tmp.replace(path)
+        return geometry
+
+
+def heading(angle: np.ndarray, pixel_size: float, block_rows: int = 1024) -> float:
+    """
+    Look direction of a scene, from the gradient of its incidence angle.
+
+    Parameters
+    ----------
+    angle : np.ndarray
+        2-D incidence angle in degrees
+    pixel_size : float
+        Pixel spacing in meters
+    block_rows : int
+        Number of rows of the aspect computed at once
+
+    Returns
+    -------
+    float
+        Mean aspect of the incidence angle in (-180, 180], 0 if it is masked
+
+    """
+    total, count = 0.0, 0
+    for _, read, inner in _row_blocks(angle.shape[0], block_rows, 1):
+        aspect = terrain.aspect(angle[read], pixel_size)[inner]
+        valid = np.isfinite(aspect)
+        total += float(aspect[valid].sum())
+        count += int(valid.sum())
+    if count == 0:
+        return 0.0
+    mean = total / count
+    return mean - 360 if mean > 180 else mean
+
+
+def _erode(mask: np.ndarray, distance: float, pixel_size: float) -> np.ndarray:
+    # distance in meters of the valid pixels to the masked ones
+    invalid = ~(mask > 0)
+    d = np.sqrt(terrain.fast_distance_transform(invalid, EROSION_NEIGHBORHOOD))
+    d *= pixel_size
+    return mask & (d > distance)
+
+
+def slope_correction(
+    image: np.ndarray,
+    bandNames: Sequence[str],
+    TERRAIN_FLATTENING_MODEL: str,
+    TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER: int,
+    dem: np.ndarray | None = None,
+    pixel_size: float = 10.0,
+    geometry: np.ndarray | None = None,
+    HEADING: float | None = None,
+    out: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    Radiometric terrain normalization of one scene.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        (bands, rows, cols) scene in linear scale
+    bandNames : Sequence[str]
+        Names of the bands of the image, including "angle"
+    TERRAIN_FLATTENING_MODEL : str
+        The radiometric terrain normalization model, either "VOLUME" or "DIRECT"
+    TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER : int
+        The additional buffer in meters to account for the passive layover and shadow
+    dem : np.ndarray | None
+        2-D elevation on the grid of the image, unused if ``geometry`` is given
+    pixel_size : float
+        Pixel spacing in meters
+    geometry : np.ndarray | None
+        Precomputed terrain geometry, e.g. from ``TerrainGeometryCache``
+    HEADING : float | None
+        Look direction in degrees, e.g. from ``heading.look_heading``; by
+        default it is estimated from the incidence angle
+    out : np.ndarray | None
+        Array the output is written into, e.g. the image itself to correct it in
+        place; a new array if None
+
+    Returns
+    -------
+    np.ndarray
+        Terrain normalized gamma0, layover and shadow masked, "angle" unchanged
+
+    """
+    if TERRAIN_FLATTENING_MODEL not in ["VOLUME", "DIRECT"]:
+        raise ValueError("ERROR!!! Parameter TERRAIN_FLATTENING_MODEL not correctly defined")
+    stack, _ = as_stack(image)
+    if "angle" not in bandNames:
+        raise ValueError("ERROR!!! the image has no angle band")
+    if geometry is None:
+        if dem is None:
+            raise ValueError("ERROR!!! dem or geometry must be given")
+        geometry = terrain_geometry(dem, pixel_size)
+    angle = stack[list(bandNames).index("angle")]
+    output = output_into(stack, out)
+    # the angles are computed in place in the type of the output, in work arrays
+    shape, dtype = angle.shape, output.dtype
+
+    # 2.1.1 Radar geometry
+    theta_iRad = np.radians(angle, out=scratch.buffer("theta_iRad", shape, dtype))
+    phi_iRad = math.radians(heading(angle, pixel_size) if HEADING is None else HEADING)
+    # complement of the incidence angle
+    theta_cRad = np.subtract(
+        math.pi / 2, theta_iRad, out=scratch.buffer("theta_cRad", shape, dtype)
+    )
+
+    # 2.1.2 Terrain geometry
+    alpha_sRad, phi_sRad = geometry[0], geometry[1]
+    tan_alpha_s = np.tan(alpha_sRad, out=scratch.buffer("work", shape, dtype))
+
+    # 2.1.3 Model geometry
+    phi_rRad = np.subtract(phi_iRad, phi_sRad, out=scratch.buffer("alpha_rRad", shape, dtype))
+    # slope steepness in azimuth (eq. 3) and in range (eq. 2)
+    alpha_azRad = np.sin(phi_rRad, out=scratch.buffer("alpha_azRad", shape, dtype))
+    alpha_azRad *= tan_alpha_s
+    np.arctan(alpha_azRad, out=alpha_azRad)
+    alpha_rRad = np.cos(phi_rRad, out=phi_rRad)
+    alpha_rRad *= tan_alpha_s
+    np.arctan(alpha_rRad, out=alpha_rRad)
+
+    # 2.2 Gamma_nought and the scattering model
+    scf = np.add(theta_cRad, alpha_rRad, out=scratch.buffer("scf", shape, dtype))
+    work = tan_alpha_s
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if TERRAIN_FLATTENING_MODEL == "VOLUME":
+            np.tan(scf, out=scf)
+            np.tan(theta_cRad, out=work)
+            scf /= work
+            scf[work == 0] = np.nan
+        else:
+            np.cos(scf, out=scf)
+            scf *= np.cos(alpha_azRad, out=work)
+            zero = scf == 0
+            np.divide(np.cos(theta_cRad, out=work), scf, out=scf)
+            scf[zero] = np.nan
+        # gamma0 = sigma0 / cos(theta_i), folded into the factor
+        np.cos(theta_iRad, out=work)
+        scf /= work
+        scf[work == 0] = np.nan
+
+    # layover, where slope > radar viewing angle, and shadow
+    with np.errstate(invalid="ignore"):
+        mask = (alpha_rRad < theta_iRad) & (alpha_rRad > -theta_cRad)
+    if TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER > 0:
+        mask = _erode(mask, TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER, pixel_size)
+    scf[~mask] = np.nan
+
+    for i in filter_bands(bandNames, stack.shape[0]):
+        np.multiply(stack[i], scf, out=output[i])
+    return output
@@ -0,0 +1,509 @@
+"""
+Description: Tiled processing of full scenes with the local filters and
+terrain flattening, in a process pool.
+
+A scene is split into square tiles read with a halo: the tile and its halo are
+processed by a worker and only the tile is written back. The halo covers the
+neighbourhood each output pixel depends on (``speckle_filter_halo``,
+``terrain_flattening_halo``), and the statistics taken over the whole scene,
+the 98th percentile of the Lee Sigma filter and the look direction, are
+computed once before the tiles are dispatched. The stitched output therefore
+has no seams: it is identical to the whole scene result, except for the
+round-off of the summed-area tables of the windowed statistics, which start at
+each tile. Only the tiles being processed are held by the workers, so the
+filtering temporaries are bounded by the tile size; the scene and the output
+can be memory-mapped arrays.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from .. import tracing
+from . import pipeline, scratch
+from . import speckle_filter as sf
+from . import terrain_flattening as trf
+from ._bands import as_stack, filter_bands
+from .neighborhood import half_width
+from .percentile import StreamingPercentile
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Sequence
+
+
+@dataclass(frozen=True)
+class Tile:
+    """
+    Window of a tile in a scene.
+
+    Parameters
+    ----------
+    write : tuple[slice, slice]
+        Rows and columns of the scene written by the tile
+    read : tuple[slice, slice]
+        Rows and columns of the scene read for it, the tile and its halo
+    inner : tuple[slice, slice]
+        The written rows and columns, relative to the read ones
+
+    """
+
+    write: tuple[slice, slice]
+    read: tuple[slice, slice]
+    inner: tuple[slice, slice]
+
+
+def tiles(shape: tuple[int, int], tile_size: int, halo: int) -> list[Tile]:
+    """
+    Split a scene into tiles read with a halo.
+
+    Parameters
+    ----------
+    shape : tuple[int, int]
+        Number of rows and columns of the scene
+    tile_size : int
+        Number of rows and columns of each tile
+    halo : int
+        Number of pixels read on each side of a tile, clipped at the scene edges
+
+    Returns
+    -------
+    list[Tile]
+        The tiles, row by row
+
+    """
+    if tile_size <= 0:
+        raise ValueError("ERROR!!! tile_size not correctly defined")
+    if halo < 0:
+        raise ValueError("ERROR!!! halo not correctly defined")
+    axes = [list(sf._row_blocks(n, tile_size, halo)) for n in shape]
+    return [Tile((rw, cw), (rr, cr), (ri, ci)) for rw, rr, ri in axes[0] for cw, cr, ci in axes[1]]
+
+
+def speckle_filter_halo(SPECKLE_FILTER: str, KERNEL_SIZE: int) -> int:
+    """
+    Halo of the tiles of a speckle filter.
+
+    Parameters
+    ----------
+    SPECKLE_FILTER : str
+        Type of speckle filter
+    KERNEL_SIZE : int
+        Neighbourhood window size. Positive odd integer.
+
+    Returns
+    -------
+    int
+        Distance in pixels of the farthest input pixel an output pixel depends on
+
+    """
+    if SPECKLE_FILTER in ["BOXCAR", "LEE", "GAMMA MAP"]:
+        return half_width(KERNEL_SIZE)
+    if SPECKLE_FILTER == "REFINED LEE":
+        # 3x3 windows sampled in a 7x7 window
+        return sf.REFINED_LEE_HALO
+    if SPECKLE_FILTER == "LEE SIGMA":
+        # 3x3 a-priori mean, then the KERNEL_SIZE window
+        return half_width(KERNEL_SIZE) + 1
+    raise ValueError("ERROR!!! SPECKLE_FILTER not correctly defined")
+
+
+def terrain_flattening_halo(
+    TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER: int,
+    pixel_size: float = 10.0,
+    dem: bool = True,
+) -> int:
+    """
+    Halo of the tiles of the terrain flattening.
+
+    Parameters
+    ----------
+    TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER : int
+        The additional buffer in meters to account for the passive layover and shadow
+    pixel_size : float
+        Pixel spacing in meters
+    dem : bool
+        Whether the terrain geometry is computed from the DEM in the tiles,
+        rather than given
+
+    Returns
+    -------
+    int
+        Distance in pixels of the farthest input pixel an output pixel depends on
+
+    """
+    buffer = 0
+    if TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER > 0:
+        buffer = min(
+            math.ceil(TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER / pixel_size),
+            trf.EROSION_NEIGHBORHOOD,
+        )
+    # slope and aspect use the 4-connected neighbours of the DEM
+    return buffer + int(dem)
+
+
+# work arrays of the tiles processed by this process, reused from tile to tile
+_TILE_POOL = scratch.ScratchPool()
+
+
+def _process_tile(
+    function: Callable[..., np.ndarray],
+    image: np.ndarray,
+    aligned: dict[str, np.ndarray],
+    kwargs: dict[str, Any],
+    inner: tuple[slice, slice],
+) -> np.ndarray:
+    with scratch.use_pool(_TILE_POOL):
+        return function(image, **aligned, **kwargs)[..., inner[0], inner[1]]
+
+
+def _window(array: np.ndarray, window: tuple[slice, slice]) -> np.ndarray:
+    # copy, so that only the window of a memory-mapped array is sent to the workers
+    return np.array(array[..., window[0], window[1]])
+
+
+def process_tiled(
+    function: Callable[..., np.ndarray],
+    image: np.ndarray,
+    halo: int,
+    tile_size: int = 1024,
+    aligned: dict[str, np.ndarray | None] | None = None,
+    max_workers: int | None = None,
+    out: np.ndarray | None = None,
+    **kwargs: Any,
+) -> np.ndarray:
+    """
+    Apply a function to the tiles of a scene and stitch its output.
+
+    Parameters
+    ----------
+    function : Callable[..., np.ndarray]
+        Module level function, called with the tile as first argument and
+        returning an array of the shape of the tile
+    image : np.ndarray
+        2-D or (bands, rows, cols) scene
+    halo : int
+        Number of pixels read on each side of a tile
+    tile_size : int
+        Number of rows and columns of each tile
+    aligned : dict[str, np.ndarray | None] | None
+        Keyword arguments of ``function`` on the grid of the scene, e.g. the
+        DEM, cut into the same tiles; None values are passed unchanged
+    max_workers : int | None
+        Number of worker processes, the number of CPUs if None; the tiles are
+        processed in this process if 1
+    out : np.ndarray | None
+        Array the output is written into, e.g. a memory-mapped array; a new
+        floating point array if None
+    **kwargs : Any
+        Other keyword arguments of ``function``
+
+    Returns
+    -------
+    np.ndarray
+        The stitched output, with the layout of the input
+
+    """
+    stack, _ = as_stack(image)
+    if out is None:
+        dtype = stack.dtype if np.issubdtype(stack.dtype, np.floating) else np.float64
+        out = np.empty(np.shape(image), dtype=dtype)
+    output, _ = as_stack(out)
+    if output.shape != stack.shape:
+        raise ValueError("ERROR!!! out must have the shape of the image")
+    aligned = aligned or {}
+
+    def arguments(tile: Tile) -> tuple:
+        windows = {
+            key: value if value is None else _window(value, tile.read)
+            for key, value in aligned.items()
+        }
+        scene = _window(image, tile.read)
+        return function, scene, windows, kwargs, tile.inner
+
+    def write(tile: Tile, result: np.ndarray) -> None:
+        output[..., tile.write[0], tile.write[1]] = result.reshape((-1, *result.shape[-2:]))
+
+    todo = tiles(stack.shape[-2:], tile_size, halo)
+    workers = max_workers or os.cpu_count() or 1
+    with tracing.span(
+        "local.tiled",
+        function=getattr(function, "__name__", str(function)),
+        tiles=len(todo),
+        halo=halo,
+        workers=workers,
+    ):
+        if workers == 1:
+            try:
+                for tile in todo:
+                    write(tile, _process_tile(*arguments(tile)))
+            finally:
+                _TILE_POOL.clear()
+            return out
+
+        with ProcessPoolExecutor(workers) as executor:
+            # a bounded number of tiles in flight, so that the scene is not copied at once
+            running = {}
+            for tile in todo:
+                running[executor.submit(_process_tile, *arguments(tile))] = tile
+                if len(running) >= 2 * workers:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        write(running.pop(future), future.result())
+            for future in list(running):
+                write(running.pop(future), future.result())
+    return out
+
+
+def tiled_spatial_filter(
+    image: np.ndarray,
+    KERNEL_SIZE: int,
+    SPECKLE_FILTER: str,
+    bandNames: Sequence[str] | None = None,
+    tile_size: int = 1024,
+    max_workers: int | None = None,
+    out: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    ``speckle_filter.spatial_filter`` of a scene, tile by tile.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image to be filtered, 2-D or (bands, rows, cols), in linear scale
+    KERNEL_SIZE : int
+        Spatial Neighbourhood window. Positive odd integer.
+    SPECKLE_FILTER : str
+        Type of speckle filter
+    bandNames : Sequence[str] | None
+        Names of the bands of the image; an "angle" band is left unfiltered
+    tile_size : int
+        Number of rows and columns of each tile
+    max_workers : int | None
+        Number of worker processes, see ``process_tiled``
+    out : np.ndarray | None
+        Array the output is written into
+
+    Returns
+    -------
+    np.ndarray
+        Filtered Image
+
+    """
+    z98 = None
+    if SPECKLE_FILTER == "LEE SIGMA":
+        z98 = sf.percentile_98(image, bandNames)
+    return process_tiled(
+        sf.spatial_filter,
+        image,
+        speckle_filter_halo(SPECKLE_FILTER, KERNEL_SIZE),
+        tile_size,
+        max_workers=max_workers,
+        out=out,
+        KERNEL_SIZE=KERNEL_SIZE,
+        SPECKLE_FILTER=SPECKLE_FILTER,
+        bandNames=bandNames,
+        z98=z98,
+    )
+
+
+def tiled_slope_correction(
+    image: np.ndarray,
+    bandNames: Sequence[str],
+    TERRAIN_FLATTENING_MODEL: str,
+    TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER: int,
+    dem: np.ndarray | None = None,
+    pixel_size: float = 10.0,
+    geometry: np.ndarray | None = None,
+    HEADING: float | None = None,
+    tile_size: int = 1024,
+    max_workers: int | None = None,
+    out: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    ``terrain_flattening.slope_correction`` of a scene, tile by tile.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        (bands, rows, cols) scene in linear scale
+    bandNames : Sequence[str]
+        Names of the bands of the image, including "angle"
+    TERRAIN_FLATTENING_MODEL : str
+        The radiometric terrain normalization model, either "VOLUME" or "DIRECT"
+    TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER : int
+        The additional buffer in meters to account for the passive layover and shadow
+    dem : np.ndarray | None
+        2-D elevation on the grid of the image, unused if ``geometry`` is given
+    pixel_size : float
+        Pixel spacing in meters
+    geometry : np.ndarray | None
+        Precomputed terrain geometry, e.g. from ``TerrainGeometryCache``
+    HEADING : float | None
+        Look direction in degrees; estimated from the incidence angle of the
+        whole scene if None
+    tile_size : int
+        Number of rows and columns of each tile
+    max_workers : int | None
+        Number of worker processes, see ``process_tiled``
+    out : np.ndarray | None
+        Array the output is written into
+
+    Returns
+    -------
+    np.ndarray
+        Terrain normalized gamma0, layover and shadow masked, "angle" unchanged
+
+    """
+    if "angle" not in bandNames:
+        raise ValueError("ERROR!!! the image has no angle band")
+    if HEADING is None:
+        HEADING = trf.heading(image[list(bandNames).index("angle")], pixel_size)
+    halo = terrain_flattening_halo(
+        TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER, pixel_size, geometry is None
+    )
+    return process_tiled(
+        trf.slope_correction,
+        image,
+        halo,
+        tile_size,
+        aligned={"dem": None if geometry is not None else dem, "geometry": geometry},
+        max_workers=max_workers,
+        out=out,
+        bandNames=bandNames,
+        TERRAIN_FLATTENING_MODEL=TERRAIN_FLATTENING_MODEL,
+        TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER=(
+            TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER
+        ),
+        pixel_size=pixel_size,
+        HEADING=HEADING,
+    )
+
+
+def tiled_ard_image(
+    image: np.ndarray,
+    bandNames: Sequence[str],
+    APPLY_BORDER_NOISE_CORRECTION: bool = True,
+    SPECKLE_FILTER: str | None = "BOXCAR",
+    SPECKLE_FILTER_KERNEL_SIZE: int = 3,
+    TERRAIN_FLATTENING_MODEL: str | None = "VOLUME",
+    TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER: int = 3,
+    dem: np.ndarray | None = None,
+    pixel_size: float = 10.0,
+    geometry: np.ndarray | None = None,
+    HEADING: float | None = None,
+    FORMAT: str = "LINEAR",
+    tile_size: int = 1024,
+    max_workers: int | None = None,
+    out: np.ndarray | None = None,
+    block_rows: int = 256,
+    dtype: np.dtype | type | None = None,
+) -> np.ndarray:
+    """
+    ``pipeline.ard_image`` of a scene, tile by tile.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        (bands, rows, cols) scene in linear scale
+    bandNames : Sequence[str]
+        Names of the bands of the image, including "angle"
+    APPLY_BORDER_NOISE_CORRECTION : bool
+        See ``pipeline.ard_image``
+    SPECKLE_FILTER : str | None
+        See ``pipeline.ard_image``
+    SPECKLE_FILTER_KERNEL_SIZE : int
+        See ``pipeline.ard_image``
+    TERRAIN_FLATTENING_MODEL : str | None
+        See ``pipeline.ard_image``
+    TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER : int
+        See ``pipeline.ard_image``
+    dem : np.ndarray | None
+        See ``pipeline.ard_image``
+    pixel_size : float
+        Pixel spacing in meters
+    geometry : np.ndarray | None
+        See ``pipeline.ard_image``
+    HEADING : float | None
+        Look direction in degrees; estimated from the incidence angle of the
+        whole scene if None
+    FORMAT : str
+        See ``pipeline.ard_image``
+    tile_size : int
+        Number of rows and columns of each tile
+    max_workers : int | None
+        Number of worker processes, see ``process_tiled``
+    out : np.ndarray | None
+        Array the output is written into
+    block_rows : int
+        Number of rows read at once by the whole scene statistics
+    dtype : np.dtype | type | None
+        Floating point type of the processing and of the output when ``out``
+        is None, see ``pipeline.ard_image``
+
+    Returns
+    -------
+    np.ndarray
+        The processed scene
+
+    """
+    if "angle" not in bandNames:
+        raise ValueError("ERROR!!! the image has no angle band")
+    angle = image[list(bandNames).index("angle")]
+
+    z98 = None
+    if SPECKLE_FILTER == "LEE SIGMA":
+        bands = filter_bands(bandNames, image.shape[0])
+        histogram = StreamingPercentile(len(bands))
+        for r0 in range(0, image.shape[1], block_rows):
+            block = np.array(image[bands, r0 : r0 + block_rows], dtype=float)
+            if APPLY_BORDER_NOISE_CORRECTION:
+                block[:, pipeline.border_noise(angle[r0 : r0 + block_rows])] = np.nan
+            histogram.update(block)
+        z98 = np.full(image.shape[0], np.nan)
+        z98[bands] = histogram.percentile(98)
+
+    halo = 0
+    if SPECKLE_FILTER is not None:
+        halo = speckle_filter_halo(SPECKLE_FILTER, SPECKLE_FILTER_KERNEL_SIZE)
+    if TERRAIN_FLATTENING_MODEL is not None:
+        if HEADING is None:
+            if APPLY_BORDER_NOISE_CORRECTION:
+                angle = np.where(pipeline.border_noise(angle), np.nan, angle)
+            HEADING = trf.heading(angle, pixel_size)
+        # the terrain flattening is pixelwise in the speckle filter output
+        halo = max(
+            halo,
+            terrain_flattening_halo(
+                TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER, pixel_size, geometry is None
+            ),
+        )
+    if out is None and dtype is not None:
+        out = np.empty(image.shape, dtype=dtype)
+    return process_tiled(
+        pipeline.ard_image,
+        image,
+        halo,
+        tile_size,
+        aligned={"dem": None if geometry is not None else dem, "geometry": geometry},
+        max_workers=max_workers,
+        out=out,
+        bandNames=bandNames,
+        APPLY_BORDER_NOISE_CORRECTION=APPLY_BORDER_NOISE_CORRECTION,
+        SPECKLE_FILTER=SPECKLE_FILTER,
+        SPECKLE_FILTER_KERNEL_SIZE=SPECKLE_FILTER_KERNEL_SIZE,
+        TERRAIN_FLATTENING_MODEL=TERRAIN_FLATTENING_MODEL,
+        TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER=(
+            TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER
+        ),
+        pixel_size=pixel_size,
+        HEADING=HEADING,
+        FORMAT=FORMAT,
+        z98=z98,
+        dtype=dtype,
+    )
@@ -0,0 +1,184 @@
+"""
+Description: Client side cache of collection metadata.
+
+Building a pipeline should not block on the server. The wrappers read the
+metadata they validate (e.g. the band names) from a ``MetadataCache`` and,
+when it is not cached, defer the validation to the server graph instead of
+calling ``getInfo``. The cache is keyed by a fingerprint of the serialized
+collection, which covers its asset id and all the filters applied to it, and
+entries expire after a TTL. With a path, the entries are kept in a JSON file
+and shared by the runs of a batch.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from . import tracing
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+    from ee.imagecollection import ImageCollection
+
+CACHE_VERSION = 1
+DEFAULT_TTL = 7 * 24 * 3600
+
+
+def fingerprint(col: ImageCollection) -> str:
+    """
+    Fingerprint of a collection and of the filters applied to it.
+
+    The collection is serialized on the client, no request is sent.
+
+    Parameters
+    ----------
+    col : ImageCollection
+        Collection to identify
+
+    Returns
+    -------
+    str
+        sha256 of the serialized expression
+
+    """
+    return hashlib.sha256(col.serialize().encode()).hexdigest()
+
+
+class MetadataCache:
+    """
+    Metadata of collections with a time to live, in memory or on disk.
+
+    Parameters
+    ----------
+    path : str | Path | None
+        JSON file holding the entries, None to keep them in memory only
+    ttl : float
+        Time to live of the entries in seconds
+
+    """
+
+    def __init__(self, path: str | Path | None = None, ttl: float = DEFAULT_TTL):
+        self.path = None if path is None else Path(path)
+        self.ttl = ttl
+        self._entries: dict[str, dict[str, Any]] = {}
+        if self.path is not None and self.path.exists():
+            data = json.loads(self.path.read_text())
+            if data.get("version") == CACHE_VERSION:
+                self._entries = data["entries"]
+
+    def get(self, key: str) -> Any:
+        """
+        Cached value of a key.
+
+        Parameters
+        ----------
+        key : str
+            Entry key
+
+        Returns
+        -------
+        Any
+            The value, None if the key is missing or expired
+
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry["time"] > self.ttl:
+            del self._entries[key]
+            return None
+        return entry["value"]
+
+    def put(self, key: str, value: Any) -> None:
+        """
+        Cache a JSON serializable value.
+
+        Parameters
+        ----------
+        key : str
+            Entry key
+        value : Any
+            Value to cache
+
+        """
+        self._entries[key] = {"time": time.time(), "value": value}
+        self._save()
+
+    def prune(self) -> None:
+        """Remove the expired entries."""
+        now = time.time()
+        self._entries = {
+            key: entry for key, entry in self._entries.items() if now - entry["time"] <= self.ttl
+        }
+        self._save()
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+        data = json.dumps({"version": CACHE_VERSION, "entries": self._entries})
+        # write then rename, so that concurrent runs never read a partial file
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(data)
+        tmp.replace(self.path)
+
+    # ---- band names
+
+    def band_names(self, col: ImageCollection) -> list[str] | None:
+        """
+        Cached band names of the first image of a collection.
+
+        Parameters
+        ----------
+        col : ImageCollection
+            Collection
+
+        Returns
+        -------
+        list[str] | None
+            Band names, None if they are not cached
+
+        """
+        return self.get(f"bandNames/{fingerprint(col)}")
+
+    def put_band_names(self, col: ImageCollection, bandNames: Sequence[str]) -> None:
+        """
+        Cache the band names of a collection, e.g. known from its catalogue entry.
+
+        Parameters
+        ----------
+        col : ImageCollection
+            Collection
+        bandNames : Sequence[str]
+            Band names of its first image
+
+        """
+        self.put(f"bandNames/{fingerprint(col)}", list(bandNames))
+
+    def fetch_band_names(self, col: ImageCollection) -> list[str]:
+        """
+        Band names of a collection, requested from the server if not cached.
+
+        This is the only blocking call of the cache, to warm it up explicitly.
+
+        Parameters
+        ----------
+        col : ImageCollection
+            Collection
+
+        Returns
+        -------
+        list[str]
+            Band names of its first image
+
+        """
+        bandNames = self.band_names(col)
+        if bandNames is None:
+            bandNames = tracing.get_info(col.first().bandNames())
+            self.put_band_names(col, bandNames)
+        return bandNames
@@ -0,0 +1,488 @@
+"""
+Description: Offline resolution of the temporal neighbours of the multi-temporal
+speckle filter.
+
+``MultiTemporal_Filter`` searches the neighbours of every image on the server,
+with geometry operations on the archive footprints. For orbits and AOIs that
+are processed again and again, this module resolves the same neighbour lists
+once, on the client, from exported scene metadata (see ``scene_metadata``),
+using an R-tree of the footprints. The lists are written to a manifest that
+``MultiTemporal_Filter`` accepts as ``NEIGHBOUR_MANIFEST``.
+
+Footprints are handled as planar polygons in longitude / latitude, with the
+longitudes scaled by the cosine of the latitude of the image to filter, and are
+clipped as convex polygons (their convex hull), which holds for S1 GRD frames.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import math
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from itertools import combinations
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import ee
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Sequence
+
+    from ee.featurecollection import FeatureCollection
+    from ee.imagecollection import ImageCollection
+
+MANIFEST_VERSION = 1
+DAY_MS = 24 * 3600 * 1000
+# as in MultiTemporal_Filter, the number of candidates checked per image and direction
+CANDIDATES_PER_IMAGE = 5
+
+
+@dataclass(frozen=True)
+class Scene:
+    """Metadata of one S1 scene needed to select temporal neighbours."""
+
+    id: str
+    time_start: int
+    relative_orbit_start: int
+    relative_orbit_stop: int
+    polarisations: tuple[str, ...]
+    footprint: tuple[tuple[float, float], ...]
+
+    @property
+    def bbox(self) -> tuple[float, float, float, float]:
+        xs = [p[0] for p in self.footprint]
+        ys = [p[1] for p in self.footprint]
+        return min(xs), min(ys), max(xs), max(ys)
+
+    @property
+    def date(self) -> str:
+        return _format_date(self.time_start)
+
+
+def _format_date(time_ms: int) -> str:
+    return datetime.fromtimestamp(time_ms / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def _parse_date(date: str) -> int:
+    day = datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return int(day.timestamp() * 1000)
+
+
+# ---------------------------------------------------------------------------//
+# Scene metadata
+# ---------------------------------------------------------------------------//
+
+
+def scene_metadata(collection: ImageCollection) -> FeatureCollection:
+    """
+    Table of the scene metadata needed to build a manifest, to export as GeoJSON.
+
+    Parameters
+    ----------
+    collection : ImageCollection
+        S1 scenes, e.g. COPERNICUS/S1_GRD_FLOAT filtered over the AOI and period
+        of interest, including the scenes that can be neighbours
+
+    Returns
+    -------
+    FeatureCollection
+        One feature per scene, with the footprint as geometry
+
+    """
+    properties = [
+        "system:index",
+        "system:time_start",
+        "relativeOrbitNumber_start",
+        "relativeOrbitNumber_stop",
+        "transmitterReceiverPolarisation",
+    ]
+
+    def _to_feature(image):
+        return ee.Feature(image.geometry(), image.toDictionary(properties)).set(
+            "system:index", image.get("system:index")
+        )
+
+    return ee.FeatureCollection(collection.map(_to_feature))
+
+
+def _ring(geometry: dict) -> list[list[float]]:
+    if geometry["type"] == "Polygon":
+        return geometry["coordinates"][0]
+    if geometry["type"] == "LinearRing":
+        return geometry["coordinates"]
+    raise ValueError(f"ERROR!!! Unsupported footprint geometry {geometry['type']}")
+
+
+def read_scenes(metadata: dict | str | Path) -> list[Scene]:
+    """
+    Read scene metadata exported as GeoJSON, or returned by ``getInfo``.
+
+    Parameters
+    ----------
+    metadata : dict | str | Path
+        FeatureCollection dictionary or path to a GeoJSON file. Features of
+        ``scene_metadata`` and images of ``ImageCollection.getInfo()`` are accepted.
+
+    Returns
+    -------
+    list[Scene]
+        Scenes sorted by acquisition time
+
+    """
+    if not isinstance(metadata, dict):
+        metadata = json.loads(Path(metadata).read_text())
+    scenes = []
+    for feature in metadata["features"]:
+        props = feature["properties"]
+        geometry = feature.get("geometry") or props["system:footprint"]
+        polarisations = props["transmitterReceiverPolarisation"]
+        if isinstance(polarisations, str):
+            polarisations = polarisations.strip("[]").replace(" ", "").split(",")
+        scenes.append(
+            Scene(
+                id=props.get("system:index") or feature["id"].split("/")[-1],
+                time_start=int(props["system:time_start"]),
+                relative_orbit_start=int(props["relativeOrbitNumber_start"]),
+                relative_orbit_stop=int(props["relativeOrbitNumber_stop"]),
+                polarisations=tuple(polarisations),
+                footprint=tuple((float(x), float(y)) for x, y, *_ in _ring(geometry)),
+            )
+        )
+    return sorted(scenes, key=lambda scene: scene.time_start)
+
+
+# ---------------------------------------------------------------------------//
+# Footprint index
+# ---------------------------------------------------------------------------//
+
+
+class FootprintIndex:
+    """
+    Static R-tree of scene footprint bounding boxes, bulk loaded with
+    Sort-Tile-Recursive packing.
+
+    Parameters
+    ----------
+    scenes : Sequence[Scene]
+        Scenes to index
+    capacity : int
+        Maximum number of children of a node
+
+    """
+
+    def __init__(self, scenes: Sequence[Scene], capacity: int = 16):
+        self.capacity = capacity
+        # a node is (bbox, children); leaves hold scenes as children
+        level = [(scene.bbox, scene) for scene in scenes]
+        self._leaf_level = True
+        self._root = None
+        while level:
+            level = self._pack(level)
+            if len(level) == 1:
+                self._root = level[0]
+                break
+            self._leaf_level = False
+
+    def _pack(self, entries: list) -> list:
+        per_slice = self.capacity * math.ceil(math.sqrt(math.ceil(len(entries) / self.capacity)))
+        entries = sorted(entries, key=lambda e: e[0][0] + e[0][2])
+        nodes = []
+        for i in range(0, len(entries), per_slice):
+            column = sorted(entries[i : i + per_slice], key=lambda e: e[0][1] + e[0][3])
+            for j in range(0, len(column), self.capacity):
+                children = column[j : j + self.capacity]
+                bbox = (
+                    min(c[0][0] for c in children),
+                    min(c[0][1] for c in children),
+                    max(c[0][2] for c in children),
+                    max(c[0][3] for c in children),
+                )
+                nodes.append((bbox, children))
+        return nodes
+
+    def query(self, bbox: tuple[float, float, float, float]) -> list[Scene]:
+        """
+        Scenes whose footprint bounding box intersects a bounding box.
+
+        Parameters
+        ----------
+        bbox : tuple[float, float, float, float]
+            (xmin, ymin, xmax, ymax)
+
+        Returns
+        -------
+        list[Scene]
+            Matching scenes
+
+        """
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node_bbox, children = stack.pop()
+            if not _bbox_intersects(node_bbox, bbox):
+                continue
+            if isinstance(children, Scene):
+                found.append(children)
+            else:
+                stack.extend(children)
+        return found
+
+
+def _bbox_intersects(a: tuple, b: tuple) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+# ---------------------------------------------------------------------------//
+# Polygon overlap
+# ---------------------------------------------------------------------------//
+
+
+def _convex_hull(points: Iterable[tuple[float, float]]) -> list[tuple[float, float]]:
+    points = sorted(set(points))
+    if len(points) <= 2:
+        return points
+
+    def half(pts):
+        hull = []
+        for p in pts:
+            while len(hull) >= 2 and _cross(hull[-2], hull[-1], p) <= 0:
+                hull.pop()
+            hull.append(p)
+        return hull[:-1]
+
+    # counter-clockwise
+    return half(points) + half(points[::-1])
+
+
+def _cross(o, a, b) -> float:
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+
+def _clip(subject: list, clipper: list) -> list:
+    """Sutherland-Hodgman clipping of a polygon by a counter-clockwise convex polygon."""
+    output = subject
+    for i in range(len(clipper)):
+        a, b = clipper[i - 1], clipper[i]
+        polygon, output = output, []
+        for j in range(len(polygon)):
+            p, q = polygon[j - 1], polygon[j]
+            p_in, q_in = _cross(a, b, p) >= 0, _cross(a, b, q) >= 0
+            if q_in:
+                if not p_in:
+                    output.append(_intersection(p, q, a, b))
+                output.append(q)
+            elif p_in:
+                output.append(_intersection(p, q, a, b))
+        if not output:
+            break
+    return output
+
+
+def _intersection(p, q, a, b) -> tuple[float, float]:
+    dp, dq = _cross(a, b, p), _cross(a, b, q)
+    t = dp / (dp - dq)
+    return p[0] + t * (q[0] - p[0]), p[1] + t * (q[1] - p[1])
+
+
+def _area(polygon: list) -> float:
+    return abs(
+        sum(polygon[i - 1][0] * p[1] - p[0] * polygon[i - 1][1] for i, p in enumerate(polygon)) / 2
+    )
+
+
+def coverage(target: Scene, frames: Sequence[Scene]) -> float:
+    """
+    Fraction of the footprint of a scene covered by the union of other footprints.
+
+    Parameters
+    ----------
+    target : Scene
+        Scene whose footprint is covered
+    frames : Sequence[Scene]
+        Scenes covering it, usually the frames of one acquisition date
+
+    Returns
+    -------
+    float
+        Covered fraction, in [0, 1]
+
+    """
+    scale = math.cos(math.radians(sum(p[1] for p in target.footprint) / len(target.footprint)))
+
+    def project(scene):
+        return _convex_hull((x * scale, y) for x, y in scene.footprint)
+
+    polygon = project(target)
+    target_area = _area(polygon)
+    if target_area == 0:
+        return 0.0
+    pieces = [_clip(polygon, project(frame)) for frame in frames]
+    pieces = [piece for piece in pieces if len(piece) >= 3]
+    # inclusion-exclusion over the frames, intersections of convex polygons stay convex
+    covered = 0.0
+    for n in range(1, len(pieces) + 1):
+        for subset in combinations(pieces, n):
+            piece = subset[0]
+            for other in subset[1:]:
+                piece = _clip(piece, _convex_hull(other)) if len(piece) >= 3 else []
+            if len(piece) >= 3:
+                covered += (-1) ** (n + 1) * _area(piece)
+    return min(max(covered / target_area, 0.0), 1.0)
+
+
+# ---------------------------------------------------------------------------//
+# Neighbour resolution and manifest
+# ---------------------------------------------------------------------------//
+
+
+def resolve_neighbours(
+    target: Scene,
+    index: FootprintIndex,
+    NR_OF_IMAGES: int,
+    MIN_OVERLAP: float = 0.95,
+) -> list[str]:
+    """
+    Neighbours of a scene, selected as in ``MultiTemporal_Filter``.
+
+    Neighbours share the relative orbit and the last polarisation of the scene.
+    The NR_OF_IMAGES latest acquisition dates, the scene date included, whose
+    frames cover more than MIN_OVERLAP of the scene are kept; at the start of
+    the series, later dates complete the list.
+
+    Parameters
+    ----------
+    target : Scene
+        Scene to filter
+    index : FootprintIndex
+        Index of the candidate scenes
+    NR_OF_IMAGES : int
+        Number of images to use in multi-temporal filtering. Positive integer.
+    MIN_OVERLAP : float
+        Minimum fraction of the scene covered by the frames of a date
+
+    Returns
+    -------
+    list[str]
+        ``system:index`` of the neighbours
+
+    """
+    candidates = sorted(
+        (
+            scene
+            for scene in index.query(target.bbox)
+            if target.polarisations[-1] in scene.polarisations
+            and scene.relative_orbit_stop
+            in (target.relative_orbit_stop, target.relative_orbit_start)
+        ),
+        key=lambda scene: (scene.time_start, scene.id),
+    )
+    limit = CANDIDATES_PER_IMAGE * NR_OF_IMAGES
+
+    def valid_dates(scenes):
+        dates = []
+        for scene in scenes:
+            frames = [
+                s
+                for s in candidates
+                if scene.time_start <= s.time_start < scene.time_start + DAY_MS
+            ]
+            if coverage(target, frames) > MIN_OVERLAP and scene.date not in dates:
+                dates.append(scene.date)
+        return dates
+
+    before = [s for s in candidates if s.time_start < target.time_start + DAY_MS]
+    dates = valid_dates(before[::-1][:limit])
+    if len(dates) >= NR_OF_IMAGES:
+        dates = dates[:NR_OF_IMAGES]
+    else:
+        after = [s for s in candidates if s.time_start >= target.time_start]
+        dates = sorted(set(valid_dates(after[:limit]) + dates))[:NR_OF_IMAGES]
+
+    ids = []
+    for date in dates:
+        start = _parse_date(date)
+        ids += [s.id for s in candidates if start <= s.time_start < start + DAY_MS]
+    return ids
+
+
+def build_manifest(
+    scenes: Sequence[Scene],
+    NR_OF_IMAGES: int,
+    targets: Sequence[Scene] | None = None,
+    MIN_OVERLAP: float = 0.95,
+) -> dict[str, Any]:
+    """
+    Resolve the temporal neighbours of a set of scenes.
+
+    Parameters
+    ----------
+    scenes : Sequence[Scene]
+        All scenes that can be neighbours
+    NR_OF_IMAGES : int
+        Number of images to use in multi-temporal filtering. Positive integer.
+    targets : Sequence[Scene] | None
+        Scenes to filter, defaults to all ``scenes``
+    MIN_OVERLAP : float
+        Minimum fraction of the scene covered by the frames of a date
+
+    Returns
+    -------
+    dict[str, Any]
+        Manifest, mapping the ``system:index`` of every target to its neighbours
+
+    """
+    if NR_OF_IMAGES <= 0:
+        raise ValueError("ERROR!!! NR_OF_IMAGES not correctly defined")
+    index = FootprintIndex(scenes)
+    return {
+        "version": MANIFEST_VERSION,
+        "nr_of_images": NR_OF_IMAGES,
+        "min_overlap": MIN_OVERLAP,
+        "neighbours": {
+            target.id: resolve_neighbours(target, index, NR_OF_IMAGES, MIN_OVERLAP)
+            for target in (scenes if targets is None else targets)
+        },
+    }
+
+
+def write_manifest(manifest: dict[str, Any], path: str | Path) -> None:
+    """
+    Write a manifest as compact JSON, gzip compressed if the path ends with ".gz".
+
+    Parameters
+    ----------
+    manifest : dict[str, Any]
+        Output of ``build_manifest``
+    path : str | Path
+        Destination file
+
+    """
+    data = json.dumps(manifest, separators=(",", ":")).encode()
+    path = Path(path)
+    path.write_bytes(gzip.compress(data) if path.suffix == ".gz" else data)
+
+
+def load_manifest(manifest: dict[str, Any] | str | Path) -> dict[str, Any]:
+    """
+    Read a manifest written by ``write_manifest``.
+
+    Parameters
+    ----------
+    manifest : dict[str, Any] | str | Path
+        Manifest or path to a manifest file
+
+    Returns
+    -------
+    dict[str, Any]
+        Manifest
+
+    """
+    if not isinstance(manifest, dict):
+        path = Path(manifest)
+        data = path.read_bytes()
+        manifest = json.loads(gzip.decompress(data) if path.suffix == ".gz" else data)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError("ERROR!!! Unsupported neighbour manifest version")
+    return manifest
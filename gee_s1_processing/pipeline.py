@@ -0,0 +1,163 @@
+"""
+Description: Sentinel-1 ARD pipeline fused into a single map over the collection.
+
+The wrappers map border noise correction, speckle filtering, terrain
+flattening and the dB conversion one after the other, and ``f_mask_edges``
+converts the images to dB and back to apply its angle masks. ``ard_function``
+composes the selected steps into one per-image function instead: the border
+noise is masked in linear scale, the steps hand their output image to the next
+one, and "system:time_start" is set once on the result. The parts of the
+multi-temporal filter and of the terrain flattening shared by all the images
+(filtered archive, neighbour join, per-orbit heading and terrain geometry) are
+still built once over the collection.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+
+from . import border_noise_correction as bnc
+from . import graph, helper
+from . import speckle_filter as sf
+from . import terrain_flattening as trf
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from pathlib import Path
+
+    from ee.dictionary import Dictionary
+    from ee.image import Image
+    from ee.imagecollection import ImageCollection
+
+
+def ard_function(
+    collection: ImageCollection,
+    APPLY_BORDER_NOISE_CORRECTION: bool = True,
+    SPECKLE_FILTER_FRAMEWORK: str | None = "MONO",
+    SPECKLE_FILTER: str = "BOXCAR",
+    SPECKLE_FILTER_KERNEL_SIZE: int = 3,
+    SPECKLE_FILTER_NR_OF_IMAGES: int = 10,
+    TERRAIN_FLATTENING_MODEL: str | None = "VOLUME",
+    DEM: Image | None = None,
+    TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER: int = 3,
+    FORMAT: str = "LINEAR",
+    TERRAIN_GEOMETRY: Image | Dictionary | None = None,
+    HEADING: str = "ANGLE",
+    NEIGHBOUR_SELECTION: str = "ARCHIVE",
+    NEIGHBOUR_POOL: ImageCollection | None = None,
+    OVERLAP_MAX_ERROR: float = 10,
+    NEIGHBOUR_MANIFEST: dict[str, Any] | str | Path | None = None,
+) -> Callable[[Image], Image]:
+    """
+    Per-image ARD processing of the images of collection.
+
+    Parameters
+    ----------
+    collection : ImageCollection
+        The images to be processed, shared parts are computed over it
+    APPLY_BORDER_NOISE_CORRECTION : bool
+        Whether the border noise is masked
+    SPECKLE_FILTER_FRAMEWORK : str | None
+        "MONO", "MULTI", or None for no speckle filtering
+    SPECKLE_FILTER : str
+        Type of speckle filter
+    SPECKLE_FILTER_KERNEL_SIZE : int
+        Spatial Neighbourhood window. Positive odd integer.
+    SPECKLE_FILTER_NR_OF_IMAGES : int
+        Number of images of the multi-temporal filter
+    TERRAIN_FLATTENING_MODEL : str | None
+        "VOLUME", "DIRECT", or None for no terrain flattening
+    DEM : Image | None
+        The DEM of the terrain flattening
+    TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER : int
+        The additional buffer to account for the passive layover and shadow
+    FORMAT : str
+        Scale of the backscatter bands of the output, "LINEAR" or "DB"
+    TERRAIN_GEOMETRY : Image | Dictionary | None
+        See ``terrain_flattening.slope_correction``
+    HEADING : str
+        See ``terrain_flattening.slope_correction``
+    NEIGHBOUR_SELECTION : str
+        See ``speckle_filter.MultiTemporal_Filter``
+    NEIGHBOUR_POOL : ImageCollection | None
+        See ``speckle_filter.MultiTemporal_Filter``
+    OVERLAP_MAX_ERROR : float
+        See ``speckle_filter.MultiTemporal_Filter``
+    NEIGHBOUR_MANIFEST : dict[str, Any] | str | Path | None
+        See ``speckle_filter.MultiTemporal_Filter``
+
+    Returns
+    -------
+    Callable[[Image], Image]
+        The processing of one image
+
+    """
+    if FORMAT not in ["LINEAR", "DB"]:
+        raise ValueError("ERROR!!! FORMAT not correctly defined")
+    steps: list[Callable[[Image], Image]] = []
+    if APPLY_BORDER_NOISE_CORRECTION:
+        steps.append(bnc.mask_border_noise)
+    if SPECKLE_FILTER_FRAMEWORK == "MONO":
+        steps.append(
+            lambda image: sf.spatial_filter(image, SPECKLE_FILTER_KERNEL_SIZE, SPECKLE_FILTER)
+        )
+    elif SPECKLE_FILTER_FRAMEWORK == "MULTI":
+        steps.append(
+            sf.quegan_filter(
+                collection,
+                SPECKLE_FILTER_KERNEL_SIZE,
+                SPECKLE_FILTER,
+                SPECKLE_FILTER_NR_OF_IMAGES,
+                NEIGHBOUR_SELECTION,
+                NEIGHBOUR_POOL,
+                OVERLAP_MAX_ERROR,
+                NEIGHBOUR_MANIFEST,
+            )
+        )
+    elif SPECKLE_FILTER_FRAMEWORK is not None:
+        raise ValueError("ERROR!!! SPECKLE_FILTER_FRAMEWORK not correctly defined")
+    if TERRAIN_FLATTENING_MODEL is not None:
+        if DEM is None:
+            raise ValueError("ERROR!!! DEM not correctly defined")
+        steps.append(
+            trf.slope_correction_function(
+                collection,
+                TERRAIN_FLATTENING_MODEL,
+                DEM,
+                TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER,
+                TERRAIN_GEOMETRY,
+                HEADING,
+            )
+        )
+    if FORMAT == "DB":
+        steps.append(helper.lin_to_db)
+
+    def _ard(image: Image) -> Image:
+        output = image
+        # the steps of one image share their subexpressions
+        with graph.scope():
+            for step in steps:
+                output = step(output)
+        return output.set("system:time_start", image.get("system:time_start"))
+
+    return _ard
+
+
+def ard_pipeline(collection: ImageCollection, **kwargs: Any) -> ImageCollection:
+    """
+    Apply the fused ARD processing to a collection, in a single map.
+
+    Parameters
+    ----------
+    collection : ImageCollection
+        The images to be processed
+    **kwargs : Any
+        Parameters of ``ard_function``
+
+    Returns
+    -------
+    ImageCollection
+        The processed images
+
+    """
+    return collection.map(ard_function(collection, **kwargs))
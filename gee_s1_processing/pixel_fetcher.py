@@ -0,0 +1,361 @@
+"""
+Description: Fetch the pixels of a processed image over an AOI into NumPy.
+
+The AOI is split into request-sized tiles (``computePixels`` is limited in
+size), the tiles are requested concurrently with the ``AsyncClient`` and
+assembled into one (band, row, col) array, in the format of the local backend.
+Each tile is cached on disk as a .npy file keyed by the parameter hash of the
+pipeline and the grid of the tile, so running a notebook again reads the tiles
+from disk instead of requesting them. The cache is bounded in size and the
+least recently used tiles are evicted first.
+
+It needs the ``async`` and ``local`` extras.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import hashlib
+import json
+import math
+import os
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from . import tracing
+from .async_client import AsyncClient, _expression, pixel_grid
+from .local.tiling import tiles
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+    from ee.image import Image
+
+DEFAULT_CACHE_SIZE = 2**30
+
+
+def parameter_hash(**parameters: Any) -> str:
+    """
+    Hash of the parameters of a pipeline.
+
+    Parameters
+    ----------
+    **parameters : Any
+        JSON serializable parameters, e.g. the arguments of ``wrapper.ard_wrapper``
+        and the dates and orbit of the collection
+
+    Returns
+    -------
+    str
+        sha256 of the parameters, independent of their order
+
+    """
+    return hashlib.sha256(json.dumps(parameters, sort_keys=True).encode()).hexdigest()
+
+
+class TileCache:
+    """
+    Tiles stored as .npy files, with least recently used eviction.
+
+    The size of the cache is kept as a running total: the directory is scanned
+    on the first ``put`` and when the total exceeds ``max_bytes``, not after
+    every tile. The methods can be called from several threads.
+
+    Parameters
+    ----------
+    directory : str | Path
+        Directory of the cached tiles, created if needed
+    max_bytes : int
+        Size of the cache, the least recently used tiles are removed beyond it
+
+    """
+
+    def __init__(self, directory: str | Path, max_bytes: int = DEFAULT_CACHE_SIZE):
+        if max_bytes <= 0:
+            raise ValueError("ERROR!!! max_bytes not correctly defined")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        # running size of the tiles, None until the directory is scanned
+        self._bytes: int | None = None
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def key(pipeline_hash: str, grid: dict[str, Any], band_ids: Sequence[str] | None) -> str:
+        """
+        Cache key of a tile.
+
+        Parameters
+        ----------
+        pipeline_hash : str
+            Parameter hash of the pipeline, see ``parameter_hash``
+        grid : dict[str, Any]
+            Pixel grid of the tile, see ``async_client.pixel_grid``
+        band_ids : Sequence[str] | None
+            Requested bands
+
+        Returns
+        -------
+        str
+            sha256 of the pipeline hash, grid and bands
+
+        """
+        band_ids = None if band_ids is None else list(band_ids)
+        parameters = json.dumps([pipeline_hash, grid, band_ids], sort_keys=True)
+        return hashlib.sha256(parameters.encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.npy"
+
+    def get(self, key: str) -> np.ndarray | None:
+        """
+        Cached tile.
+
+        Parameters
+        ----------
+        key : str
+            Tile key
+
+        Returns
+        -------
+        np.ndarray | None
+            The tile, None if it is not cached or cannot be read
+
+        """
+        path = self._path(key)
+        try:
+            tile = np.load(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, EOFError):
+            # e.g. a tile truncated by a full disk, removed so that it is fetched again
+            self._remove(path)
+            return None
+        # the modification time orders the tiles by last use, utime does not create
+        # the file again if it was evicted in the meantime
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path)
+        return tile
+
+    def _remove(self, path: Path) -> None:
+        # remove a tile and its size from the running total
+        with self._lock:
+            try:
+                size = path.stat().st_size
+            except FileNotFoundError:
+                return
+            path.unlink(missing_ok=True)
+            if self._bytes is not None:
+                self._bytes -= size
+
+    def put(self, key: str, tile: np.ndarray) -> None:
+        """
+        Cache a tile, then evict the least recently used tiles beyond the size.
+
+        Parameters
+        ----------
+        key : str
+            Tile key
+        tile : np.ndarray
+            The tile
+
+        """
+        path = self._path(key)
+        # write then rename, so that concurrent runs never read a partial file
+        tmp = path.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp.npy")
+        np.save(tmp, tile)
+        size = tmp.stat().st_size
+        with self._lock:
+            try:
+                replaced = path.stat().st_size
+            except FileNotFoundError:
+                replaced = 0
+            tmp.replace(path)
+            if self._bytes is None:
+                self._bytes = self.size()
+            else:
+                self._bytes += size - replaced
+            if self._bytes > self.max_bytes:
+                self.evict()
+
+    def _entries(self) -> list[tuple[int, int, Path]]:
+        # (last use, size, path) of the cached tiles
+        entries = []
+        for path in self.directory.glob("*.npy"):
+            if ".tmp" in path.name:
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        return entries
+
+    def evict(self) -> None:
+        """Remove the least recently used tiles until the cache fits in its size."""
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+            # the scan also picks up the tiles written by other runs
+            self._bytes = total
+
+    def size(self) -> int:
+        """
+        Size of the cached tiles.
+
+        Returns
+        -------
+        int
+            Number of bytes
+
+        """
+        return sum(size for _, size, _ in self._entries())
+
+
+def _as_bands(pixels: np.ndarray) -> np.ndarray:
+    # (rows, cols) structured array of computePixels to a (band, row, col) array
+    return np.stack([pixels[name] for name in pixels.dtype.names]).astype(np.float64)
+
+
+async def fetch_pixels(
+    client: AsyncClient,
+    image: Image | dict,
+    bounds: Sequence[float],
+    scale: float,
+    crs: str = "EPSG:4326",
+    band_ids: Sequence[str] | None = None,
+    tile_size: int = 512,
+    cache: TileCache | None = None,
+    pipeline_hash: str | None = None,
+) -> np.ndarray:
+    """
+    Pixels of an image over an AOI, requested tile by tile.
+
+    Parameters
+    ----------
+    client : AsyncClient
+        Open client sending the requests
+    image : Image | dict
+        Image to compute, or its encoded expression
+    bounds : Sequence[float]
+        (xmin, ymin, xmax, ymax) of the AOI in the crs
+    scale : float
+        Pixel size in the units of the crs
+    crs : str
+        Coordinate reference system of the grid
+    band_ids : Sequence[str] | None
+        Bands to compute, all if None
+    tile_size : int
+        Number of rows and columns of each request
+    cache : TileCache | None
+        Cache of the tiles, None to request all of them
+    pipeline_hash : str | None
+        Parameter hash of the pipeline, see ``parameter_hash``; the hash of the
+        serialized image if None
+
+    Returns
+    -------
+    np.ndarray
+        (band, row, col) array, north up
+
+    """
+    xmin, ymin, xmax, ymax = bounds
+    if xmax <= xmin or ymax <= ymin:
+        raise ValueError("ERROR!!! bounds not correctly defined")
+    shape = (math.ceil((ymax - ymin) / scale), math.ceil((xmax - xmin) / scale))
+    # the image is serialized once for all the tiles
+    expression = _expression(image)
+    if pipeline_hash is None:
+        pipeline_hash = parameter_hash(expression=expression)
+
+    async def fetch(tile):
+        rows, cols = tile.write
+        grid = pixel_grid(
+            xmin + cols.start * scale,
+            ymax - rows.start * scale,
+            cols.stop - cols.start,
+            rows.stop - rows.start,
+            scale,
+            crs,
+        )
+        # the cache reads and writes files: off the event loop carrying the requests
+        key = None if cache is None else cache.key(pipeline_hash, grid, band_ids)
+        pixels = None if cache is None else await asyncio.to_thread(cache.get, key)
+        if cache is not None:
+            tracing.metric("pixel_fetcher.cache_hit", int(pixels is not None))
+        if pixels is None:
+            pixels = _as_bands(await client.compute_pixels(expression, grid, band_ids))
+            if cache is not None:
+                await asyncio.to_thread(cache.put, key, pixels)
+        return tile, pixels
+
+    split = tiles(shape, tile_size, 0)
+    out = None
+    with tracing.span("pixel_fetcher.fetch", rows=shape[0], cols=shape[1], tiles=len(split)):
+        for tile, pixels in await asyncio.gather(*(fetch(tile) for tile in split)):
+            if out is None:
+                out = np.empty((pixels.shape[0], *shape), dtype=pixels.dtype)
+            out[:, tile.write[0], tile.write[1]] = pixels
+    return out
+
+
+def fetch(
+    image: Image | dict,
+    bounds: Sequence[float],
+    scale: float,
+    crs: str = "EPSG:4326",
+    band_ids: Sequence[str] | None = None,
+    tile_size: int = 512,
+    cache: TileCache | str | Path | None = None,
+    pipeline_hash: str | None = None,
+    **client_kwargs: Any,
+) -> np.ndarray:
+    """
+    Pixels of an image over an AOI, blocking version of ``fetch_pixels``.
+
+    Parameters
+    ----------
+    image : Image | dict
+        Image to compute, or its encoded expression
+    bounds : Sequence[float]
+        (xmin, ymin, xmax, ymax) of the AOI in the crs
+    scale : float
+        Pixel size in the units of the crs
+    crs : str
+        Coordinate reference system of the grid
+    band_ids : Sequence[str] | None
+        Bands to compute, all if None
+    tile_size : int
+        Number of rows and columns of each request
+    cache : TileCache | str | Path | None
+        Cache of the tiles or its directory, None to request all of them
+    pipeline_hash : str | None
+        Parameter hash of the pipeline, see ``parameter_hash``
+    **client_kwargs : Any
+        Arguments of ``AsyncClient``, e.g. project, credentials and max_concurrency
+
+    Returns
+    -------
+    np.ndarray
+        (band, row, col) array, north up
+
+    """
+    if cache is not None and not isinstance(cache, TileCache):
+        cache = TileCache(cache)
+
+    async def main():
+        async with AsyncClient(**client_kwargs) as client:
+            return await fetch_pixels(
+                client, image, bounds, scale, crs, band_ids, tile_size, cache, pipeline_hash
+            )
+
+    return asyncio.run(main())
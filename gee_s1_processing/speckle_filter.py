@@ -12,13 +12,30 @@ from typing import TYPE_CHECKING
 
 import ee
 
+from . import graph
+from .neighbour_manifest import load_manifest
+
 if TYPE_CHECKING:
+    from collections.abc import Callable
+    from pathlib import Path
+    from typing import Any
+
     from ee.image import Image
     from ee.imagecollection import ImageCollection
 # ---------------------------------------------------------------------------//
 # 1.SPECKLE FILTERS
 # ---------------------------------------------------------------------------//
 
+# Lookup table (J.S.Lee et al 2009) for range and eta values for intensity (only 4 look is shown here)
+LEE_SIGMA_LUT = {
+    0.5: {"I1": 0.694, "I2": 1.385, "eta": 0.1921},
+    0.6: {"I1": 0.630, "I2": 1.495, "eta": 0.2348},
+    0.7: {"I1": 0.560, "I2": 1.627, "eta": 0.2825},
+    0.8: {"I1": 0.480, "I2": 1.804, "eta": 0.3354},
+    0.9: {"I1": 0.378, "I2": 2.094, "eta": 0.3991},
+    0.95: {"I1": 0.302, "I2": 2.360, "eta": 0.4391},
+}
+
 
 def boxcar(image: Image, KERNEL_SIZE: int) -> Image:
     """
@@ -37,7 +54,7 @@ def boxcar(image: Image, KERNEL_SIZE: int) -> Image:
         Filtered Image
 
     """
-    bandNames = image.bandNames().remove("angle")
+    bandNames = graph.filter_bands(image)
     # Define a boxcar kernel
     kernel = ee.Kernel.square((KERNEL_SIZE / 2), units="pixels", normalize=True)
     # Apply boxcar
@@ -65,29 +82,28 @@ def leefilter(image: Image, KERNEL_SIZE: int) -> Image:
         Filtered Image
 
     """
-    bandNames = image.bandNames().remove("angle")
+    bandNames = graph.filter_bands(image)
 
     # S1-GRD images are multilooked 5 times in range
     enl = 5
     # Compute the speckle standard deviation
     eta = 1.0 / math.sqrt(enl)
-    eta = ee.Image.constant(eta)
 
     # MMSE estimator
     # Neighbourhood mean and variance
-    oneImg = ee.Image.constant(1)
+    oneImg = graph.constant(1)
     # Estimate stats
     reducers = ee.Reducer.mean().combine(reducer2=ee.Reducer.variance(), sharedInputs=True)
     stats = image.select(bandNames).reduceNeighborhood(
         reducer=reducers, kernel=ee.Kernel.square(KERNEL_SIZE / 2, "pixels"), optimization="window"
     )
-    meanBand = bandNames.map(lambda bandName: ee.String(bandName).cat("_mean"))
-    varBand = bandNames.map(lambda bandName: ee.String(bandName).cat("_variance"))
+    meanBand = graph.suffixed(bandNames, "_mean")
+    varBand = graph.suffixed(bandNames, "_variance")
 
     z_bar = stats.select(meanBand)
     varz = stats.select(varBand)
-    # Estimate weight
-    varx = (varz.subtract(z_bar.pow(2).multiply(eta.pow(2)))).divide(oneImg.add(eta.pow(2)))
+    # Estimate weight, the constants are folded on the client
+    varx = varz.subtract(z_bar.pow(2).multiply(eta**2)).divide(1 + eta**2)
     b = varx.divide(varz)
 
     # if b is negative set it to zero
@@ -117,14 +133,14 @@ def gammamap(image: Image, KERNEL_SIZE: int):
         Filtered Image
     """
     enl = 5
-    bandNames = image.bandNames().remove("angle")
+    bandNames = graph.filter_bands(image)
     # local mean
     reducers = ee.Reducer.mean().combine(reducer2=ee.Reducer.stdDev(), sharedInputs=True)
     stats = image.select(bandNames).reduceNeighborhood(
         reducer=reducers, kernel=ee.Kernel.square(KERNEL_SIZE / 2, "pixels"), optimization="window"
     )
-    meanBand = bandNames.map(lambda bandName: ee.String(bandName).cat("_mean"))
-    stdDevBand = bandNames.map(lambda bandName: ee.String(bandName).cat("_stdDev"))
+    meanBand = graph.suffixed(bandNames, "_mean")
+    stdDevBand = graph.suffixed(bandNames, "_stdDev")
 
     z = stats.select(meanBand)
     sigz = stats.select(stdDevBand)
@@ -135,24 +151,16 @@ def gammamap(image: Image, KERNEL_SIZE: int):
     cu = 1.0 / math.sqrt(enl)
     # threshold for the observed coefficient of variation
     cmax = math.sqrt(2.0) * cu
-    cu = ee.Image.constant(cu)
-    cmax = ee.Image.constant(cmax)
-    enlImg = ee.Image.constant(enl)
-    oneImg = ee.Image.constant(1)
-    twoImg = ee.Image.constant(2)
 
-    alpha = oneImg.add(cu.pow(2)).divide(ci.pow(2).subtract(cu.pow(2)))
+    # the constants are folded on the client
+    alpha = graph.constant(1 + cu**2).divide(ci.pow(2).subtract(cu**2))
 
     # Implements the Gamma MAP filter described in equation 11 in Lopez et al. 1990
     q = image.select(bandNames).expression(
         "z**2 * (z * alpha - enl - 1)**2 + 4 * alpha * enl * b() * z",
         {"z": z, "alpha": alpha, "enl": enl},
     )
-    rHat = (
-        z.multiply(alpha.subtract(enlImg).subtract(oneImg))
-        .add(q.sqrt())
-        .divide(twoImg.multiply(alpha))
-    )
+    rHat = z.multiply(alpha.subtract(enl + 1)).add(q.sqrt()).divide(alpha.multiply(2))
 
     # if ci <= cu then its a homogenous region ->> boxcar filter
     zHat = (z.updateMask(ci.lte(cu))).rename(bandNames)
@@ -170,6 +178,9 @@ def RefinedLee(image: Image) -> Image:
     This filter is modified from the implementation by Guido Lemoine
     Source: Lemoine et al. https://code.earthengine.google.com/5d1ed0a0f0417f098fdfd2fa137c3d0c
 
+    All the bands but "angle" are filtered together, every operation of the
+    filter applies band-wise to the multi-band image.
+
     Parameters
     ----------
     image: Image
@@ -182,177 +193,138 @@ def RefinedLee(image: Image) -> Image:
 
     """
 
-    bandNames = image.bandNames().remove("angle")
-
-    def inner(b):
-        img = image.select([b])
-
-        # img must be linear, i.e. not in dB!
-        # Set up 3x3 kernels
-        weights3 = ee.List.repeat(ee.List.repeat(1, 3), 3)
-        kernel3 = ee.Kernel.fixed(3, 3, weights3, 1, 1, False)
-
-        mean3 = img.reduceNeighborhood(ee.Reducer.mean(), kernel3)
-        variance3 = img.reduceNeighborhood(ee.Reducer.variance(), kernel3)
-
-        # Use a sample of the 3x3 windows inside a 7x7 windows to determine gradients and directions
-        sample_weights = ee.List(
-            [
-                [0, 0, 0, 0, 0, 0, 0],
-                [0, 1, 0, 1, 0, 1, 0],
-                [0, 0, 0, 0, 0, 0, 0],
-                [0, 1, 0, 1, 0, 1, 0],
-                [0, 0, 0, 0, 0, 0, 0],
-                [0, 1, 0, 1, 0, 1, 0],
-                [0, 0, 0, 0, 0, 0, 0],
-            ]
-        )
-
-        sample_kernel = ee.Kernel.fixed(7, 7, sample_weights, 3, 3, False)
+    bandNames = graph.filter_bands(image)
+    # img must be linear, i.e. not in dB!
+    img = image.select(bandNames)
 
-        # Calculate mean and variance for the sampled windows and store as 9 bands
-        sample_mean = mean3.neighborhoodToBands(sample_kernel)
-        sample_var = variance3.neighborhoodToBands(sample_kernel)
+    # Set up 3x3 kernels
+    weights3 = ee.List.repeat(ee.List.repeat(1, 3), 3)
+    kernel3 = ee.Kernel.fixed(3, 3, weights3, 1, 1, False)
 
-        # Determine the 4 gradients for the sampled windows
-        gradients = sample_mean.select(1).subtract(sample_mean.select(7)).abs()
-        gradients = gradients.addBands(sample_mean.select(6).subtract(sample_mean.select(2)).abs())
-        gradients = gradients.addBands(sample_mean.select(3).subtract(sample_mean.select(5)).abs())
-        gradients = gradients.addBands(sample_mean.select(0).subtract(sample_mean.select(8)).abs())
-
-        # And find the maximum gradient amongst gradient bands
-        max_gradient = gradients.reduce(ee.Reducer.max())
-
-        # Create a mask for band pixels that are the maximum gradient
-        gradmask = gradients.eq(max_gradient)
-
-        # duplicate gradmask bands: each gradient represents 2 directions
-        gradmask = gradmask.addBands(gradmask)
-
-        # Determine the 8 directions
-        directions = (
-            sample_mean.select(1)
-            .subtract(sample_mean.select(4))
-            .gt(sample_mean.select(4).subtract(sample_mean.select(7)))
-            .multiply(1)
-        )
-        directions = directions.addBands(
-            sample_mean.select(6)
-            .subtract(sample_mean.select(4))
-            .gt(sample_mean.select(4).subtract(sample_mean.select(2)))
-            .multiply(2)
-        )
-        directions = directions.addBands(
-            sample_mean.select(3)
-            .subtract(sample_mean.select(4))
-            .gt(sample_mean.select(4).subtract(sample_mean.select(5)))
-            .multiply(3)
-        )
-        directions = directions.addBands(
-            sample_mean.select(0)
-            .subtract(sample_mean.select(4))
-            .gt(sample_mean.select(4).subtract(sample_mean.select(8)))
-            .multiply(4)
-        )
-        # The next 4 are the not() of the previous 4
-        directions = directions.addBands(directions.select(0).Not().multiply(5))
-        directions = directions.addBands(directions.select(1).Not().multiply(6))
-        directions = directions.addBands(directions.select(2).Not().multiply(7))
-        directions = directions.addBands(directions.select(3).Not().multiply(8))
-
-        # Mask all values that are not 1-8
-        directions = directions.updateMask(gradmask)
-
-        # "collapse" the stack into a singe band image (due to masking, each pixel has just one value (1-8) in it's directional band, and is otherwise masked)
-        directions = directions.reduce(ee.Reducer.sum())
-
-        sample_stats = sample_var.divide(sample_mean.multiply(sample_mean))
-
-        # Calculate localNoiseVariance
-        sigmaV = (
-            sample_stats.toArray()
-            .arraySort()
-            .arraySlice(0, 0, 5)
-            .arrayReduce(ee.Reducer.mean(), [0])
-        )
-
-        # Set up the 7*7 kernels for directional statistics
-        rect_weights = ee.List.repeat(ee.List.repeat(0, 7), 3).cat(
-            ee.List.repeat(ee.List.repeat(1, 7), 4)
-        )
-
-        diag_weights = ee.List(
-            [
-                [1, 0, 0, 0, 0, 0, 0],
-                [1, 1, 0, 0, 0, 0, 0],
-                [1, 1, 1, 0, 0, 0, 0],
-                [1, 1, 1, 1, 0, 0, 0],
-                [1, 1, 1, 1, 1, 0, 0],
-                [1, 1, 1, 1, 1, 1, 0],
-                [1, 1, 1, 1, 1, 1, 1],
-            ]
-        )
-
-        rect_kernel = ee.Kernel.fixed(7, 7, rect_weights, 3, 3, False)
-        diag_kernel = ee.Kernel.fixed(7, 7, diag_weights, 3, 3, False)
-
-        # Create stacks for mean and variance using the original kernels. Mask with relevant direction.
-        dir_mean = img.reduceNeighborhood(ee.Reducer.mean(), rect_kernel).updateMask(
-            directions.eq(1)
-        )
-        dir_var = img.reduceNeighborhood(ee.Reducer.variance(), rect_kernel).updateMask(
-            directions.eq(1)
-        )
+    # mean and variance in a single pass over each kernel
+    reducers = ee.Reducer.mean().combine(reducer2=ee.Reducer.variance(), sharedInputs=True)
+    stats3 = img.reduceNeighborhood(reducers, kernel3)
+    mean3 = stats3.select(".*_mean")
+    variance3 = stats3.select(".*_variance")
+
+    # Use a sample of the 3x3 windows inside a 7x7 windows to determine gradients and directions
+    sample_weights = ee.List(
+        [
+            [0, 0, 0, 0, 0, 0, 0],
+            [0, 1, 0, 1, 0, 1, 0],
+            [0, 0, 0, 0, 0, 0, 0],
+            [0, 1, 0, 1, 0, 1, 0],
+            [0, 0, 0, 0, 0, 0, 0],
+            [0, 1, 0, 1, 0, 1, 0],
+            [0, 0, 0, 0, 0, 0, 0],
+        ]
+    )
 
-        dir_mean = dir_mean.addBands(
-            img.reduceNeighborhood(ee.Reducer.mean(), diag_kernel).updateMask(directions.eq(2))
-        )
-        dir_var = dir_var.addBands(
-            img.reduceNeighborhood(ee.Reducer.variance(), diag_kernel).updateMask(directions.eq(2))
-        )
+    sample_kernel = ee.Kernel.fixed(7, 7, sample_weights, 3, 3, False)
+
+    # The 9 sampled windows, in row major order. neighborhoodToBands names its
+    # bands after the input band and the x_y offset, the window k of every band
+    # is selected by its offset. The windows are renamed to the band names: the
+    # image collections below reduce their items band by band, by name
+    offsets = [f"_{dx}_{dy}" for dy in [-2, 0, 2] for dx in [-2, 0, 2]]
+    sample_mean = mean3.neighborhoodToBands(sample_kernel)
+    sample_mean = [sample_mean.select(f".*{offset}").rename(bandNames) for offset in offsets]
+
+    # Determine the 4 gradients for the sampled windows
+    gradients = [
+        sample_mean[1].subtract(sample_mean[7]).abs(),
+        sample_mean[6].subtract(sample_mean[2]).abs(),
+        sample_mean[3].subtract(sample_mean[5]).abs(),
+        sample_mean[0].subtract(sample_mean[8]).abs(),
+    ]
+
+    # And find the maximum gradient amongst gradient bands
+    max_gradient = ee.ImageCollection(gradients).reduce(ee.Reducer.max())
+
+    # Create a mask for band pixels that are the maximum gradient
+    gradmask = [gradient.eq(max_gradient) for gradient in gradients]
+
+    # Determine the 8 directions
+    directions = [
+        sample_mean[1]
+        .subtract(sample_mean[4])
+        .gt(sample_mean[4].subtract(sample_mean[7]))
+        .multiply(1),
+        sample_mean[6]
+        .subtract(sample_mean[4])
+        .gt(sample_mean[4].subtract(sample_mean[2]))
+        .multiply(2),
+        sample_mean[3]
+        .subtract(sample_mean[4])
+        .gt(sample_mean[4].subtract(sample_mean[5]))
+        .multiply(3),
+        sample_mean[0]
+        .subtract(sample_mean[4])
+        .gt(sample_mean[4].subtract(sample_mean[8]))
+        .multiply(4),
+    ]
+    # The next 4 are the not() of the previous 4
+    directions += [directions[i].Not().multiply(i + 5) for i in range(4)]
+
+    # Mask all values that are not 1-8, each gradient represents 2 directions
+    directions = [direction.updateMask(gradmask[i % 4]) for i, direction in enumerate(directions)]
+
+    # "collapse" the stack into a singe band image (due to masking, each pixel has just one value (1-8) in it's directional band, and is otherwise masked)
+    directions = ee.ImageCollection(directions).sum()
+
+    # Calculate localNoiseVariance: the mean of the 5 lowest of the 9 sampled
+    # values. With m their median (the 5th lowest), sum(min(v, m)) adds m for
+    # each of the 4 highest, so the 5 lowest sum to sum(min(v, m)) - 4 * m
+    sample_stats = variance3.divide(mean3.multiply(mean3))
+    median = sample_stats.reduceNeighborhood(ee.Reducer.median(), sample_kernel)
+    samples = sample_stats.neighborhoodToBands(sample_kernel)
+    lowest = samples.select(f".*{offsets[0]}").rename(bandNames).min(median)
+    for offset in offsets[1:]:
+        lowest = lowest.add(samples.select(f".*{offset}").rename(bandNames).min(median))
+    sigmaV = lowest.subtract(median.multiply(4)).divide(5)
+
+    # Set up the 7*7 kernels for directional statistics
+    rect_weights = ee.List.repeat(ee.List.repeat(0, 7), 3).cat(
+        ee.List.repeat(ee.List.repeat(1, 7), 4)
+    )
 
-        # and add the bands for rotated kernels
-        for i in range(1, 4):
-            dir_mean = dir_mean.addBands(
-                img.reduceNeighborhood(ee.Reducer.mean(), rect_kernel.rotate(i)).updateMask(
-                    directions.eq(2 * i + 1)
-                )
-            )
-            dir_var = dir_var.addBands(
-                img.reduceNeighborhood(ee.Reducer.variance(), rect_kernel.rotate(i)).updateMask(
-                    directions.eq(2 * i + 1)
-                )
-            )
-            dir_mean = dir_mean.addBands(
-                img.reduceNeighborhood(ee.Reducer.mean(), diag_kernel.rotate(i)).updateMask(
-                    directions.eq(2 * i + 2)
-                )
-            )
-            dir_var = dir_var.addBands(
-                img.reduceNeighborhood(ee.Reducer.variance(), diag_kernel.rotate(i)).updateMask(
-                    directions.eq(2 * i + 2)
-                )
-            )
+    diag_weights = ee.List(
+        [
+            [1, 0, 0, 0, 0, 0, 0],
+            [1, 1, 0, 0, 0, 0, 0],
+            [1, 1, 1, 0, 0, 0, 0],
+            [1, 1, 1, 1, 0, 0, 0],
+            [1, 1, 1, 1, 1, 0, 0],
+            [1, 1, 1, 1, 1, 1, 0],
+            [1, 1, 1, 1, 1, 1, 1],
+        ]
+    )
 
-        # "collapse" the stack into a single band image (due to masking, each pixel has just one value in it's directional band, and is otherwise masked)
-        dir_mean = dir_mean.reduce(ee.Reducer.sum())
-        dir_var = dir_var.reduce(ee.Reducer.sum())
+    rect_kernel = ee.Kernel.fixed(7, 7, rect_weights, 3, 3, False)
+    diag_kernel = ee.Kernel.fixed(7, 7, diag_weights, 3, 3, False)
 
-        # A finally generate the filtered value
-        varX = dir_var.subtract(dir_mean.multiply(dir_mean).multiply(sigmaV)).divide(
-            sigmaV.add(1.0)
-        )
+    # Statistics of the 8 directional kernels, direction k in item k - 1
+    kernels = [rect_kernel, diag_kernel]
+    for i in range(1, 4):
+        kernels += [rect_kernel.rotate(i), diag_kernel.rotate(i)]
+    dir_stats = [img.reduceNeighborhood(reducers, kernel) for kernel in kernels]
 
-        b = varX.divide(dir_var)
-        result = dir_mean.add(b.multiply(img.subtract(dir_mean)))
+    # keep the statistics of the direction of each pixel, and "collapse" them into a single image
+    dir_masks = [directions.eq(k + 1) for k in range(8)]
+    dir_mean = ee.ImageCollection(
+        [dir_stats[k].select(".*_mean").updateMask(dir_masks[k]) for k in range(8)]
+    ).sum()
+    dir_var = ee.ImageCollection(
+        [dir_stats[k].select(".*_variance").updateMask(dir_masks[k]) for k in range(8)]
+    ).sum()
 
-        return result.arrayProject([0]).arrayFlatten([["sum"]]).float()
+    # A finally generate the filtered value
+    varX = dir_var.subtract(dir_mean.multiply(dir_mean).multiply(sigmaV)).divide(sigmaV.add(1.0))
 
-    result = (
-        ee.ImageCollection(bandNames.map(inner)).toBands().rename(bandNames).copyProperties(image)
-    )
+    b = varX.divide(dir_var)
+    result = dir_mean.add(b.multiply(img.subtract(dir_mean)))
 
-    return image.addBands(result, None, True)
+    return image.addBands(result.rename(bandNames).float(), None, True)
 
 
 def leesigma(image: Image, KERNEL_SIZE: int):
@@ -377,21 +349,22 @@ def leesigma(image: Image, KERNEL_SIZE: int):
     """
 
     # parameters
-    Tk = ee.Image.constant(7)  # number of bright pixels in a 3x3 window
+    Tk = 7  # number of bright pixels in a 3x3 window
     sigma = 0.9
     enl = 4
     target_kernel = 3
-    bandNames = image.bandNames().remove("angle")
+    bandNames = graph.filter_bands(image)
+    img = image.select(bandNames)
 
     # compute the 98 percentile intensity
     z98 = ee.Dictionary(
-        image.select(bandNames).reduceRegion(
+        img.reduceRegion(
             reducer=ee.Reducer.percentile([98]), geometry=image.geometry(), scale=10, maxPixels=1e13
         )
     ).toImage()
 
     # select the strong scatterers to retain
-    brightPixel = image.select(bandNames).gte(z98)
+    brightPixel = img.gte(z98)
     K = brightPixel.reduceNeighborhood(
         ee.Reducer.countDistinctNonNull(), ee.Kernel.square(target_kernel / 2)
     )
@@ -400,52 +373,36 @@ def leesigma(image: Image, KERNEL_SIZE: int):
     # compute the a-priori mean within a 3x3 local window
     # original noise standard deviation since the data is 5 look
     eta = 1.0 / math.sqrt(enl)
-    eta = ee.Image.constant(eta)
     # MMSE applied to estimate the apriori mean
     reducers = ee.Reducer.mean().combine(reducer2=ee.Reducer.variance(), sharedInputs=True)
-    stats = image.select(bandNames).reduceNeighborhood(
+    stats = img.reduceNeighborhood(
         reducer=reducers,
         kernel=ee.Kernel.square(target_kernel / 2, "pixels"),
         optimization="window",
     )
-    meanBand = bandNames.map(lambda bandName: ee.String(bandName).cat("_mean"))
-    varBand = bandNames.map(lambda bandName: ee.String(bandName).cat("_variance"))
+    meanBand = graph.suffixed(bandNames, "_mean")
+    varBand = graph.suffixed(bandNames, "_variance")
 
     z_bar = stats.select(meanBand)
     varz = stats.select(varBand)
 
-    oneImg = ee.Image.constant(1)
-    varx = (varz.subtract(z_bar.abs().pow(2).multiply(eta.pow(2)))).divide(oneImg.add(eta.pow(2)))
+    # the constants are folded on the client
+    oneImg = graph.constant(1)
+    varx = varz.subtract(z_bar.abs().pow(2).multiply(eta**2)).divide(1 + eta**2)
     b = varx.divide(varz)
-    xTilde = oneImg.subtract(b).multiply(z_bar.abs()).add(b.multiply(image.select(bandNames)))
+    xTilde = oneImg.subtract(b).multiply(z_bar.abs()).add(b.multiply(img))
 
     # step 3: compute the sigma range
-    # Lookup table (J.S.Lee et al 2009) for range and eta values for intensity (only 4 look is shown here)
-    LUT = ee.Dictionary(
-        {
-            0.5: ee.Dictionary({"I1": 0.694, "I2": 1.385, "eta": 0.1921}),
-            0.6: ee.Dictionary({"I1": 0.630, "I2": 1.495, "eta": 0.2348}),
-            0.7: ee.Dictionary({"I1": 0.560, "I2": 1.627, "eta": 0.2825}),
-            0.8: ee.Dictionary({"I1": 0.480, "I2": 1.804, "eta": 0.3354}),
-            0.9: ee.Dictionary({"I1": 0.378, "I2": 2.094, "eta": 0.3991}),
-            0.95: ee.Dictionary({"I1": 0.302, "I2": 2.360, "eta": 0.4391}),
-        }
-    )
-
-    # extract data from lookup
-    sigmaImage = ee.Dictionary(LUT.get(str(sigma))).toImage()
-    I1 = sigmaImage.select("I1")
-    I2 = sigmaImage.select("I2")
-    # new speckle sigma
-    nEta = sigmaImage.select("eta")
+    # extract data from the lookup table, on the client
+    I1, I2, nEta = (LEE_SIGMA_LUT[sigma][key] for key in ["I1", "I2", "eta"])
     # establish the sigma ranges
-    I1 = I1.multiply(xTilde)
-    I2 = I2.multiply(xTilde)
+    I1 = xTilde.multiply(I1)
+    I2 = xTilde.multiply(I2)
 
     # step 3: apply MMSE filter for pixels in the sigma range
     # MMSE estimator
-    mask = image.select(bandNames).gte(I1).Or(image.select(bandNames).lte(I2))
-    z = image.select(bandNames).updateMask(mask)
+    mask = img.gte(I1).Or(img.lte(I2))
+    z = img.updateMask(mask)
 
     stats = z.reduceNeighborhood(
         reducer=reducers, kernel=ee.Kernel.square(KERNEL_SIZE / 2, "pixels"), optimization="window"
@@ -454,14 +411,14 @@ def leesigma(image: Image, KERNEL_SIZE: int):
     z_bar = stats.select(meanBand)
     varz = stats.select(varBand)
 
-    varx = (varz.subtract(z_bar.abs().pow(2).multiply(nEta.pow(2)))).divide(oneImg.add(nEta.pow(2)))
+    varx = varz.subtract(z_bar.abs().pow(2).multiply(nEta**2)).divide(1 + nEta**2)
     b = varx.divide(varz)
     # if b is negative set it to zero
     new_b = b.where(b.lt(0), 0)
     xHat = oneImg.subtract(new_b).multiply(z_bar.abs()).add(new_b.multiply(z))
 
     # remove the applied masks and merge the retained pixels and the filtered pixels
-    xHat = image.select(bandNames).updateMask(retainPixel).unmask(xHat)
+    xHat = img.updateMask(retainPixel).unmask(xHat)
     output = ee.Image(xHat).rename(bandNames)
     return image.addBands(output, None, True)
 
@@ -471,16 +428,14 @@ def leesigma(image: Image, KERNEL_SIZE: int):
 # ---------------------------------------------------------------------------//
 
 
-def MonoTemporal_Filter(
-    coll: ImageCollection, KERNEL_SIZE: int, SPECKLE_FILTER: str
-) -> ImageCollection:
+def spatial_filter(image: Image, KERNEL_SIZE: int, SPECKLE_FILTER: str) -> Image:
     """
-    A wrapper function for monotemporal filter
+    Apply the speckle filter named as in the wrappers to one image.
 
     Parameters
     ----------
-    coll : ImageCollection
-        the image collection to be filtered.
+    image : Image
+        Image to be filtered
     KERNEL_SIZE : int
         Spatial Neighbourhood window. Positive odd integer.
     SPECKLE_FILTER : str
@@ -488,13 +443,11 @@ def MonoTemporal_Filter(
 
     Returns
     -------
-    ImageCollection
-        An image collection where a mono-temporal filter is applied to each
-        image individually
+    Image
+        Filtered image
 
     """
-
-    def _filter(image: Image):
+    with graph.scope():
         if SPECKLE_FILTER == "BOXCAR":
             _filtered = boxcar(image, KERNEL_SIZE)
         elif SPECKLE_FILTER == "LEE":
@@ -505,9 +458,32 @@ def MonoTemporal_Filter(
             _filtered = RefinedLee(image)
         elif SPECKLE_FILTER == "LEE SIGMA":
             _filtered = leesigma(image, KERNEL_SIZE)
-        return _filtered
+    return _filtered
 
-    return coll.map(_filter)
+
+def MonoTemporal_Filter(
+    coll: ImageCollection, KERNEL_SIZE: int, SPECKLE_FILTER: str
+) -> ImageCollection:
+    """
+    A wrapper function for monotemporal filter
+
+    Parameters
+    ----------
+    coll : ImageCollection
+        the image collection to be filtered.
+    KERNEL_SIZE : int
+        Spatial Neighbourhood window. Positive odd integer.
+    SPECKLE_FILTER : str
+        Type of speckle filter
+
+    Returns
+    -------
+    ImageCollection
+        An image collection where a mono-temporal filter is applied to each
+        image individually
+
+    """
+    return coll.map(lambda image: spatial_filter(image, KERNEL_SIZE, SPECKLE_FILTER))
 
 
 # ---------------------------------------------------------------------------//
@@ -515,12 +491,37 @@ def MonoTemporal_Filter(
 # ---------------------------------------------------------------------------//
 
 
-def MultiTemporal_Filter(
-    coll: ImageCollection, KERNEL_SIZE: int, SPECKLE_FILTER: str, NR_OF_IMAGES: int
-) -> ImageCollection:
+def quegan_filter(
+    coll: ImageCollection,
+    KERNEL_SIZE: int,
+    SPECKLE_FILTER: str,
+    NR_OF_IMAGES: int,
+    NEIGHBOUR_SELECTION: str = "ARCHIVE",
+    NEIGHBOUR_POOL: ImageCollection | None = None,
+    OVERLAP_MAX_ERROR: float = 10,
+    NEIGHBOUR_MANIFEST: dict[str, Any] | str | Path | None = None,
+) -> Callable[[Image], Image]:
     """
 
-    A wrapper function for multi-temporal filter
+    Per-image function of the multi-temporal filter of the images of coll
+
+    Every scene of the archive that can be a temporal neighbour is spatially
+    filtered once, in a shared collection of filtered and ratio images keyed by
+    ``system:index``. The Quegan sums of each image are then assembled from that
+    collection instead of filtering every neighbour again for each image.
+
+    The neighbour candidates of an image are the scenes of the same relative
+    orbit intersecting it. With NEIGHBOUR_SELECTION "ARCHIVE" they are queried
+    from the pool, and the overlap test run, for every image. With "JOIN" they
+    are saved on the images of coll by an ``ee.Join.saveAll``, time-sorted, and
+    the overlap test and date selection of all the images are run in one pass
+    over the join; each image then looks its neighbour ids up by
+    ``system:index``, which avoids one archive query per image on long time
+    series.
+
+    Neighbour lists resolved offline with ``neighbour_manifest.build_manifest``
+    can be passed as NEIGHBOUR_MANIFEST: the images listed in it use their
+    explicit scene ids, and only the others go through the overlap search.
 
     Parameters
     ----------
@@ -532,28 +533,39 @@ def MultiTemporal_Filter(
         Type of speckle filter
     NR_OF_IMAGES : int
         Number of images to use in multi-temporal filtering. Positive integer.
+    NEIGHBOUR_SELECTION : str
+        How neighbour candidates are found, either "ARCHIVE" or "JOIN"
+    NEIGHBOUR_POOL : ImageCollection | None
+        Collection the neighbours are taken from, e.g. ``coll`` itself. Defaults
+        to the COPERNICUS/S1_GRD_FLOAT scenes intersecting ``coll``.
+    OVERLAP_MAX_ERROR : float
+        Maximum error in meters of the geometry operations of the overlap test.
+        Larger values make the test cheaper but less precise.
+    NEIGHBOUR_MANIFEST : dict[str, Any] | str | Path | None
+        Neighbour manifest, or path to a manifest file, built with the same
+        NR_OF_IMAGES
 
     Returns
     -------
-    ImageCollection
-        An image collection where a multi-temporal filter is applied to each
-        image individually
+    Callable[[Image], Image]
+        The filter of one image of coll, to be mapped over coll or composed
+        with other per-image steps
 
     """
-
-    def Quegan(image: Image) -> Image:
+    if NEIGHBOUR_SELECTION not in ["ARCHIVE", "JOIN"]:
+        raise ValueError("ERROR!!! NEIGHBOUR_SELECTION not correctly defined")
+    if NEIGHBOUR_MANIFEST is not None:
+        NEIGHBOUR_MANIFEST = load_manifest(NEIGHBOUR_MANIFEST)
+        if NEIGHBOUR_MANIFEST["nr_of_images"] != NR_OF_IMAGES:
+            raise ValueError("ERROR!!! NEIGHBOUR_MANIFEST not built for NR_OF_IMAGES")
+        manifest_neighbours = ee.Dictionary(NEIGHBOUR_MANIFEST["neighbours"])
+
+    def setresample(image):
+        return image.resample()
+
+    def inner(image: Image) -> Image:
         """
-        The following Multi-temporal speckle filters are implemented as described in
-        S. Quegan and J. J. Yu, “Filtering of multichannel SAR images,”
-        IEEE Trans Geosci. Remote Sensing, vol. 39, Nov. 2001.
-
-        this function will filter the collection used for the multi-temporal part
-        it takes care of:
-        - same image geometry (i.e relative orbit)
-        - full overlap of image
-        - amount of images taken for filtering
-            -- all before
-           -- if not enough, images taken after the image to filter are added
+        Creats an image whose bands are the image, the filtered image and image ratio
 
         Parameters
         ----------
@@ -563,39 +575,108 @@ def MultiTemporal_Filter(
         Returns
         -------
         Image
-            Filtered image
+            Image, filtered image and image ratio
 
         """
+        with graph.scope():
+            bands = graph.filter_bands(image)
+            meanBands = graph.suffixed(bands, "_mean")
+            ratioBands = graph.suffixed(bands, "_ratio")
+            _filtered = (
+                spatial_filter(image, KERNEL_SIZE, SPECKLE_FILTER).select(bands).rename(meanBands)
+            )
+            img = image.select(bands)
+            _ratio = img.divide(_filtered).rename(ratioBands)
+            output = img.addBands(_filtered).addBands(_ratio)
+        return ee.Image(output.copyProperties(image, ["system:index", "system:time_start"]))
+
+    # the scenes that can be temporal neighbours of the collection
+    if NEIGHBOUR_POOL is None:
+        s1_archive = (
+            ee.ImageCollection("COPERNICUS/S1_GRD_FLOAT")
+            .filterBounds(coll.geometry())
+            .filter(ee.Filter.eq("instrumentMode", "IW"))
+            .map(setresample)
+        )
+    else:
+        s1_archive = ee.ImageCollection(NEIGHBOUR_POOL)
+    # each of them is spatially filtered once, whatever the number of images using it
+    s1_filtered = s1_archive.map(inner)
+
+    if NEIGHBOUR_SELECTION == "JOIN":
+        # candidates of every image at once: same relative orbit and intersecting footprint
+        join_filter = ee.Filter.And(
+            ee.Filter.Or(
+                ee.Filter.equals(
+                    leftField="relativeOrbitNumber_stop", rightField="relativeOrbitNumber_stop"
+                ),
+                ee.Filter.equals(
+                    leftField="relativeOrbitNumber_start", rightField="relativeOrbitNumber_stop"
+                ),
+            ),
+            ee.Filter.intersects(leftField=".geo", rightField=".geo", maxError=OVERLAP_MAX_ERROR),
+        )
+        s1_joined = ee.Join.saveAll(
+            matchesKey="neighbours", ordering="system:time_start", ascending=True, outer=True
+        ).apply(coll, s1_archive, join_filter)
 
-        def setresample(image):
-            return image.resample()
-
-        def get_filtered_collection(image: Image) -> ImageCollection:
+        def resolve_neighbours(joined: ee.Feature) -> ee.Feature:
             """
-            Generate a dedicated image collection
+            Neighbour ids of an image of the join, from the candidates saved on it
 
             Parameters
             ----------
-            image : Image
-                Image whose geometry is used to define the new collection
+            joined : ee.Feature
+                Image of coll with its candidates in the "neighbours" property
 
             Returns
             -------
-            ImageCollection
+            ee.Feature
+                Feature with the system:index of the image and of its neighbours
 
             """
+            image = ee.Image(joined)
+            candidates = ee.List(
+                ee.Algorithms.If(image.get("neighbours"), image.get("neighbours"), [])
+            )
+            return ee.Feature(
+                None,
+                {
+                    "index": image.get("system:index"),
+                    "neighbour_ids": get_neighbour_ids(image, candidates),
+                },
+            )
+
+    def get_neighbour_ids(image: Image, candidates: ee.List | None = None) -> ee.List:
+        """
+        Select the temporal neighbours of an image
+
+        Parameters
+        ----------
+        image : Image
+            Image whose geometry is used to select the neighbours
+        candidates : ee.List | None
+            Neighbour candidates of the image saved by the join, queried from
+            the archive if None
 
+        Returns
+        -------
+        ee.List
+            system:index of the neighbours
+
+        """
+
+        polarisation_filter = ee.Filter.listContains(
+            "transmitterReceiverPolarisation",
+            ee.List(image.get("transmitterReceiverPolarisation")).get(-1),
+        )
+        if candidates is not None:
+            s1_coll = ee.ImageCollection.fromImages(candidates).filter(polarisation_filter)
+        else:
             # filter collection over are and by relative orbit
             s1_coll = (
-                ee.ImageCollection("COPERNICUS/S1_GRD_FLOAT")
-                .filterBounds(image.geometry())
-                .filter(ee.Filter.eq("instrumentMode", "IW"))
-                .filter(
-                    ee.Filter.listContains(
-                        "transmitterReceiverPolarisation",
-                        ee.List(image.get("transmitterReceiverPolarisation")).get(-1),
-                    )
-                )
+                s1_archive.filterBounds(image.geometry())
+                .filter(polarisation_filter)
                 .filter(
                     ee.Filter.Or(
                         ee.Filter.eq(
@@ -606,118 +687,199 @@ def MultiTemporal_Filter(
                         ),
                     )
                 )
-                .map(setresample)
             )
 
-            # a function that takes the image and checks for the overlap
-            def check_overlap(_image: Image) -> ImageCollection:
-                """
-                get all S1 frames from this date intersecting with the image bounds
-
-                Parameters
-                ----------
-                _image : Image
-                    Image to check the overlap with
-
-                Returns
-                -------
-                ImageCollection
-                    A collection with matching geometry
-
-                """
-
-                # get all S1 frames from this date intersecting with the image bounds
-                s1 = s1_coll.filterDate(_image.date(), _image.date().advance(1, "day"))
-                # intersect those images with the image to filter
-                intersect = image.geometry().intersection(s1.geometry().dissolve(), 10)
-                # check if intersect is sufficient
-                valid_date = ee.Algorithms.If(
-                    intersect.area(10).divide(image.geometry().area(10)).gt(0.95),
-                    _image.date().format("YYYY-MM-dd"),
-                )
-                return ee.Feature(None, {"date": valid_date})
+        # a function that takes the image and checks for the overlap
+        def check_overlap(_image: Image) -> ImageCollection:
+            """
+            get all S1 frames from this date intersecting with the image bounds
 
-            # this function will pick up the acq dates for fully overlapping acquisitions before the image acquistion
-            dates_before = (
-                s1_coll.filterDate("2014-01-01", image.date().advance(1, "day"))
-                .sort("system:time_start", False)
+            Parameters
+            ----------
+            _image : Image
+                Image to check the overlap with
+
+            Returns
+            -------
+            ImageCollection
+                A collection with matching geometry
+
+            """
+
+            # get all S1 frames from this date intersecting with the image bounds
+            s1 = s1_coll.filterDate(_image.date(), _image.date().advance(1, "day"))
+            # intersect those images with the image to filter
+            intersect = image.geometry().intersection(
+                s1.geometry().dissolve(OVERLAP_MAX_ERROR), OVERLAP_MAX_ERROR
+            )
+            # check if intersect is sufficient
+            valid_date = ee.Algorithms.If(
+                intersect.area(OVERLAP_MAX_ERROR)
+                .divide(image.geometry().area(OVERLAP_MAX_ERROR))
+                .gt(0.95),
+                _image.date().format("YYYY-MM-dd"),
+            )
+            return ee.Feature(None, {"date": valid_date})
+
+        # this function will pick up the acq dates for fully overlapping acquisitions before the image acquistion
+        dates_before = (
+            s1_coll.filterDate("2014-01-01", image.date().advance(1, "day"))
+            .sort("system:time_start", False)
+            .limit(5 * NR_OF_IMAGES)
+            .map(check_overlap)
+            .distinct("date")
+            .aggregate_array("date")
+        )
+
+        # if the images before are not enough, we add images from after the image acquisition
+        # this will only be the case at the beginning of S1 mission
+        dates = ee.List(
+            ee.Algorithms.If(
+                dates_before.size().gte(NR_OF_IMAGES),
+                dates_before.slice(0, NR_OF_IMAGES),
+                s1_coll.filterDate(image.date(), "2100-01-01")
+                .sort("system:time_start", True)
                 .limit(5 * NR_OF_IMAGES)
                 .map(check_overlap)
                 .distinct("date")
                 .aggregate_array("date")
+                .cat(dates_before)
+                .distinct()
+                .sort()
+                .slice(0, NR_OF_IMAGES),
             )
+        )
 
-            # if the images before are not enough, we add images from after the image acquisition
-            # this will only be the case at the beginning of S1 mission
-            dates = ee.List(
-                ee.Algorithms.If(
-                    dates_before.size().gte(NR_OF_IMAGES),
-                    dates_before.slice(0, NR_OF_IMAGES),
-                    s1_coll.filterDate(image.date(), "2100-01-01")
-                    .sort("system:time_start", True)
-                    .limit(5 * NR_OF_IMAGES)
-                    .map(check_overlap)
-                    .distinct("date")
-                    .aggregate_array("date")
-                    .cat(dates_before)
-                    .distinct()
-                    .sort()
-                    .slice(0, NR_OF_IMAGES),
-                )
+        # now we get the acquisitions of those dates for multi-temporal filtering
+        return dates.map(
+            lambda date: s1_coll.filterDate(date, ee.Date(date).advance(1, "day")).aggregate_array(
+                "system:index"
             )
+        ).flatten()
+
+    if NEIGHBOUR_SELECTION == "JOIN":
+        # overlap test and date selection of every image in one pass over the join,
+        # looked up by system:index as the manifest instead of one query per image
+        s1_resolved = s1_joined.map(resolve_neighbours)
+        join_neighbours = ee.Dictionary.fromLists(
+            s1_resolved.aggregate_array("index"), s1_resolved.aggregate_array("neighbour_ids")
+        )
 
-            # now we re-filter the collection to get the right acquisitions for multi-temporal filtering
-            return ee.ImageCollection(
-                dates.map(
-                    lambda date: s1_coll.filterDate(date, ee.Date(date).advance(1, "day")).toList(
-                        s1_coll.size()
-                    )
-                ).flatten()
-            )
+    def Quegan(image: Image) -> Image:
+        """
+        The following Multi-temporal speckle filters are implemented as described in
+        S. Quegan and J. J. Yu, “Filtering of multichannel SAR images,”
+        IEEE Trans Geosci. Remote Sensing, vol. 39, Nov. 2001.
+
+        the neighbours of the image are taken from the shared filtered collection,
+        as is the filtered image itself when it is one of them,
+        their selection takes care of:
+        - same image geometry (i.e relative orbit)
+        - full overlap of image
+        - amount of images taken for filtering
+            -- all before
+           -- if not enough, images taken after the image to filter are added
 
-        # we get our dedicated image collection for that image
-        s1 = get_filtered_collection(image)
+        Parameters
+        ----------
+        image : Image
+            Image to be filtered
 
-        bands = image.bandNames().remove("angle")
-        s1 = s1.select(bands)
-        meanBands = bands.map(lambda bandName: ee.String(bandName).cat("_mean"))
-        ratioBands = bands.map(lambda bandName: ee.String(bandName).cat("_ratio"))
-        count_img = s1.reduce(ee.Reducer.count())
+        Returns
+        -------
+        Image
+            Filtered image
 
-        def inner(image: Image) -> Image:
-            """
-            Creats an image whose bands are the filtered image and image ratio
+        """
+        # we get the already filtered neighbours of that image
+        index = image.get("system:index")
+        if NEIGHBOUR_SELECTION == "JOIN":
+            neighbour_ids = join_neighbours.get(index)
+        else:
+            neighbour_ids = get_neighbour_ids(image)
+        if NEIGHBOUR_MANIFEST is not None:
+            # explicit scene ids of the manifest, overlap search for images not in it
+            neighbour_ids = ee.Algorithms.If(
+                manifest_neighbours.contains(index), manifest_neighbours.get(index), neighbour_ids
+            )
+        s1 = s1_filtered.filter(ee.Filter.inList("system:index", neighbour_ids))
+
+        with graph.scope():
+            bands = graph.filter_bands(image)
+            meanBands = graph.suffixed(bands, "_mean")
+            ratioBands = graph.suffixed(bands, "_ratio")
+            count_img = s1.select(bands).reduce(ee.Reducer.count())
+
+            isum = s1.select(ratioBands).reduce(ee.Reducer.sum())
+            # the image is usually one of its neighbours, already filtered in the pool;
+            # it is filtered again only when it is not in it
+            centre = s1.filter(ee.Filter.eq("system:index", index))
+            filtered = ee.Image(
+                ee.Algorithms.If(
+                    centre.size().gt(0),
+                    ee.Image(centre.first()).select(meanBands).rename(bands),
+                    spatial_filter(image, KERNEL_SIZE, SPECKLE_FILTER).select(bands),
+                )
+            )
+            divide = filtered.divide(count_img)
+            output = divide.multiply(isum).rename(bands)
 
-            Parameters
-            ----------
-            image : Image
-                Image to be filtered
+        return image.addBands(output, None, True)
 
-            Returns
-            -------
-            Image
-                Filtered image and image ratio
+    return Quegan
 
-            """
-            if SPECKLE_FILTER == "BOXCAR":
-                _filtered = boxcar(image, KERNEL_SIZE).select(bands).rename(meanBands)
-            elif SPECKLE_FILTER == "LEE":
-                _filtered = leefilter(image, KERNEL_SIZE).select(bands).rename(meanBands)
-            elif SPECKLE_FILTER == "GAMMA MAP":
-                _filtered = gammamap(image, KERNEL_SIZE).select(bands).rename(meanBands)
-            elif SPECKLE_FILTER == "REFINED LEE":
-                _filtered = RefinedLee(image).select(bands).rename(meanBands)
-            elif SPECKLE_FILTER == "LEE SIGMA":
-                _filtered = leesigma(image, KERNEL_SIZE).select(bands).rename(meanBands)
-
-            _ratio = image.select(bands).divide(_filtered).rename(ratioBands)
-            return _filtered.addBands(_ratio)
-
-        isum = s1.map(inner).select(ratioBands).reduce(ee.Reducer.sum())
-        filtered = inner(image).select(meanBands)
-        divide = filtered.divide(count_img)
-        output = divide.multiply(isum).rename(bands)
 
-        return image.addBands(output, None, True)
+def MultiTemporal_Filter(
+    coll: ImageCollection,
+    KERNEL_SIZE: int,
+    SPECKLE_FILTER: str,
+    NR_OF_IMAGES: int,
+    NEIGHBOUR_SELECTION: str = "ARCHIVE",
+    NEIGHBOUR_POOL: ImageCollection | None = None,
+    OVERLAP_MAX_ERROR: float = 10,
+    NEIGHBOUR_MANIFEST: dict[str, Any] | str | Path | None = None,
+) -> ImageCollection:
+    """
+    A wrapper function for multi-temporal filter, see ``quegan_filter``
+
+    Parameters
+    ----------
+    coll : ImageCollection
+        the image collection to be filtered
+    KERNEL_SIZE : int
+        Spatial Neighbourhood window. Positive odd integer.
+    SPECKLE_FILTER : str
+        Type of speckle filter
+    NR_OF_IMAGES : int
+        Number of images to use in multi-temporal filtering. Positive integer.
+    NEIGHBOUR_SELECTION : str
+        How neighbour candidates are found, either "ARCHIVE" or "JOIN"
+    NEIGHBOUR_POOL : ImageCollection | None
+        Collection the neighbours are taken from, e.g. ``coll`` itself. Defaults
+        to the COPERNICUS/S1_GRD_FLOAT scenes intersecting ``coll``.
+    OVERLAP_MAX_ERROR : float
+        Maximum error in meters of the geometry operations of the overlap test.
+        Larger values make the test cheaper but less precise.
+    NEIGHBOUR_MANIFEST : dict[str, Any] | str | Path | None
+        Neighbour manifest, or path to a manifest file, built with the same
+        NR_OF_IMAGES
+
+    Returns
+    -------
+    ImageCollection
+        An image collection where a multi-temporal filter is applied to each
+        image individually
 
-    return coll.map(Quegan)
+    """
+    return coll.map(
+        quegan_filter(
+            coll,
+            KERNEL_SIZE,
+            SPECKLE_FILTER,
+            NR_OF_IMAGES,
+            NEIGHBOUR_SELECTION,
+            NEIGHBOUR_POOL,
+            OVERLAP_MAX_ERROR,
+            NEIGHBOUR_MANIFEST,
+        )
+    )
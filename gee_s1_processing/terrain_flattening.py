@@ -9,51 +9,199 @@ Remote Sensing, 12(11), [1867]. https://doi.org/10.3390/rs12111867
 
 from __future__ import annotations
 
-import math
 from typing import TYPE_CHECKING
 
 import ee
 
+from . import graph
+from . import heading as hd
+
 if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from ee.dictionary import Dictionary
+    from ee.ee_string import String
+    from ee.geometry import Geometry
     from ee.image import Image
     from ee.imagecollection import ImageCollection
+    from ee.projection import Projection
 
 
-def slope_correction(
+def _terrain_angles(elevation: Image, geom: Geometry) -> tuple[Image, Image]:
+    """
+
+    Parameters
+    ----------
+    elevation : Image
+        The DEM on the grid of the scene
+    geom : Geometry
+        The footprint of the scene
+
+    Returns
+    -------
+    tuple[Image, Image]
+        The slope steepness (alpha_s) and the slope aspect (phi_s) in radians
+
+    """
+    alpha_sRad = ee.Terrain.slope(elevation).select("slope").multiply(graph.DEG2RAD)
+
+    aspect = ee.Terrain.aspect(elevation).select("aspect").clip(geom)
+
+    aspect_minus = aspect.updateMask(aspect.gt(180)).subtract(360)
+
+    phi_sRad = (
+        aspect.updateMask(aspect.lte(180))
+        .unmask()
+        .add(aspect_minus.unmask())
+        .multiply(-graph.DEG2RAD)
+    )
+    return alpha_sRad, phi_sRad
+
+
+def terrain_geometry(DEM: Image, proj: Projection, geom: Geometry) -> Image:
+    """
+
+    Parameters
+    ----------
+    DEM : Image
+        The DEM to be used
+    proj : Projection
+        The projection of the scenes, resampled to 10 m
+    geom : Geometry
+        The footprint covered by the scenes
+
+    Returns
+    -------
+    Image
+        The scene independent terrain geometry: the "alpha_s" (slope steepness)
+        and "phi_s" (slope aspect) bands in radians. It can be exported as an
+        asset and passed to ``slope_correction`` as TERRAIN_GEOMETRY
+
+    """
+    elevation = DEM.resample("bilinear").reproject(proj, None, 10).clip(geom)
+    alpha_sRad, phi_sRad = _terrain_angles(elevation, geom)
+    return alpha_sRad.rename("alpha_s").addBands(phi_sRad.rename("phi_s"))
+
+
+def terrain_geometry_key(image: Image) -> String:
+    """
+
+    Parameters
+    ----------
+    image : Image
+        S1 scene
+
+    Returns
+    -------
+    String
+        "<relative orbit>_<crs>_<x offset>_<y offset>", the scenes sharing a key
+        share their terrain geometry. The offsets are the origin of the pixel
+        grid modulo the pixel size, in hundredths of a pixel, so that the scenes
+        of a key are on the same grid and the geometry is not resampled
+
+    """
+    proj = image.select(1).projection()
+    # [xScale, xShearing, xTranslation, yShearing, yScale, yTranslation]
+    transform = ee.List(ee.Dictionary(ee.Algorithms.Describe(proj)).get("transform"))
+
+    def _offset(translation: int, scale: int) -> String:
+        phase = ee.Number(transform.get(translation)).divide(transform.get(scale))
+        return phase.subtract(phase.floor()).multiply(100).round().mod(100).format("%d")
+
+    return (
+        ee.Number(image.get("relativeOrbitNumber_start"))
+        .format("%d")
+        .cat("_")
+        .cat(proj.crs())
+        .cat("_")
+        .cat(_offset(2, 0))
+        .cat("_")
+        .cat(_offset(5, 4))
+    )
+
+
+def orbit_terrain_geometry(collection: ImageCollection, DEM: Image) -> Dictionary:
+    """
+
+    Parameters
+    ----------
+    collection : ImageCollection
+        The scenes to be normalized
+    DEM : Image
+        The DEM to be used
+
+    Returns
+    -------
+    Dictionary
+        The terrain geometry of each relative orbit, projection and pixel grid of
+        the collection, over the union of their footprints, keyed by
+        ``terrain_geometry_key``. It is computed once and shared by the scenes
+
+    """
+    collection = collection.map(
+        lambda image: image.set("terrain_geometry_key", terrain_geometry_key(image))
+    )
+    keys = ee.List(collection.aggregate_array("terrain_geometry_key")).distinct()
+
+    def _geometry(key: String) -> Image:
+        scenes = collection.filter(ee.Filter.eq("terrain_geometry_key", key))
+        proj = ee.Image(scenes.first()).select(1).projection()
+        return terrain_geometry(DEM, proj, scenes.geometry().dissolve(10))
+
+    return ee.Dictionary.fromLists(keys, keys.map(_geometry))
+
+
+def slope_correction_function(
     collection: ImageCollection,
     TERRAIN_FLATTENING_MODEL: str,
     DEM: str,
     TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER: int,
-) -> ImageCollection:
+    TERRAIN_GEOMETRY: Image | Dictionary | None = None,
+    HEADING: str = "ANGLE",
+) -> Callable[[Image], Image]:
     """
+    Per-image radiometric terrain normalization of the images of collection
 
     Parameters
     ----------
     collection : ImageCollection
-        DESCRIPTION.
+        The images to be normalized, shared parts are computed over it
     TERRAIN_FLATTENING_MODEL : str
         The radiometric terrain normalization model, either volume or direct
     DEM : str
         The DEM to be used
     TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER : int
         The additional buffer to account for the passive layover and shadow
+    TERRAIN_GEOMETRY : Image | Dictionary | None
+        Precomputed terrain geometry (see ``terrain_geometry``), or terrain
+        geometries keyed by ``terrain_geometry_key`` (see
+        ``orbit_terrain_geometry``). By default the slope and aspect of the DEM
+        are computed for each scene
+    HEADING : str
+        The look direction estimate: "ANGLE", from the incidence angle band of
+        each scene, or "METADATA", from the orbit pass and the footprint
+        latitude (see ``heading.metadata_heading``)
     Returns
     -------
-    ImageCollection
-        An image collection where radiometric terrain normalization is
-        implemented on each image
+    Callable[[Image], Image]
+        The normalization of one image of collection, without its
+        "system:time_start"
 
     """
 
-    ninetyRad = ee.Image.constant(90).multiply(math.pi / 180)
+    if HEADING not in ["ANGLE", "METADATA"]:
+        raise ValueError("ERROR!!! Parameter HEADING not correctly defined")
 
-    def _volumetric_model_SCF(theta_iRad: Image, alpha_rRad: Image) -> Image:
+    # computed once per relative orbit, only for the scenes without orbit pass
+    orbit_headings = hd.orbit_headings(collection) if HEADING == "METADATA" else None
+
+    def _volumetric_model_SCF(theta_cRad: Image, alpha_rRad: Image) -> Image:
         """
 
         Parameters
         ----------
-        theta_iRad : Image
-            The scene incidence angle
+        theta_cRad : Image
+            The complement of the scene incidence angle
         alpha_rRad : Image
             Slope steepness in range
 
@@ -65,17 +213,17 @@ def slope_correction(
         """
 
         # Volume model
-        nominator = (ninetyRad.subtract(theta_iRad).add(alpha_rRad)).tan()
-        denominator = (ninetyRad.subtract(theta_iRad)).tan()
+        nominator = theta_cRad.add(alpha_rRad).tan()
+        denominator = theta_cRad.tan()
         return nominator.divide(denominator)
 
-    def _direct_model_SCF(theta_iRad: Image, alpha_rRad: Image, alpha_azRad: Image) -> Image:
+    def _direct_model_SCF(theta_cRad: Image, alpha_rRad: Image, alpha_azRad: Image) -> Image:
         """
 
         Parameters
         ----------
-        theta_iRad : Image
-            The scene incidence angle
+        theta_cRad : Image
+            The complement of the scene incidence angle
         alpha_rRad : Image
             Slope steepness in range
         alpha_azRad : Image
@@ -88,10 +236,8 @@ def slope_correction(
 
         """
         # Surface model
-        nominator = (ninetyRad.subtract(theta_iRad)).cos()
-        denominator = alpha_azRad.cos().multiply(
-            (ninetyRad.subtract(theta_iRad).add(alpha_rRad)).cos()
-        )
+        nominator = theta_cRad.cos()
+        denominator = alpha_azRad.cos().multiply(theta_cRad.add(alpha_rRad).cos())
         return nominator.divide(denominator)
 
     def _erode(image: Image, distance: int) -> Image:
@@ -124,7 +270,7 @@ def slope_correction(
 
         return image.updateMask(d.gt(distance))
 
-    def _masking(alpha_rRad: Image, theta_iRad: Image, buffer: int) -> Image:
+    def _masking(alpha_rRad: Image, theta_iRad: Image, theta_cRad: Image, buffer: int) -> Image:
         """
 
         Parameters
@@ -133,6 +279,8 @@ def slope_correction(
             Slope steepness in range
         theta_iRad : Image
             The scene incidence angle
+        theta_cRad : Image
+            Complement of the scene incidence angle
         buffer : int
             DESCRIPTION.
 
@@ -146,10 +294,8 @@ def slope_correction(
         # calculate masks
         # layover, where slope > radar viewing angle
         layover = alpha_rRad.lt(theta_iRad).rename("layover")
-        # shadow
-        shadow = alpha_rRad.gt(
-            ee.Image.constant(-1).multiply(ninetyRad.subtract(theta_iRad))
-        ).rename("shadow")
+        # shadow, where slope < incidence angle - pi/2, with the sum shared by the models
+        shadow = theta_cRad.add(alpha_rRad).gt(0).rename("shadow")
         # combine layover and shadow
         mask = layover.And(shadow)
         # add buffer to final mask
@@ -178,41 +324,32 @@ def slope_correction(
         geom = image.geometry()
         proj = image.select(1).projection()
 
-        elevation = DEM.resample("bilinear").reproject(proj, None, 10).clip(geom)
-
         # calculate the look direction
-        heading = ee.Terrain.aspect(image.select("angle")).reduceRegion(
-            ee.Reducer.mean(), image.geometry(), 1000
-        )
-
-        # in case of null values for heading replace with 0
-        heading = ee.Dictionary(heading).combine({"aspect": 0}, False).get("aspect")
-
-        heading = ee.Algorithms.If(
-            ee.Number(heading).gt(180), ee.Number(heading).subtract(360), ee.Number(heading)
-        )
+        if HEADING == "METADATA":
+            heading = hd.metadata_heading(image, orbit_headings)
+        else:
+            heading = hd.angle_heading(image)
 
         # the numbering follows the article chapters
         # 2.1.1 Radar geometry
-        theta_iRad = image.select("angle").multiply(math.pi / 180)
-        phi_iRad = ee.Image.constant(heading).multiply(math.pi / 180)
+        theta_iRad = image.select("angle").multiply(graph.DEG2RAD)
+        # its complement is shared by the model and the mask
+        theta_cRad = graph.constant(graph.HALF_PI).subtract(theta_iRad)
+        phi_iRad = ee.Image.constant(heading).multiply(graph.DEG2RAD)
 
         # 2.1.2 Terrain geometry
-        alpha_sRad = ee.Terrain.slope(elevation).select("slope").multiply(math.pi / 180)
-
-        aspect = ee.Terrain.aspect(elevation).select("aspect").clip(geom)
-
-        aspect_minus = aspect.updateMask(aspect.gt(180)).subtract(360)
-
-        phi_sRad = (
-            aspect.updateMask(aspect.lte(180))
-            .unmask()
-            .add(aspect_minus.unmask())
-            .multiply(-1)
-            .multiply(math.pi / 180)
-        )
-
-        # elevation = DEM.reproject(proj,None, 10).clip(geom)
+        if TERRAIN_GEOMETRY is None:
+            elevation = DEM.resample("bilinear").reproject(proj, None, 10).clip(geom)
+            alpha_sRad, phi_sRad = _terrain_angles(elevation, geom)
+        else:
+            # shared by the scenes, only the angle dependent parts are computed per scene
+            if isinstance(TERRAIN_GEOMETRY, ee.Image):
+                geometry = TERRAIN_GEOMETRY
+            else:
+                geometry = ee.Image(TERRAIN_GEOMETRY.get(terrain_geometry_key(image)))
+            geometry = geometry.clip(geom)
+            alpha_sRad = geometry.select("alpha_s")
+            phi_sRad = geometry.select("phi_s")
 
         # 2.1.3 Model geometry
         # reduce to 3 angle
@@ -230,19 +367,68 @@ def slope_correction(
 
         if TERRAIN_FLATTENING_MODEL == "VOLUME":
             # Volumetric Model
-            scf = _volumetric_model_SCF(theta_iRad, alpha_rRad)
+            scf = _volumetric_model_SCF(theta_cRad, alpha_rRad)
 
         if TERRAIN_FLATTENING_MODEL == "DIRECT":
-            scf = _direct_model_SCF(theta_iRad, alpha_rRad, alpha_azRad)
+            scf = _direct_model_SCF(theta_cRad, alpha_rRad, alpha_azRad)
 
         # apply model for Gamm0
         gamma0_flat = gamma0.multiply(scf)
 
         # get Layover/Shadow mask
-        mask = _masking(alpha_rRad, theta_iRad, TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER)
+        mask = _masking(
+            alpha_rRad, theta_iRad, theta_cRad, TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER
+        )
         output = gamma0_flat.mask(mask).rename(bandNames).copyProperties(image)
-        output = ee.Image(output).addBands(image.select("angle"), None, True)
+        return ee.Image(output).addBands(image.select("angle"), None, True)
+
+    return _correct
 
-        return output.set("system:time_start", image.get("system:time_start"))
 
-    return collection.map(_correct)
+def slope_correction(
+    collection: ImageCollection,
+    TERRAIN_FLATTENING_MODEL: str,
+    DEM: str,
+    TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER: int,
+    TERRAIN_GEOMETRY: Image | Dictionary | None = None,
+    HEADING: str = "ANGLE",
+) -> ImageCollection:
+    """
+
+    Parameters
+    ----------
+    collection : ImageCollection
+        DESCRIPTION.
+    TERRAIN_FLATTENING_MODEL : str
+        The radiometric terrain normalization model, either volume or direct
+    DEM : str
+        The DEM to be used
+    TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER : int
+        The additional buffer to account for the passive layover and shadow
+    TERRAIN_GEOMETRY : Image | Dictionary | None
+        Precomputed terrain geometry (see ``terrain_geometry``), or terrain
+        geometries keyed by ``terrain_geometry_key`` (see
+        ``orbit_terrain_geometry``). By default the slope and aspect of the DEM
+        are computed for each scene
+    HEADING : str
+        The look direction estimate: "ANGLE", from the incidence angle band of
+        each scene, or "METADATA", from the orbit pass and the footprint
+        latitude (see ``heading.metadata_heading``)
+    Returns
+    -------
+    ImageCollection
+        An image collection where radiometric terrain normalization is
+        implemented on each image
+
+    """
+    _correct = slope_correction_function(
+        collection,
+        TERRAIN_FLATTENING_MODEL,
+        DEM,
+        TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER,
+        TERRAIN_GEOMETRY,
+        HEADING,
+    )
+    return collection.map(
+        lambda image: _correct(image).set("system:time_start", image.get("system:time_start"))
+    )
@@ -0,0 +1,421 @@
+"""
+Description: Tracing spans and metrics of the processing, sent to pluggable sinks.
+
+A span times one stage: the client side build of a graph by the wrappers, a
+blocking request to the server (``get_info``, the requests of the
+``AsyncClient``, the export task calls) or a stage of the local backend. Spans
+nest, a span opened inside another one is its child, and they carry the
+parameters of the stage as attributes. Metrics are single named values, e.g.
+the number of bytes of a response.
+
+Nothing is recorded until a sink is added:
+
+- ``LoggingSink`` logs one record per span, with the span in its ``extra``
+- ``JsonLinesSink`` writes one JSON object per span or metric
+- ``OpenTelemetrySink`` forwards them to an OpenTelemetry tracer and meter
+
+Any object with the ``start``, ``end`` and ``metric`` methods of ``Sink`` can
+be used as a sink.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import secrets
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Generator
+
+_SINKS: list[Sink] = []
+_CURRENT: contextvars.ContextVar[Span | None] = contextvars.ContextVar("span", default=None)
+
+
+@dataclass
+class Span:
+    """
+    Timed stage of the processing.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage, e.g. "wrapper.ard" or "ee.getInfo"
+    trace_id : str
+        Id shared by the spans of one trace
+    span_id : str
+        Id of the span
+    parent_id : str | None
+        Id of the enclosing span, None for the root of a trace
+    start : float
+        Start time, in seconds since the epoch
+    duration : float
+        Duration in seconds, set when the span ends
+    status : str
+        "OK", or "ERROR" if the stage raised
+    attributes : dict[str, Any]
+        Parameters and results of the stage
+
+    """
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None = None
+    start: float = 0.0
+    duration: float = 0.0
+    status: str = "OK"
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+    def set(self, **attributes: Any) -> None:
+        """
+        Add attributes to the span.
+
+        Parameters
+        ----------
+        **attributes : Any
+            Attributes of the span
+
+        """
+        self.attributes.update(attributes)
+
+
+class Sink:
+    """Receives the spans and metrics, every method does nothing by default."""
+
+    def start(self, span: Span) -> None:
+        """
+        A span starts.
+
+        Parameters
+        ----------
+        span : Span
+            The span, without duration yet
+
+        """
+
+    def end(self, span: Span) -> None:
+        """
+        A span ends.
+
+        Parameters
+        ----------
+        span : Span
+            The span, with its duration and status
+
+        """
+
+    def metric(self, name: str, value: float, attributes: dict[str, Any]) -> None:
+        """
+        A metric is recorded.
+
+        Parameters
+        ----------
+        name : str
+            Name of the metric
+        value : float
+            Its value
+        attributes : dict[str, Any]
+            Attributes of the value
+
+        """
+
+
+class LoggingSink(Sink):
+    """
+    Log the spans and metrics.
+
+    Parameters
+    ----------
+    logger : str | logging.Logger
+        Logger, or its name
+    level : int
+        Level of the records
+
+    """
+
+    def __init__(
+        self, logger: str | logging.Logger = "gee_s1_processing", level: int = logging.INFO
+    ):
+        self.logger = logging.getLogger(logger) if isinstance(logger, str) else logger
+        self.level = level
+
+    def end(self, span: Span) -> None:
+        self.logger.log(
+            self.level,
+            "%s %s in %.3f s %s",
+            span.name,
+            span.status,
+            span.duration,
+            span.attributes,
+            extra={"span": asdict(span)},
+        )
+
+    def metric(self, name: str, value: float, attributes: dict[str, Any]) -> None:
+        self.logger.log(
+            self.level,
+            "%s = %s %s",
+            name,
+            value,
+            attributes,
+            extra={"metric": {"name": name, "value": value, "attributes": attributes}},
+        )
+
+
+class JsonLinesSink(Sink):
+    """
+    Write the spans and metrics as JSON lines.
+
+    Parameters
+    ----------
+    output : str | Path | IO[str]
+        File the lines are appended to, or an open text stream
+
+    """
+
+    def __init__(self, output: str | Path | IO[str]):
+        self._owned = not hasattr(output, "write")
+        self._stream = Path(output).open("a", encoding="utf-8") if self._owned else output  # noqa: SIM115
+        self._lock = threading.Lock()
+
+    def _write(self, record: dict[str, Any]) -> None:
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self._stream.write(line + "\n")
+            self._stream.flush()
+
+    def end(self, span: Span) -> None:
+        self._write({"type": "span", **asdict(span)})
+
+    def metric(self, name: str, value: float, attributes: dict[str, Any]) -> None:
+        record = {"name": name, "value": value, "time": time.time(), "attributes": attributes}
+        self._write({"type": "metric", **record})
+
+    def close(self) -> None:
+        """Close the file opened by the sink."""
+        if self._owned:
+            self._stream.close()
+
+
+class OpenTelemetrySink(Sink):
+    """
+    Forward the spans and metrics to OpenTelemetry.
+
+    The metrics are recorded as histograms. It needs the ``opentelemetry-api``
+    package, and an SDK configured by the application to export them.
+
+    Parameters
+    ----------
+    tracer : Any
+        OpenTelemetry tracer, the global one of the package if None
+    meter : Any
+        OpenTelemetry meter, the global one of the package if None
+
+    """
+
+    def __init__(self, tracer: Any = None, meter: Any = None):
+        from opentelemetry import metrics, trace
+
+        self._trace = trace
+        self.tracer = tracer or trace.get_tracer("gee_s1_processing")
+        self.meter = meter or metrics.get_meter("gee_s1_processing")
+        self._spans: dict[str, Any] = {}
+        self._histograms: dict[str, Any] = {}
+
+    def start(self, span: Span) -> None:
+        parent = self._spans.get(span.parent_id)
+        context = None if parent is None else self._trace.set_span_in_context(parent)
+        self._spans[span.span_id] = self.tracer.start_span(
+            span.name, context=context, start_time=int(span.start * 1e9)
+        )
+
+    def end(self, span: Span) -> None:
+        otel_span = self._spans.pop(span.span_id, None)
+        if otel_span is None:
+            return
+        otel_span.set_attributes(_otel_attributes(span.attributes))
+        if span.status == "ERROR":
+            otel_span.set_status(
+                self._trace.Status(self._trace.StatusCode.ERROR, span.attributes.get("error"))
+            )
+        otel_span.end(end_time=int((span.start + span.duration) * 1e9))
+
+    def metric(self, name: str, value: float, attributes: dict[str, Any]) -> None:
+        if name not in self._histograms:
+            self._histograms[name] = self.meter.create_histogram(name)
+        self._histograms[name].record(value, _otel_attributes(attributes))
+
+
+def _otel_attributes(attributes: dict[str, Any]) -> dict[str, Any]:
+    # OpenTelemetry attributes are str, bool, int or float
+    return {
+        key: value if isinstance(value, str | bool | int | float) else str(value)
+        for key, value in attributes.items()
+    }
+
+
+def add_sink(sink: Sink) -> None:
+    """
+    Send the spans and metrics to a sink.
+
+    Parameters
+    ----------
+    sink : Sink
+        The sink
+
+    """
+    _SINKS.append(sink)
+
+
+def remove_sink(sink: Sink) -> None:
+    """
+    Stop sending the spans and metrics to a sink.
+
+    Parameters
+    ----------
+    sink : Sink
+        A sink added with ``add_sink``
+
+    """
+    _SINKS.remove(sink)
+
+
+@contextlib.contextmanager
+def use_sink(sink: Sink) -> Generator[Sink, None, None]:
+    """
+    Send the spans and metrics to a sink within a block.
+
+    Parameters
+    ----------
+    sink : Sink
+        The sink
+
+    Yields
+    ------
+    Sink
+        The sink
+
+    """
+    add_sink(sink)
+    try:
+        yield sink
+    finally:
+        remove_sink(sink)
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes: Any) -> Generator[Span, None, None]:
+    """
+    Time a block as a span, child of the current span.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage
+    **attributes : Any
+        Attributes of the span
+
+    Yields
+    ------
+    Span
+        The span, more attributes can be set on it
+
+    """
+    parent = _CURRENT.get()
+    current = Span(
+        name,
+        trace_id=secrets.token_hex(16) if parent is None else parent.trace_id,
+        span_id=secrets.token_hex(8),
+        parent_id=None if parent is None else parent.span_id,
+        start=time.time(),
+        attributes=attributes,
+    )
+    sinks = list(_SINKS)
+    for sink in sinks:
+        sink.start(current)
+    token = _CURRENT.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as error:
+        current.status = "ERROR"
+        current.set(error=f"{type(error).__name__}: {error}")
+        raise
+    finally:
+        current.duration = time.perf_counter() - start
+        _CURRENT.reset(token)
+        for sink in sinks:
+            sink.end(current)
+
+
+def traced(name: str) -> Callable[[Callable], Callable]:
+    """
+    Time every call of a function as a span.
+
+    Parameters
+    ----------
+    name : str
+        Name of the spans
+
+    Returns
+    -------
+    Callable[[Callable], Callable]
+        Decorator of the function
+
+    """
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def metric(name: str, value: float, **attributes: Any) -> None:
+    """
+    Record a metric.
+
+    Parameters
+    ----------
+    name : str
+        Name of the metric
+    value : float
+        Its value
+    **attributes : Any
+        Attributes of the value
+
+    """
+    for sink in list(_SINKS):
+        sink.metric(name, value, attributes)
+
+
+def get_info(obj: Any, name: str = "ee.getInfo") -> Any:
+    """
+    Blocking ``getInfo`` of an Earth Engine object, timed as a span.
+
+    Parameters
+    ----------
+    obj : Any
+        Object with a ``getInfo`` method
+    name : str
+        Name of the span
+
+    Returns
+    -------
+    Any
+        The computed value
+
+    """
+    with span(name, type=type(obj).__name__):
+        return obj.getInfo()
@@ -8,10 +8,81 @@ Description: The modified wrapper function to derive the Sentinel-1 ARD
 """
 
 import ee
+from ee.dictionary import Dictionary
+from ee.image import Image
 from ee.imagecollection import ImageCollection
 
+from . import pipeline, tracing
 from . import speckle_filter as sf
 from . import terrain_flattening as trf
+from .metadata_cache import MetadataCache
+
+
+def _check_terrain_normalization(
+    TERRAIN_FLATTENING_MODEL: str,
+    TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER: int,
+    TERRAIN_FLATTENING_HEADING: str,
+) -> None:
+    if TERRAIN_FLATTENING_MODEL not in ["DIRECT", "VOLUME"]:
+        raise ValueError("ERROR!!! Parameter TERRAIN_FLATTENING_MODEL not correctly defined")
+    if TERRAIN_FLATTENING_HEADING not in ["ANGLE", "METADATA"]:
+        raise ValueError("ERROR!!! Parameter TERRAIN_FLATTENING_HEADING not correctly defined")
+    if TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER < 0:
+        raise ValueError(
+            "ERROR!!! TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER not correctly defined"
+        )
+
+
+def _terrain_geometry(
+    col: ImageCollection, terrain_geometry: str | Image | None, DEM: str
+) -> Image | Dictionary | None:
+    if terrain_geometry == "ORBIT":
+        return trf.orbit_terrain_geometry(col, ee.Image(DEM))
+    if terrain_geometry is not None:
+        return ee.Image(terrain_geometry)
+    return None
+
+
+def _check_speckle_filter(
+    SPECKLE_FILTER_FRAMEWORK: str,
+    SPECKLE_FILTER: str,
+    SPECKLE_FILTER_KERNEL_SIZE: int,
+    SPECKLE_FILTER_NEIGHBOUR_SELECTION: str,
+    SPECKLE_FILTER_OVERLAP_MAX_ERROR: float,
+) -> None:
+    if SPECKLE_FILTER_FRAMEWORK not in ["MONO", "MULTI"]:
+        raise ValueError("ERROR!!! SPECKLE_FILTER_FRAMEWORK not correctly defined")
+
+    if SPECKLE_FILTER not in ["BOXCAR", "LEE", "GAMMA MAP", "REFINED LEE", "LEE SIGMA"]:
+        raise ValueError("ERROR!!! SPECKLE_FILTER not correctly defined")
+
+    if SPECKLE_FILTER_KERNEL_SIZE <= 0:
+        raise ValueError("ERROR!!! SPECKLE_FILTER_KERNEL_SIZE not correctly defined")
+
+    if SPECKLE_FILTER_NEIGHBOUR_SELECTION not in ["ARCHIVE", "JOIN"]:
+        raise ValueError("ERROR!!! SPECKLE_FILTER_NEIGHBOUR_SELECTION not correctly defined")
+
+    if SPECKLE_FILTER_OVERLAP_MAX_ERROR <= 0:
+        raise ValueError("ERROR!!! SPECKLE_FILTER_OVERLAP_MAX_ERROR not correctly defined")
+
+
+def _check_polarisations(
+    col: ImageCollection, metadata_cache: MetadataCache | None
+) -> ImageCollection:
+    bands = None if metadata_cache is None else metadata_cache.band_names(col)
+    if bands is not None:
+        if not [band for band in bands if band in ["VV", "VH"]]:
+            raise ValueError("Filters only apply to VH and VV bands.")
+        return col
+    # no blocking getInfo: the missing key error is only raised by the server
+    # when the collection is computed, if neither VV nor VH is present
+    return ee.ImageCollection(
+        ee.Algorithms.If(
+            ee.List(["VV", "VH"]).removeAll(col.first().bandNames()).size().lt(2),
+            col,
+            ee.Dictionary({}).get("Filters only apply to VH and VV bands."),
+        )
+    )
 
 
 def terrain_normalization_wrapper(
@@ -19,6 +90,8 @@ def terrain_normalization_wrapper(
     terrain_flattening_model: str = "VOLUME",
     terrain_flattening_additional_layover_shadow_buffer: int = 3,
     dem: str = "USGS/SRTMGL1_003",
+    terrain_geometry: str | Image | None = None,
+    terrain_flattening_heading: str = "ANGLE",
 ) -> ImageCollection:
     """
     Applies terrain normalization to a collection of GEE images.
@@ -30,6 +103,14 @@ def terrain_normalization_wrapper(
     terrain_flattening_model : str
     terrain_flattening_additional_layover_shadow_buffer : int
     dem : str
+    terrain_geometry : str | Image | None
+        "ORBIT" to compute the slope and aspect of the DEM once per relative
+        orbit, or a precomputed terrain geometry image or asset id (see
+        ``terrain_flattening.terrain_geometry``). By default they are computed
+        for each image
+    terrain_flattening_heading : str
+        "ANGLE" to estimate the look direction from the incidence angle of each
+        image, "METADATA" to derive it from the orbit pass and latitude
 
     Raises
     ------
@@ -39,26 +120,33 @@ def terrain_normalization_wrapper(
     -------
     ImageCollection
         Image Collection with normalized terrain.
-    """
+    """  # noqa: DOC502
     TERRAIN_FLATTENING_MODEL = terrain_flattening_model or "VOLUME"
     DEM = dem or "USGS/SRTMGL1_003"
     TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER = (
         terrain_flattening_additional_layover_shadow_buffer or 0
     )
-    if TERRAIN_FLATTENING_MODEL not in ["DIRECT", "VOLUME"]:
-        raise ValueError("ERROR!!! Parameter TERRAIN_FLATTENING_MODEL not correctly defined")
-    if TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER < 0:
-        raise ValueError(
-            "ERROR!!! TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER not correctly defined"
-        )
-
-    col = trf.slope_correction(
-        col,
+    TERRAIN_FLATTENING_HEADING = terrain_flattening_heading or "ANGLE"
+    _check_terrain_normalization(
         TERRAIN_FLATTENING_MODEL,
-        ee.Image(DEM),
         TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER,
+        TERRAIN_FLATTENING_HEADING,
     )
-    print("Terrain normalization is completed")  # noqa: T201, E501
+
+    with tracing.span(
+        "wrapper.terrain_normalization",
+        model=TERRAIN_FLATTENING_MODEL,
+        buffer=TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER,
+        heading=TERRAIN_FLATTENING_HEADING,
+    ):
+        col = trf.slope_correction(
+            col,
+            TERRAIN_FLATTENING_MODEL,
+            ee.Image(DEM),
+            TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER,
+            _terrain_geometry(col, terrain_geometry, DEM),
+            TERRAIN_FLATTENING_HEADING,
+        )
     return col
 
 
@@ -68,6 +156,11 @@ def speckle_filter_wrapper(
     speckle_filter: str = "BOXCAR",
     speckle_filter_kernel_size: int = 3,
     speckle_filter_nr_of_images: int = 10,
+    speckle_filter_neighbour_selection: str = "ARCHIVE",
+    speckle_filter_neighbour_pool: ImageCollection | None = None,
+    speckle_filter_overlap_max_error: float = 10,
+    speckle_filter_neighbour_manifest: dict | str | None = None,
+    metadata_cache: MetadataCache | None = None,
 ):
     """
     Applies preprocessing to a collection of S1 images to return
@@ -81,6 +174,17 @@ def speckle_filter_wrapper(
     speckle_filter : str
     speckle_filter_kernel_size : int
     speckle_filter_nr_of_images : int
+    speckle_filter_neighbour_selection : str
+        "ARCHIVE" or "JOIN", how the MULTI framework finds temporal neighbours
+    speckle_filter_neighbour_pool : ImageCollection | None
+        Collection the MULTI framework takes neighbours from, defaults to the archive
+    speckle_filter_overlap_max_error : float
+        Maximum error in meters of the MULTI framework overlap test
+    speckle_filter_neighbour_manifest : dict | str | None
+        Neighbour manifest, or its path, with the MULTI framework neighbour lists
+    metadata_cache : MetadataCache | None
+        Cache the band names are validated from; if they are not cached, the
+        validation is done by the server when the result is computed
 
     Raises
     ------
@@ -91,39 +195,178 @@ def speckle_filter_wrapper(
     ImageCollection
         A processed Sentinel-1 image collection
 
-    """
+    """  # noqa: DOC502
     SPECKLE_FILTER_FRAMEWORK = speckle_filter_framework or "MONO"
     SPECKLE_FILTER = speckle_filter or "BOXCAR"
     SPECKLE_FILTER_KERNEL_SIZE = speckle_filter_kernel_size or 3
     SPECKLE_FILTER_NR_OF_IMAGES = speckle_filter_nr_of_images or 10
+    SPECKLE_FILTER_NEIGHBOUR_SELECTION = speckle_filter_neighbour_selection or "ARCHIVE"
+    SPECKLE_FILTER_OVERLAP_MAX_ERROR = speckle_filter_overlap_max_error or 10
 
-    if SPECKLE_FILTER_FRAMEWORK not in ["MONO", "MULTI"]:
-        raise ValueError("ERROR!!! SPECKLE_FILTER_FRAMEWORK not correctly defined")
+    _check_speckle_filter(
+        SPECKLE_FILTER_FRAMEWORK,
+        SPECKLE_FILTER,
+        SPECKLE_FILTER_KERNEL_SIZE,
+        SPECKLE_FILTER_NEIGHBOUR_SELECTION,
+        SPECKLE_FILTER_OVERLAP_MAX_ERROR,
+    )
+    col = _check_polarisations(col, metadata_cache)
 
-    if SPECKLE_FILTER not in ["BOXCAR", "LEE", "GAMMA MAP", "REFINED LEE", "LEE SIGMA"]:
-        raise ValueError("ERROR!!! SPECKLE_FILTER not correctly defined")
+    with tracing.span(
+        "wrapper.speckle_filter",
+        framework=SPECKLE_FILTER_FRAMEWORK,
+        filter=SPECKLE_FILTER,
+        kernel_size=SPECKLE_FILTER_KERNEL_SIZE,
+    ):
+        if SPECKLE_FILTER_FRAMEWORK == "MONO":
+            col = ee.ImageCollection(
+                sf.MonoTemporal_Filter(col, SPECKLE_FILTER_KERNEL_SIZE, SPECKLE_FILTER)
+            )
+        else:
+            col = ee.ImageCollection(
+                sf.MultiTemporal_Filter(
+                    col,
+                    SPECKLE_FILTER_KERNEL_SIZE,
+                    SPECKLE_FILTER,
+                    SPECKLE_FILTER_NR_OF_IMAGES,
+                    SPECKLE_FILTER_NEIGHBOUR_SELECTION,
+                    speckle_filter_neighbour_pool,
+                    SPECKLE_FILTER_OVERLAP_MAX_ERROR,
+                    speckle_filter_neighbour_manifest,
+                )
+            )
 
-    if SPECKLE_FILTER_KERNEL_SIZE <= 0:
-        raise ValueError("ERROR!!! SPECKLE_FILTER_KERNEL_SIZE not correctly defined")
+    return col
+
+
+def ard_wrapper(
+    col: ImageCollection,
+    apply_border_noise_correction: bool = True,
+    apply_speckle_filtering: bool = True,
+    speckle_filter_framework: str = "MONO",
+    speckle_filter: str = "BOXCAR",
+    speckle_filter_kernel_size: int = 3,
+    speckle_filter_nr_of_images: int = 10,
+    apply_terrain_flattening: bool = True,
+    terrain_flattening_model: str = "VOLUME",
+    terrain_flattening_additional_layover_shadow_buffer: int = 3,
+    dem: str = "USGS/SRTMGL1_003",
+    output_format: str = "LINEAR",
+    terrain_geometry: str | Image | None = None,
+    terrain_flattening_heading: str = "ANGLE",
+    speckle_filter_neighbour_selection: str = "ARCHIVE",
+    speckle_filter_neighbour_pool: ImageCollection | None = None,
+    speckle_filter_overlap_max_error: float = 10,
+    speckle_filter_neighbour_manifest: dict | str | None = None,
+    metadata_cache: MetadataCache | None = None,
+) -> ImageCollection:
+    """
+    Applies border noise correction, speckle filtering, terrain normalization
+    and the conversion to dB to a collection of S1 images in a single map,
+    see ``pipeline.ard_function``.
+
+    Parameters
+    ----------
+    col : ImageCollection
+        GEE image collection to be preprocessed
+    apply_border_noise_correction : bool
+    apply_speckle_filtering : bool
+    speckle_filter_framework : str
+    speckle_filter : str
+    speckle_filter_kernel_size : int
+    speckle_filter_nr_of_images : int
+    apply_terrain_flattening : bool
+    terrain_flattening_model : str
+    terrain_flattening_additional_layover_shadow_buffer : int
+    dem : str
+    output_format : str
+        "LINEAR" or "DB"
+    terrain_geometry : str | Image | None
+        See ``terrain_normalization_wrapper``
+    terrain_flattening_heading : str
+        See ``terrain_normalization_wrapper``
+    speckle_filter_neighbour_selection : str
+        See ``speckle_filter_wrapper``
+    speckle_filter_neighbour_pool : ImageCollection | None
+        See ``speckle_filter_wrapper``
+    speckle_filter_overlap_max_error : float
+        See ``speckle_filter_wrapper``
+    speckle_filter_neighbour_manifest : dict | str | None
+        See ``speckle_filter_wrapper``
+    metadata_cache : MetadataCache | None
+        See ``speckle_filter_wrapper``
+
+    Raises
+    ------
+    ValueError
 
-    bands = col.first().bandNames().getInfo()
-    if not [band for band in bands if band in ["VV", "VH"]]:
-        raise ValueError("Filters only apply to VH and VV bands.")
+    Returns
+    -------
+    ImageCollection
+        A processed Sentinel-1 image collection
 
-    if SPECKLE_FILTER_FRAMEWORK == "MONO":
-        col = ee.ImageCollection(
-            sf.MonoTemporal_Filter(col, SPECKLE_FILTER_KERNEL_SIZE, SPECKLE_FILTER)
+    """
+    SPECKLE_FILTER_FRAMEWORK = speckle_filter_framework or "MONO"
+    SPECKLE_FILTER = speckle_filter or "BOXCAR"
+    SPECKLE_FILTER_KERNEL_SIZE = speckle_filter_kernel_size or 3
+    SPECKLE_FILTER_NR_OF_IMAGES = speckle_filter_nr_of_images or 10
+    SPECKLE_FILTER_NEIGHBOUR_SELECTION = speckle_filter_neighbour_selection or "ARCHIVE"
+    SPECKLE_FILTER_OVERLAP_MAX_ERROR = speckle_filter_overlap_max_error or 10
+    TERRAIN_FLATTENING_MODEL = terrain_flattening_model or "VOLUME"
+    DEM = dem or "USGS/SRTMGL1_003"
+    TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER = (
+        terrain_flattening_additional_layover_shadow_buffer or 0
+    )
+    TERRAIN_FLATTENING_HEADING = terrain_flattening_heading or "ANGLE"
+    FORMAT = output_format or "LINEAR"
+
+    if FORMAT not in ["LINEAR", "DB"]:
+        raise ValueError("ERROR!!! FORMAT not correctly defined")
+    if apply_speckle_filtering:
+        _check_speckle_filter(
+            SPECKLE_FILTER_FRAMEWORK,
+            SPECKLE_FILTER,
+            SPECKLE_FILTER_KERNEL_SIZE,
+            SPECKLE_FILTER_NEIGHBOUR_SELECTION,
+            SPECKLE_FILTER_OVERLAP_MAX_ERROR,
         )
-        print("Mono-temporal speckle filtering is completed")  # noqa: T201
-    else:
-        col = ee.ImageCollection(
-            sf.MultiTemporal_Filter(
-                col,
-                SPECKLE_FILTER_KERNEL_SIZE,
-                SPECKLE_FILTER,
-                SPECKLE_FILTER_NR_OF_IMAGES,
-            )
+        col = _check_polarisations(col, metadata_cache)
+    if apply_terrain_flattening:
+        _check_terrain_normalization(
+            TERRAIN_FLATTENING_MODEL,
+            TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER,
+            TERRAIN_FLATTENING_HEADING,
         )
-        print("Multi-temporal speckle filtering is completed")  # noqa: T201
 
+    with tracing.span(
+        "wrapper.ard",
+        border_noise_correction=apply_border_noise_correction,
+        framework=SPECKLE_FILTER_FRAMEWORK if apply_speckle_filtering else None,
+        filter=SPECKLE_FILTER if apply_speckle_filtering else None,
+        kernel_size=SPECKLE_FILTER_KERNEL_SIZE,
+        model=TERRAIN_FLATTENING_MODEL if apply_terrain_flattening else None,
+        format=FORMAT,
+    ):
+        col = pipeline.ard_pipeline(
+            col,
+            APPLY_BORDER_NOISE_CORRECTION=apply_border_noise_correction,
+            SPECKLE_FILTER_FRAMEWORK=SPECKLE_FILTER_FRAMEWORK if apply_speckle_filtering else None,
+            SPECKLE_FILTER=SPECKLE_FILTER,
+            SPECKLE_FILTER_KERNEL_SIZE=SPECKLE_FILTER_KERNEL_SIZE,
+            SPECKLE_FILTER_NR_OF_IMAGES=SPECKLE_FILTER_NR_OF_IMAGES,
+            TERRAIN_FLATTENING_MODEL=TERRAIN_FLATTENING_MODEL if apply_terrain_flattening else None,
+            DEM=ee.Image(DEM),
+            TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER=(
+                TERRAIN_FLATTENING_ADDITIONAL_LAYOVER_SHADOW_BUFFER
+            ),
+            FORMAT=FORMAT,
+            TERRAIN_GEOMETRY=_terrain_geometry(col, terrain_geometry, DEM)
+            if apply_terrain_flattening
+            else None,
+            HEADING=TERRAIN_FLATTENING_HEADING,
+            NEIGHBOUR_SELECTION=SPECKLE_FILTER_NEIGHBOUR_SELECTION,
+            NEIGHBOUR_POOL=speckle_filter_neighbour_pool,
+            OVERLAP_MAX_ERROR=SPECKLE_FILTER_OVERLAP_MAX_ERROR,
+            NEIGHBOUR_MANIFEST=speckle_filter_neighbour_manifest,
+        )
     return col
@@ -2,6 +2,7 @@ import logging
 import os
 
 import ee
+import numpy as np
 import pytest
 from dotenv import load_dotenv
 from ee.imagecollection import ImageCollection
@@ -44,6 +45,43 @@ def palsar2_test_col(gee_client) -> ImageCollection:
     )
 
 
+# ---
+# Synthetic scenes of the local backend
+
+
+def synthetic_scene(seed, shape=(40, 50), nan=None, angles=(30, 46)):
+    """
+    VV, VH gamma speckle and an incidence angle ramp across the columns.
+
+    ``seed`` may be a generator shared by several scenes, and ``nan`` an index
+    of the stack (e.g. ``np.s_[1, 10:13, 20:24]``) masked with NaN.
+    """
+    rng = np.random.default_rng(seed)
+    vv = rng.gamma(5, 0.1 / 5, size=shape)
+    vh = rng.gamma(5, 0.02 / 5, size=shape)
+    angle = np.tile(np.linspace(*angles, shape[1]), (shape[0], 1))
+    scene = np.stack([vv, vh, angle])
+    if nan is not None:
+        scene[nan] = np.nan
+    return scene
+
+
+def synthetic_dem(shape=(40, 50)):
+    """Hills steep enough for layover and shadow."""
+    x, y = np.meshgrid(np.arange(float(shape[1])), np.arange(float(shape[0])))
+    return 120 * np.sin(x / 6) * np.cos(y / 9)
+
+
+@pytest.fixture
+def make_scene():
+    return synthetic_scene
+
+
+@pytest.fixture
+def make_dem():
+    return synthetic_dem
+
+
 # ---
 # Configure logging
 
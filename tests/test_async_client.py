@@ -0,0 +1,182 @@
+"""Test the asynchronous client against a local mock of the REST API."""
+
+import asyncio
+import io
+import json
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+
+from gee_s1_processing import async_client, tracing  # noqa: E402
+
+
+class MockEarthEngine:
+    """``value:compute`` and ``image:computePixels`` with scripted rate limiting."""
+
+    def __init__(self, rate_limited=0, unavailable=0, delay=0.01):
+        self.rate_limited = rate_limited
+        self.unavailable = unavailable
+        self.delay = delay
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/v1/projects/{project}/value:compute", self.compute_value)
+        app.router.add_post("/v1/projects/{project}/image:computePixels", self.compute_pixels)
+        return app
+
+    async def _handle(self, request):
+        body = await request.json()
+        self.requests.append(body)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        if self.rate_limited > 0:
+            self.rate_limited -= 1
+            error = {"error": {"code": 429, "message": "Too many requests"}}
+            raise web.HTTPTooManyRequests(text=json.dumps(error), headers={"Retry-After": "0.05"})
+        if self.unavailable > 0:
+            self.unavailable -= 1
+            raise web.HTTPServiceUnavailable(text="unavailable")
+        return body
+
+    async def compute_value(self, request):
+        body = await self._handle(request)
+        if "value" not in body["expression"]:
+            error = {"error": {"code": 400, "message": "Invalid expression"}}
+            raise web.HTTPBadRequest(text=json.dumps(error))
+        return web.json_response({"result": body["expression"]["value"] * 2})
+
+    async def compute_pixels(self, request):
+        body = await self._handle(request)
+        dimensions = body["grid"]["dimensions"]
+        shape = (dimensions["height"], dimensions["width"])
+        pixels = np.zeros(shape, dtype=[(band, "<f4") for band in body["bandIds"]])
+        pixels[body["bandIds"][0]] = body["expression"]["value"]
+        buffer = io.BytesIO()
+        np.save(buffer, pixels)
+        return web.Response(body=buffer.getvalue())
+
+
+class RecordingSink(tracing.Sink):
+    def __init__(self):
+        self.spans = []
+
+    def end(self, span):
+        self.spans.append(span)
+
+
+def run(mock, coroutine, **kwargs):
+    async def main():
+        async with TestServer(mock.app()) as server:
+            url = str(server.make_url("/v1"))
+            async with async_client.AsyncClient("test", url, **kwargs) as client:
+                return await coroutine(client)
+
+    return asyncio.run(main())
+
+
+# run in its own interpreter, the offline initialization must not leak into the GEE tests
+OFFLINE_PIPELINE = textwrap.dedent(
+    """
+    import asyncio
+
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+
+    from gee_s1_processing import graph_stats
+    from gee_s1_processing.async_client import AsyncClient
+
+    graph_stats.initialize_offline()
+    col = graph_stats.default_collection()
+    expressions = []
+
+
+    async def compute_value(request):
+        expressions.append((await request.json())["expression"])
+        return web.json_response({"result": len(expressions)})
+
+
+    async def main():
+        app = web.Application()
+        app.router.add_post("/v1/projects/{project}/value:compute", compute_value)
+        async with TestServer(app) as server:
+            async with AsyncClient("offline", str(server.make_url("/v1"))) as client:
+                dates = [f"2022-{month:02d}-01" for month in range(1, 12)]
+                return await client.map_values(
+                    lambda date: col.filterDate(date, "2022-12-31").size(), dates
+                )
+
+
+    assert sorted(asyncio.run(main())) == list(range(1, 12))
+    assert len({str(expression) for expression in expressions}) == 11
+    assert all("result" in expression and "values" in expression for expression in expressions)
+    """
+)
+
+
+class TestAsyncClient:
+    def test_bounded_concurrency(self):
+        mock = MockEarthEngine()
+        items = list(range(40))
+        values = run(
+            mock,
+            lambda client: client.map_values(lambda i: {"value": i}, items),
+            max_concurrency=5,
+        )
+        assert values == [2 * i for i in items]
+        assert mock.max_in_flight == 5
+
+    def test_rate_limit_backoff(self):
+        mock = MockEarthEngine(rate_limited=3, unavailable=1)
+        with tracing.use_sink(RecordingSink()) as sink:
+            values = run(
+                mock,
+                lambda client: client.map_values(lambda i: {"value": i}, range(4)),
+                backoff=0.01,
+            )
+        assert values == [0, 2, 4, 6]
+        assert len(mock.requests) == 8
+        spans = [span for span in sink.spans if span.name == "ee.request"]
+        assert sum(span.attributes["attempts"] for span in spans) == 8
+        assert all(span.attributes["status"] == 200 for span in spans)
+
+    def test_errors(self):
+        from ee import EEException
+
+        mock = MockEarthEngine(rate_limited=10)
+        with pytest.raises(EEException, match="Too many requests"):
+            run(mock, lambda client: client.compute_value({"value": 1}), max_retries=2, backoff=0)
+        assert len(mock.requests) == 3
+        with pytest.raises(EEException, match="Invalid expression"):
+            run(MockEarthEngine(), lambda client: client.compute_value({"invalid": 1}))
+
+    def test_pixels(self):
+        mock = MockEarthEngine()
+
+        def build(i):
+            return {"value": i}, async_client.pixel_grid(
+                600000 + 100 * i, 5e6, 4, 3, 10, "EPSG:32631"
+            )
+
+        tiles = run(mock, lambda client: client.map_pixels(build, range(3), ["VV", "VH"]))
+        assert [tile.shape for tile in tiles] == [(3, 4)] * 3
+        assert tiles[2].dtype.names == ("VV", "VH")
+        np.testing.assert_array_equal(tiles[2]["VV"], 2)
+        assert mock.requests[1]["fileFormat"] == "NPY"
+        assert mock.requests[1]["grid"]["affineTransform"]["translateX"] == 600100
+
+    def test_pipeline_offline(self):
+        subprocess.run([sys.executable, "-c", OFFLINE_PIPELINE], check=True)
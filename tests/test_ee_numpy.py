@@ -0,0 +1,143 @@
+"""Test the package functions run on local rasters through the NumPy ee facade."""
+
+import ee
+import numpy as np
+import pytest
+
+from gee_s1_processing import border_noise_correction as bnc
+from gee_s1_processing import helper, wrapper
+from gee_s1_processing import speckle_filter as sf
+from gee_s1_processing import terrain_flattening as trf
+from gee_s1_processing.local import ee_numpy as en
+from gee_s1_processing.local import speckle_filter as lsf
+from gee_s1_processing.local import terrain
+
+BANDS = ["VV", "VH", "angle"]
+
+
+@pytest.fixture
+def scene(make_scene):
+    return make_scene(0, nan=np.s_[1, 10:13, 20:24])
+
+
+@pytest.fixture
+def local_ee():
+    with en.use_local_backend() as facade:
+        yield facade
+
+
+class TestEeNumpy:
+    @pytest.mark.parametrize(
+        ("filter", "reference"),
+        [
+            (sf.boxcar, lsf.boxcar),
+            (sf.leefilter, lsf.leefilter),
+            (sf.gammamap, lsf.gammamap),
+            (sf.leesigma, lsf.leesigma),
+        ],
+    )
+    def test_filters_match_local(self, local_ee, scene, filter, reference):
+        image = en.from_numpy(scene, BANDS)
+        output = en.to_numpy(filter(image, 7))
+        np.testing.assert_allclose(output, reference(scene, 7, BANDS), rtol=1e-9)
+
+    def test_refined_lee_matches_local(self, local_ee, scene):
+        output = en.to_numpy(sf.RefinedLee(en.from_numpy(scene, BANDS)))
+        # the Earth Engine version casts the filtered bands to float
+        np.testing.assert_allclose(output, lsf.RefinedLee(scene, BANDS), rtol=1e-6)
+
+    def test_refined_lee_filters_bands_together(self, local_ee, scene):
+        # any number of bands, each filtered as if it were alone
+        bands = ["VV", "VH", "HH", "angle"]
+        stack = np.concatenate([scene[:2], scene[:1] * 2, scene[2:]])
+        output = en.to_numpy(sf.RefinedLee(en.from_numpy(stack, bands)))
+        single = en.to_numpy(sf.RefinedLee(en.from_numpy(scene[[1, 2]], ["VH", "angle"])))
+        np.testing.assert_allclose(output[1], single[0])
+        np.testing.assert_allclose(output[2], output[0] * 2, rtol=1e-6)
+        np.testing.assert_array_equal(output[3], scene[2])
+
+    def test_helper_and_border_noise(self, local_ee, scene):
+        image = en.from_numpy(scene, BANDS, {"system:time_start": 42})
+        roundtrip = en.to_numpy(helper.db_to_lin(helper.lin_to_db(image)))
+        np.testing.assert_allclose(roundtrip, scene)
+        masked = bnc.f_mask_edges(image)
+        assert masked.get("system:time_start") == 42
+        output = en.to_numpy(masked)
+        outside = (scene[2] <= 30.63993) | (scene[2] >= 45.23993)
+        assert np.isnan(output[0][outside]).all()
+        np.testing.assert_allclose(output[0][~outside], scene[0][~outside])
+
+    @pytest.mark.parametrize("model", ["VOLUME", "DIRECT"])
+    def test_terrain_flattening_flat_dem(self, local_ee, scene, model):
+        col = en.ImageCollection([en.from_numpy(scene, BANDS)])
+        output = trf.slope_correction(col, model, en.Image(np.zeros((40, 50))), 3).first()
+        assert output.bandNames() == BANDS
+        output = en.to_numpy(output)
+        # no slope: gamma0 = sigma0 / cos(theta), the DEM edges are masked
+        gamma0 = scene[:2] / np.cos(np.radians(scene[2]))
+        np.testing.assert_allclose(output[:2, 1:-1, 1:-1], gamma0[:, 1:-1, 1:-1])
+        assert np.isnan(output[0, 0]).all()
+        np.testing.assert_array_equal(output[2], scene[2])
+
+    def test_wrapper(self, scene):
+        with en.use_local_backend(assets={"USGS/SRTMGL1_003": np.zeros((40, 50))}):
+            col = en.ImageCollection([en.from_numpy(scene, BANDS)])
+            col = wrapper.terrain_normalization_wrapper(col)
+            col = wrapper.speckle_filter_wrapper(col, "MONO", "LEE", 5)
+            assert en.to_numpy(col.first()).shape == scene.shape
+        # the Earth Engine API is back
+        assert sf.ee is ee
+        assert wrapper.ee is ee
+
+    def test_collection_reduces_bands_by_name(self, local_ee):
+        ones, twos = np.ones((4, 4)), np.full((4, 4), 2.0)
+        col = en.ImageCollection(
+            [
+                en.from_numpy(np.stack([ones, twos]), ["a", "b"]),
+                en.from_numpy(np.stack([twos, ones]), ["b", "c"]),
+            ]
+        )
+        total = col.sum()
+        assert total.bandNames() == ["a", "b", "c"]
+        np.testing.assert_array_equal(en.to_numpy(total), [ones, twos * 2, ones])
+        maximum = col.reduce(en.Reducer.max())
+        assert maximum.bandNames() == ["a_max", "b_max", "c_max"]
+        np.testing.assert_array_equal(en.to_numpy(maximum), [ones, twos, ones])
+
+    def test_lazy_evaluation(self, local_ee):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return [np.ones((4, 4))]
+
+        image = en.Image._create(["b1"], compute)
+        output = image.add(1).multiply(image).addBands(image.sqrt().rename("root"))
+        assert calls == []
+        np.testing.assert_array_equal(en.to_numpy(output), [np.full((4, 4), 2), np.ones((4, 4))])
+        assert calls == [1]
+
+
+class TestLocalTerrain:
+    def test_slope_aspect_of_plane(self):
+        x, y = np.meshgrid(np.arange(20.0), np.arange(20.0))
+        # rises towards the north east, rows run southwards
+        dem = 3.0 * x - 4.0 * y
+        slope = terrain.slope(dem, 10.0)
+        aspect = terrain.aspect(dem, 10.0)
+        np.testing.assert_allclose(slope[1:-1, 1:-1], np.degrees(np.arctan(0.5)))
+        # faces the south west, downhill
+        expected = np.degrees(np.arctan2(-3, -4)) % 360
+        np.testing.assert_allclose(aspect[1:-1, 1:-1], expected)
+        assert np.isnan(slope[0]).all()
+
+    def test_fast_distance_transform(self):
+        rng = np.random.default_rng(2)
+        features = rng.random((30, 40)) < 0.02
+        distance = terrain.fast_distance_transform(features, 8)
+        rows, cols = np.nonzero(features)
+        for i, j in np.ndindex(features.shape):
+            squared = (rows - i) ** 2 + (cols - j) ** 2
+            near = squared[(np.abs(rows - i) <= 8) & (np.abs(cols - j) <= 8)]
+            expected = near.min() if near.size else 2 * 8**2 + 1
+            assert distance[i, j] == expected
@@ -0,0 +1,202 @@
+"""Test the export scheduler against a local fake task service."""
+
+import subprocess
+import sys
+import textwrap
+
+import ee
+import pytest
+
+from gee_s1_processing import export_scheduler as es
+
+# run in its own interpreter, the offline initialization must not leak into the GEE tests
+OFFLINE_CHUNK = textwrap.dedent(
+    """
+    import json
+
+    from gee_s1_processing import graph_stats
+    from gee_s1_processing.export_scheduler import Chunk
+
+    graph_stats.initialize_offline()
+    col = graph_stats.default_collection()
+    graph = Chunk("2022-01-01", "2022-02-01", 88).filter(col).serialize()
+    assert "relativeOrbitNumber_start" in graph and "2022-02-01" in graph, graph
+    assert Chunk().filter(col).serialize() == col.serialize()
+    """
+)
+
+
+class FakeTaskService:
+    """Tasks complete after ``duration`` polls; the scripted ones fail first."""
+
+    def __init__(self, duration=2, failures=None, quota=None):
+        self.duration = duration
+        self.failures = dict(failures or {})
+        self.quota = quota
+        self.tasks = {}
+        self.max_running = 0
+
+    def running(self):
+        return sum(task["state"] == "RUNNING" for task in self.tasks.values())
+
+    def start(self, image, description):
+        if self.quota is not None and self.running() >= self.quota:
+            raise ee.EEException("Too many tasks already in the queue")
+        task_id = f"TASK{len(self.tasks)}"
+        fail = self.failures.get(description, 0) > 0
+        self.failures[description] = self.failures.get(description, 0) - 1
+        self.tasks[task_id] = {"image": image, "polls": 0, "fail": fail, "state": "RUNNING"}
+        self.max_running = max(self.max_running, self.running())
+        return task_id
+
+    def status(self, task_ids):
+        statuses = {}
+        for task_id in task_ids:
+            task = self.tasks[task_id]
+            task["polls"] += 1
+            if task["polls"] >= self.duration:
+                task["state"] = "FAILED" if task["fail"] else "COMPLETED"
+            statuses[task_id] = {"id": task_id, "state": task["state"], "error_message": "boom"}
+        return statuses
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestChunks:
+    def test_date_chunks(self):
+        chunks = es.date_chunks("2022-01-01", "2022-03-01", 30)
+        assert [(c.start, c.end) for c in chunks] == [
+            ("2022-01-01", "2022-01-31"),
+            ("2022-01-31", "2022-03-01"),
+        ]
+        chunks = es.orbit_chunks([88, 37, 88], chunks)
+        assert len(chunks) == 4
+        assert chunks[1].name == "S1_2022-01-01_2022-01-31_88"
+        assert len({chunk.name for chunk in chunks}) == 4
+
+    def test_filter_offline(self):
+        subprocess.run([sys.executable, "-c", OFFLINE_CHUNK], check=True)
+
+
+class TestExportScheduler:
+    def test_bounded_concurrency(self):
+        service = FakeTaskService(duration=3)
+        clock = Clock()
+        chunks = es.date_chunks("2022-01-01", "2022-12-31", 12)
+        scheduler = es.ExportScheduler(
+            lambda chunk: chunk.name, chunks, service, max_running=4, clock=clock
+        )
+        summary = scheduler.run(poll_interval=30, sleep=clock.sleep)
+        assert summary == {"PENDING": 0, "SUBMITTED": 0, "COMPLETED": len(chunks), "FAILED": 0}
+        assert service.max_running == 4
+        assert len(service.tasks) == len(chunks)
+        assert {task["image"] for task in service.tasks.values()} == {c.name for c in chunks}
+
+    def test_retry_with_backoff(self):
+        chunks = es.orbit_chunks([37, 88, 139])
+        service = FakeTaskService(duration=1, failures={chunks[0].name: 2, chunks[1].name: 9})
+        clock = Clock()
+        scheduler = es.ExportScheduler(
+            lambda chunk: chunk.name, chunks, service, max_attempts=3, backoff=60, clock=clock
+        )
+        scheduler.step()
+        clock.now = 10
+        scheduler.step()
+        job = scheduler.jobs[chunks[0].name]
+        assert (job.state, job.attempts, job.next_attempt) == ("PENDING", 1, 70)
+        assert scheduler.jobs[chunks[2].name].state == "COMPLETED"
+        clock.now = 69
+        scheduler.step()
+        assert job.attempts == 1
+        summary = scheduler.run(poll_interval=30, sleep=clock.sleep)
+        assert summary == {"PENDING": 0, "SUBMITTED": 0, "COMPLETED": 2, "FAILED": 1}
+        assert job.attempts == 3
+        assert scheduler.jobs[chunks[1].name].errors == ["boom"] * 3
+
+    def test_quota_errors_are_retried(self):
+        service = FakeTaskService(duration=2, quota=1)
+        clock = Clock()
+        scheduler = es.ExportScheduler(
+            lambda chunk: chunk.name, es.orbit_chunks([1, 2]), service, backoff=5, clock=clock
+        )
+        summary = scheduler.run(poll_interval=10, sleep=clock.sleep)
+        assert summary["COMPLETED"] == 2
+        assert "Too many tasks" in scheduler.jobs["S1___2"].errors[0]
+
+    def test_resume(self, tmp_path):
+        service = FakeTaskService(duration=2)
+        chunks = es.date_chunks("2022-01-01", "2022-01-05", 1)
+        path = tmp_path / "exports.json"
+        scheduler = es.ExportScheduler(lambda chunk: chunk.name, chunks, service, path, 2)
+        for _ in range(3):
+            scheduler.step()
+        assert scheduler.summary() == {"PENDING": 0, "SUBMITTED": 2, "COMPLETED": 2, "FAILED": 0}
+
+        # interrupted: the submitted tasks are polled, not submitted again
+        resumed = es.ExportScheduler(lambda chunk: chunk.name, chunks, service, path, 2)
+        assert resumed.summary() == scheduler.summary()
+        resumed.run(poll_interval=0, sleep=lambda _: None)
+        assert resumed.summary()["COMPLETED"] == 4
+        assert len(service.tasks) == 4
+
+    def test_interrupted_submission(self, tmp_path):
+        service = FakeTaskService(duration=2)
+        chunks = es.orbit_chunks([1, 2, 3])
+        path = tmp_path / "exports.json"
+
+        def build(chunk):
+            if chunk.name == chunks[1].name:
+                raise KeyboardInterrupt
+            return chunk.name
+
+        with pytest.raises(KeyboardInterrupt):
+            es.ExportScheduler(build, chunks, service, path).step()
+        # the task started before the interruption is polled, not submitted again
+        resumed = es.ExportScheduler(lambda chunk: chunk.name, chunks, service, path)
+        assert resumed.jobs[chunks[0].name].task_id == "TASK0"
+        resumed.run(poll_interval=0, sleep=lambda _: None)
+        assert resumed.summary()["COMPLETED"] == 3
+        assert len(service.tasks) == 3
+
+    def test_validation(self):
+        with pytest.raises(ValueError, match="max_running"):
+            es.ExportScheduler(str, [], FakeTaskService(), max_running=0)
+        with pytest.raises(ValueError, match="destination"):
+            es.EETaskService("CLOUD", "bucket")
+
+
+class TestEETaskService:
+    def test_status(self, monkeypatch):
+        calls = []
+        operations = [
+            {"name": "projects/p/operations/A", "metadata": {"state": "RUNNING"}},
+            {
+                "name": "projects/p/operations/B",
+                "metadata": {"state": "FAILED"},
+                "done": True,
+                "error": {"message": "boom"},
+            },
+            {"name": "projects/p/operations/C", "metadata": {"state": "SUCCEEDED"}, "done": True},
+            {"name": "projects/p/operations/OTHER", "metadata": {"state": "PENDING"}},
+        ]
+        monkeypatch.setattr(ee.data, "listOperations", lambda: calls.append(1) or operations)
+        statuses = es.EETaskService("ASSET", "folder").status(["A", "B", "C", "MISSING"])
+        # one listing for all the tasks, the tasks of other runs are left out
+        assert len(calls) == 1
+        assert {task_id: status["state"] for task_id, status in statuses.items()} == {
+            "A": "RUNNING",
+            "B": "FAILED",
+            "C": "COMPLETED",
+            "MISSING": "UNKNOWN",
+        }
+        assert statuses["B"]["error_message"] == "boom"
+        assert "error_message" not in statuses["C"]
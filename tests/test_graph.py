@@ -0,0 +1,64 @@
+"""Test the shared subexpressions and folded constants of the expression graphs."""
+
+import numpy as np
+import pytest
+
+from gee_s1_processing import graph
+from gee_s1_processing import speckle_filter as sf
+from gee_s1_processing.local import ee_numpy as en
+from gee_s1_processing.local import speckle_filter as lsf
+
+BANDS = ["VV", "VH", "angle"]
+
+
+@graph.memoize
+def _build(image, suffix):
+    _build.calls += 1
+    return [image, suffix]
+
+
+@pytest.fixture
+def calls():
+    _build.calls = 0
+    return _build
+
+
+class TestMemoize:
+    def test_outside_scope(self, calls):
+        image = object()
+        assert _build(image, "_mean") is not _build(image, "_mean")
+        assert calls.calls == 2
+
+    def test_within_scope(self, calls):
+        image, other = object(), object()
+        with graph.scope():
+            first = _build(image, "_mean")
+            assert _build(image, "_mean") is first
+            assert _build(image, "_variance") is not first
+            assert _build(other, "_mean") is not first
+        assert calls.calls == 3
+        # the memo is dropped with the scope
+        assert _build(image, "_mean") is not first
+
+    def test_nested_scopes_share(self, calls):
+        image = object()
+        with graph.scope() as outer:
+            first = _build(image, "_mean")
+            with graph.scope() as inner:
+                assert inner is outer
+                assert _build(image, "_mean") is first
+        assert calls.calls == 1
+
+
+class TestFolding:
+    def test_lee_sigma_lut(self):
+        assert set(sf.LEE_SIGMA_LUT) == {0.5, 0.6, 0.7, 0.8, 0.9, 0.95}
+        assert sf.LEE_SIGMA_LUT[0.9] == {"I1": 0.378, "I2": 2.094, "eta": 0.3991}
+
+    @pytest.mark.parametrize("SPECKLE_FILTER", ["LEE", "GAMMA MAP", "LEE SIGMA"])
+    def test_folded_filters_match_local(self, make_scene, SPECKLE_FILTER):
+        scene = make_scene(1, (30, 40))
+        reference = {"LEE": lsf.leefilter, "GAMMA MAP": lsf.gammamap, "LEE SIGMA": lsf.leesigma}
+        with en.use_local_backend():
+            output = en.to_numpy(sf.spatial_filter(en.from_numpy(scene, BANDS), 5, SPECKLE_FILTER))
+        np.testing.assert_allclose(output, reference[SPECKLE_FILTER](scene, 5, BANDS), rtol=1e-9)
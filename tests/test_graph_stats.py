@@ -0,0 +1,54 @@
+"""Test the size of the expression graphs against the recorded baseline, offline."""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+BASELINE = Path(__file__).parent / "data" / "graph_stats_baseline.json"
+# the byte size depends on the serializer of the earthengine-api release
+BYTES_RTOL = 0.05
+
+
+@pytest.fixture(scope="module")
+def matrix():
+    # own interpreter, the offline initialization must not leak into the GEE tests
+    output = subprocess.run(
+        [sys.executable, "-m", "gee_s1_processing.graph_stats"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return json.loads(output.stdout)
+
+
+class TestGraphStats:
+    def test_matches_baseline(self, matrix):
+        # regenerate after intended changes with:
+        # python -m gee_s1_processing.graph_stats > tests/data/graph_stats_baseline.json
+        baseline = json.loads(BASELINE.read_text())
+        assert matrix.keys() == baseline.keys()
+        for key, stats in matrix.items():
+            expected = baseline[key]
+            # the structure is compared exactly, the serialized size with a tolerance
+            assert {k: v for k, v in stats.items() if k != "bytes"} == {
+                k: v for k, v in expected.items() if k != "bytes"
+            }, key
+            assert stats["bytes"] == pytest.approx(expected["bytes"], rel=BYTES_RTOL), key
+
+    def test_counts(self, matrix):
+        assert matrix["MONO/BOXCAR/3"]["map"] == 1
+        assert matrix["MONO/BOXCAR/3"]["reduce_neighborhood"] == 0
+        assert matrix["MONO/REFINED LEE/3"]["reduce_neighborhood"] > 0
+        assert matrix["TERRAIN/VOLUME"]["reduce_region"] == 1
+        for stats in matrix.values():
+            assert 0 < stats["depth"] <= stats["nodes"] < stats["bytes"]
+
+    def test_fused_pipeline(self, matrix):
+        assert matrix["ARD/MONO/FUSED"]["map"] == 1
+        for framework in ["MONO", "MULTI"]:
+            fused, sequential = (matrix[f"ARD/{framework}/{k}"] for k in ["FUSED", "SEQUENTIAL"])
+            assert fused["map"] < sequential["map"]
+            assert fused["nodes"] < sequential["nodes"]
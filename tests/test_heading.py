@@ -0,0 +1,93 @@
+"""Test the look direction derived from the orbit against the incidence angle estimate."""
+
+import math
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+import pytest
+
+from gee_s1_processing import heading
+from gee_s1_processing.local import terrain_flattening as ltrf
+
+# run in its own interpreter, the offline initialization must not leak into the GEE tests
+OFFLINE_HEADING = textwrap.dedent(
+    """
+    import ee
+
+    from gee_s1_processing import graph_stats, heading
+
+    graph_stats.initialize_offline()
+    image = ee.Image.constant(0).set("orbitProperties_pass", "ASCENDING")
+    graph = ee.Number(heading.metadata_heading(image)).serialize()
+    assert "Number.min" in graph and "Number.max" in graph, graph
+    """
+)
+
+
+def angle_band(look_heading, shape=(60, 60)):
+    # the incidence angle increases away from the satellite, 90 degrees right of the track
+    rows, cols = np.indices(shape, dtype=float)
+    look = math.radians(look_heading + 180)
+    east, north = cols, -rows
+    return 35 + 1e-3 * (east * math.sin(look) + north * math.cos(look))
+
+
+class TestHeading:
+    @pytest.mark.parametrize("latitude", [-60.0, 0.0, 48.86, 75.0])
+    def test_passes_are_symmetric(self, latitude):
+        ascending = heading.look_heading(latitude, True)
+        descending = heading.look_heading(latitude, False)
+        assert ascending == pytest.approx(-descending)
+        # ascending passes fly north, slightly westwards, and look east
+        assert -125 < ascending < -90
+
+    @pytest.mark.parametrize("latitude", [81.9, 85.0, -89.0])
+    def test_beyond_the_turning_latitude(self, latitude):
+        # e.g. Svalbard and northern Greenland: the heading of the turning point
+        turning = math.copysign(180 - heading.INCLINATION, latitude)
+        for ascending in [True, False]:
+            assert math.isfinite(heading.look_heading(latitude, ascending))
+            assert heading.look_heading(latitude, ascending) == pytest.approx(
+                heading.look_heading(turning, ascending)
+            )
+
+    def test_server_heading_is_clamped(self):
+        subprocess.run([sys.executable, "-c", OFFLINE_HEADING], check=True)
+
+    def test_track_azimuth(self):
+        # inclination of the orbit plus the rotation of the Earth at the equator
+        azimuth = math.degrees(math.atan2(-6.77 * 0.14234 - 0.465, 6.77 * 0.98982))
+        assert heading.look_heading(0, True) == pytest.approx(azimuth - 90, abs=1e-2)
+
+    @pytest.mark.parametrize(("latitude", "ascending"), [(5.0, True), (48.86, False)])
+    def test_matches_angle_aspect(self, latitude, ascending):
+        expected = heading.look_heading(latitude, ascending)
+        assert ltrf.heading(angle_band(expected), 10.0) == pytest.approx(expected, abs=1e-6)
+
+    def test_local_slope_correction_with_heading(self):
+        rng = np.random.default_rng(3)
+        angle = angle_band(heading.look_heading(45, True))
+        image = np.stack([rng.gamma(5, 0.02, size=angle.shape), angle])
+        x, y = np.meshgrid(np.arange(60.0), np.arange(60.0))
+        dem = 50 * np.sin(x / 7) * np.cos(y / 5)
+        expected = ltrf.slope_correction(image, ["VV", "angle"], "VOLUME", 0, dem)
+        output = ltrf.slope_correction(
+            image, ["VV", "angle"], "VOLUME", 0, dem, HEADING=heading.look_heading(45, True)
+        )
+        np.testing.assert_allclose(output, expected, atol=1e-9)
+
+    def test_consistency_summary(self):
+        report = {
+            "features": [
+                {"properties": {"relativeOrbitNumber_start": 88, "difference": d}}
+                for d in [0.5, -1.5]
+            ]
+            + [{"properties": {"relativeOrbitNumber_start": 37, "difference": 2.0}}]
+        }
+        summary = heading.consistency_summary(report)
+        assert summary["scenes"] == 3
+        assert summary["mean_abs_difference"] == pytest.approx(4 / 3)
+        assert summary["max_abs_difference"] == 2.0
+        assert summary["orbit_mean_difference"] == {37: 2.0, 88: -0.5}
@@ -0,0 +1,71 @@
+"""Test the streaming multi-temporal filter against a from-scratch Quegan filter."""
+
+import numpy as np
+import pytest
+
+from gee_s1_processing.local import multitemporal
+from gee_s1_processing.local import speckle_filter as lsf
+
+
+def quegan_from_scratch(images, index, nr_of_images, kernel_size, speckle_filter):
+    """Neighbours are the last images up to index, or the first ones of the series."""
+    window = images[max(index + 1 - nr_of_images, 0) : index + 1]
+    if len(window) < nr_of_images:
+        window = images[:nr_of_images]
+    ratios = [
+        image[:2]
+        / lsf.spatial_filter(image, kernel_size, speckle_filter, ["VV", "VH", "angle"])[:2]
+        for image in window
+    ]
+    count = np.sum([np.isfinite(image[:2]) for image in window], axis=0)
+    filtered = lsf.spatial_filter(images[index], kernel_size, speckle_filter, ["VV", "VH", "angle"])
+    output = filtered.copy()
+    output[:2] = filtered[:2] / count * np.nansum(ratios, axis=0)
+    return output
+
+
+@pytest.fixture
+def series(make_scene):
+    rng = np.random.default_rng(2)
+    images = []
+    for _ in range(9):
+        image = make_scene(rng, (20, 24), angles=(30, 45))
+        image[1, rng.integers(0, 20), rng.integers(0, 24)] = np.nan
+        images.append(image)
+    return images
+
+
+class TestQueganStream:
+    @pytest.mark.parametrize("speckle_filter", ["BOXCAR", "REFINED LEE"])
+    def test_matches_from_scratch(self, series, speckle_filter):
+        # two interleaved orbits, the second shorter than the window
+        orbits = [10, 10, 37, 10, 10, 10, 37, 10, 10]
+        scenes = [
+            (i, orbit, image) for i, (orbit, image) in enumerate(zip(orbits, series, strict=True))
+        ]
+        output = dict(
+            multitemporal.MultiTemporal_Filter(
+                scenes, 3, speckle_filter, 4, bandNames=["VV", "VH", "angle"]
+            )
+        )
+        assert sorted(output) == list(range(9))
+        for orbit in (10, 37):
+            keys = [i for i, o in enumerate(orbits) if o == orbit]
+            images = [series[i] for i in keys]
+            for index, key in enumerate(keys):
+                reference = quegan_from_scratch(images, index, 4, 3, speckle_filter)
+                np.testing.assert_allclose(output[key], reference, rtol=1e-9)
+
+    def test_filters_each_scene_once(self, series, monkeypatch):
+        calls = []
+        spatial_filter = multitemporal.spatial_filter
+        monkeypatch.setattr(
+            multitemporal,
+            "spatial_filter",
+            lambda *args: calls.append(1) or spatial_filter(*args),
+        )
+        stream = multitemporal.QueganStream(3, "LEE", 3, ["VV", "VH", "angle"])
+        released = [stream.push(image, 1, i) for i, image in enumerate(series)]
+        assert [len(r) for r in released] == [0, 0, 3, 1, 1, 1, 1, 1, 1]
+        assert len(calls) == len(series)
+        assert len(stream._windows[1].ratios) == 3
@@ -0,0 +1,62 @@
+"""Test the NumPy terrain flattening and its terrain geometry cache."""
+
+import numpy as np
+import pytest
+
+from gee_s1_processing import terrain_flattening as trf
+from gee_s1_processing.local import ee_numpy as en
+from gee_s1_processing.local import terrain_flattening as ltrf
+
+BANDS = ["VV", "VH", "angle"]
+
+
+@pytest.fixture
+def scene(make_scene):
+    return make_scene(1)
+
+
+@pytest.fixture
+def dem(make_dem):
+    return make_dem()
+
+
+class TestLocalTerrainFlattening:
+    @pytest.mark.parametrize("model", ["VOLUME", "DIRECT"])
+    @pytest.mark.parametrize("buffer", [0, 30])
+    def test_matches_ee_version(self, scene, dem, model, buffer):
+        output = ltrf.slope_correction(scene, BANDS, model, buffer, dem)
+        with en.use_local_backend():
+            col = en.ImageCollection([en.from_numpy(scene, BANDS)])
+            expected = en.to_numpy(trf.slope_correction(col, model, en.Image(dem), buffer).first())
+        assert np.isnan(output[0]).any()
+        np.testing.assert_allclose(output, expected)
+
+    def test_shared_geometry_matches(self, scene, dem):
+        with en.use_local_backend():
+            col = en.ImageCollection([en.from_numpy(scene, BANDS)])
+            geometry = trf.terrain_geometry(en.Image(dem), None, None)
+            np.testing.assert_allclose(en.to_numpy(geometry), ltrf.terrain_geometry(dem, 10.0))
+            expected = en.to_numpy(trf.slope_correction(col, "VOLUME", en.Image(dem), 0).first())
+            shared = trf.slope_correction(col, "VOLUME", None, 0, geometry).first()
+            np.testing.assert_allclose(en.to_numpy(shared), expected)
+
+    def test_cache(self, tmp_path, scene, dem):
+        cache = ltrf.TerrainGeometryCache(tmp_path)
+        calls = []
+
+        def load_dem():
+            calls.append(1)
+            return dem
+
+        footprint = (0, 0, 500, 400)
+        first = cache.get("SRTM", "EPSG:32631", footprint, 10.0, load_dem)
+        second = cache.get("SRTM", "EPSG:32631", footprint, 10.0, load_dem)
+        assert calls == [1]
+        assert len(list(tmp_path.iterdir())) == 1
+        np.testing.assert_array_equal(first, second)
+        cache.get("SRTM", "EPSG:32631", (0, 0, 500, 410), 10.0, load_dem)
+        assert calls == [1, 1]
+        np.testing.assert_allclose(
+            ltrf.slope_correction(scene, BANDS, "DIRECT", 0, geometry=second),
+            ltrf.slope_correction(scene, BANDS, "DIRECT", 0, dem),
+        )
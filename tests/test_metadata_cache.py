@@ -0,0 +1,85 @@
+"""Test the metadata cache and the wrapper validation without blocking calls, offline."""
+
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+import pytest
+
+from gee_s1_processing import metadata_cache, wrapper
+from gee_s1_processing.local import ee_numpy as en
+
+# run in its own interpreter, the offline initialization must not leak into the GEE tests
+OFFLINE_WRAPPER = textwrap.dedent(
+    """
+    import ee
+
+    from gee_s1_processing import graph_stats, wrapper
+    from gee_s1_processing.metadata_cache import MetadataCache, fingerprint
+
+
+    def blocking_call(*args, **kwargs):
+        raise AssertionError("blocking call")
+
+
+    graph_stats.initialize_offline()
+    ee.data.computeValue = blocking_call
+    col = graph_stats.default_collection()
+    assert fingerprint(col) == fingerprint(graph_stats.default_collection())
+    assert fingerprint(col) != fingerprint(col.filter(ee.Filter.eq("orbitProperties_pass", "A")))
+    for framework in ["MONO", "MULTI"]:
+        wrapper.speckle_filter_wrapper(col, framework, "LEE", 5).serialize()
+    cache = MetadataCache()
+    cache.put_band_names(col, ["HH", "HV", "angle"])
+    try:
+        wrapper.speckle_filter_wrapper(col, metadata_cache=cache)
+    except ValueError as error:
+        assert str(error) == "Filters only apply to VH and VV bands."
+    else:
+        raise AssertionError("no error")
+    """
+)
+
+
+class FakeCollection:
+    def __init__(self, expression):
+        self.expression = expression
+
+    def serialize(self):
+        return self.expression
+
+
+class TestMetadataCache:
+    def test_ttl(self, monkeypatch):
+        now = 1000.0
+        monkeypatch.setattr(metadata_cache.time, "time", lambda: now)
+        cache = metadata_cache.MetadataCache(ttl=60)
+        cache.put("key", [1, 2])
+        now += 60
+        assert cache.get("key") == [1, 2]
+        now += 1
+        assert cache.get("key") is None
+        assert cache.get("missing") is None
+
+    def test_disk_roundtrip(self, tmp_path):
+        path = tmp_path / "metadata.json"
+        col = FakeCollection('{"result": "0"}')
+        metadata_cache.MetadataCache(path).put_band_names(col, ("VV", "VH", "angle"))
+        cache = metadata_cache.MetadataCache(path)
+        assert cache.band_names(col) == ["VV", "VH", "angle"]
+        assert cache.band_names(FakeCollection('{"result": "1"}')) is None
+        assert list(tmp_path.iterdir()) == [path]
+
+    def test_wrapper_offline_without_blocking_calls(self):
+        subprocess.run([sys.executable, "-c", OFFLINE_WRAPPER], check=True)
+
+    def test_deferred_validation_local(self):
+        rng = np.random.default_rng(0)
+        scene = rng.gamma(5, 0.02, size=(2, 20, 20))
+        with en.use_local_backend():
+            col = en.ImageCollection([en.from_numpy(scene, ["VH", "angle"])])
+            assert wrapper.speckle_filter_wrapper(col).size() == 1
+            col = en.ImageCollection([en.from_numpy(scene, ["HH", "angle"])])
+            with pytest.raises(ValueError, match="Filters only apply to VH and VV bands"):
+                wrapper.speckle_filter_wrapper(col)
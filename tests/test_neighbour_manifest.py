@@ -0,0 +1,113 @@
+"""Test the offline resolution of the multi-temporal filter neighbours."""
+
+import pytest
+
+from gee_s1_processing import neighbour_manifest as nm
+
+DAY_MS = nm.DAY_MS
+T0 = 1_600_000_000_000
+
+
+def square(x0, y0, size=1.0):
+    return ((x0, y0), (x0 + size, y0), (x0 + size, y0 + size), (x0, y0 + size), (x0, y0))
+
+
+def make_scene(id, day, footprint, orbit=37, polarisations=("VV", "VH")):
+    return nm.Scene(id, T0 + day * DAY_MS, orbit, orbit, polarisations, footprint)
+
+
+@pytest.fixture
+def scenes():
+    series = []
+    for day in range(0, 60, 6):
+        # two frames per acquisition, splitting the footprint of the target
+        series.append(make_scene(f"A{day}", day, square(0, 0)))
+        series.append(make_scene(f"B{day}", day, square(0, 1)))
+    # shifted frame: covers half of the target
+    series.append(make_scene("shifted", 3, square(0.5, 0)))
+    # other orbit and other polarisation
+    series.append(make_scene("orbit", 4, square(0, 0), orbit=88))
+    series.append(make_scene("hh", 5, square(0, 0), polarisations=("HH",)))
+    # far away
+    series.append(make_scene("far", 2, square(40, 40)))
+    return sorted(series, key=lambda scene: scene.time_start)
+
+
+class TestNeighbourManifest:
+    def test_index_query(self, scenes):
+        index = nm.FootprintIndex(scenes, capacity=4)
+        found = {scene.id for scene in index.query((0.6, 0.2, 0.7, 0.3))}
+        assert found == {s.id for s in scenes if s.id != "far" and not s.id.startswith("B")}
+        assert [scene.id for scene in index.query((39, 39, 39.5, 39.5))] == []
+
+    def test_coverage(self):
+        target = make_scene("t", 0, square(0, 0, 2))
+        halves = [make_scene("a", 0, square(0, 0, 2)[:2] + ((2, 1), (0, 1)))]
+        assert nm.coverage(target, halves) == pytest.approx(0.5)
+        # overlapping frames are not counted twice
+        frames = [make_scene("a", 0, square(-1, -1, 2.5)), make_scene("b", 0, square(0, 0, 2))]
+        assert nm.coverage(target, frames) == pytest.approx(1.0)
+        assert nm.coverage(target, []) == 0.0
+
+    def test_resolve_neighbours(self, scenes):
+        index = nm.FootprintIndex(scenes)
+        target = next(s for s in scenes if s.id == "A30")
+        # the 3 latest fully overlapping dates, the frames of these dates are all returned
+        ids = nm.resolve_neighbours(target, index, 3)
+        assert ids == ["A30", "B30", "A24", "B24", "A18", "B18"]
+        # at the start of the series, later dates complete the list
+        first = next(s for s in scenes if s.id == "A0")
+        assert nm.resolve_neighbours(first, index, 3) == ["A0", "B0", "A6", "B6", "A12", "B12"]
+        # neighbours share the relative orbit and the polarisation of the scene
+        shifted = next(s for s in scenes if s.id == "shifted")
+        assert "orbit" not in nm.resolve_neighbours(shifted, index, 3)
+        assert "hh" not in nm.resolve_neighbours(shifted, index, 3)
+
+    def test_manifest_roundtrip(self, scenes, tmp_path):
+        manifest = nm.build_manifest(scenes, 4)
+        assert set(manifest["neighbours"]) == {scene.id for scene in scenes}
+        for suffix in [".json", ".json.gz"]:
+            path = tmp_path / f"manifest{suffix}"
+            nm.write_manifest(manifest, path)
+            assert nm.load_manifest(path) == manifest
+        with pytest.raises(ValueError, match="version"):
+            nm.load_manifest({"version": 0})
+        with pytest.raises(ValueError, match="NR_OF_IMAGES"):
+            nm.build_manifest(scenes, 0)
+
+    def test_read_scenes(self):
+        features = {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "geometry": None,
+                    "id": "COPERNICUS/S1_GRD_FLOAT/S1A_IW_GRDH_1",
+                    "properties": {
+                        "system:time_start": T0,
+                        "relativeOrbitNumber_start": 37,
+                        "relativeOrbitNumber_stop": 37,
+                        "transmitterReceiverPolarisation": ["VV", "VH"],
+                        "system:footprint": {
+                            "type": "LinearRing",
+                            "coordinates": [list(p) for p in square(0, 0)],
+                        },
+                    },
+                },
+                {
+                    "type": "Feature",
+                    "geometry": {"type": "Polygon", "coordinates": [square(0, 0)]},
+                    "properties": {
+                        "system:index": "S1A_IW_GRDH_0",
+                        "system:time_start": T0 - DAY_MS,
+                        "relativeOrbitNumber_start": 37,
+                        "relativeOrbitNumber_stop": 37,
+                        "transmitterReceiverPolarisation": "[VV, VH]",
+                    },
+                },
+            ],
+        }
+        scenes = nm.read_scenes(features)
+        assert [scene.id for scene in scenes] == ["S1A_IW_GRDH_0", "S1A_IW_GRDH_1"]
+        assert scenes[0].polarisations == ("VV", "VH")
+        assert scenes[1].footprint == square(0, 0)
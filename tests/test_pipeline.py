@@ -0,0 +1,153 @@
+"""Test the fused ARD pipeline against the wrappers steps, on the NumPy backend."""
+
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from gee_s1_processing import border_noise_correction as bnc
+from gee_s1_processing import helper, pipeline, wrapper
+from gee_s1_processing import speckle_filter as sf
+from gee_s1_processing import terrain_flattening as trf
+from gee_s1_processing.local import ee_numpy as en
+from gee_s1_processing.local import pipeline as lp
+from gee_s1_processing.local import scratch
+from gee_s1_processing.local import speckle_filter as lsf
+from gee_s1_processing.local import terrain_flattening as ltrf
+
+BANDS = ["VV", "VH", "angle"]
+
+
+@pytest.fixture
+def scene(make_scene):
+    # wider than the 30.64-45.24 degrees kept by the border noise correction
+    return make_scene(4, angles=(29, 47))
+
+
+@pytest.fixture
+def dem(make_dem):
+    return make_dem()
+
+
+class TestPipeline:
+    @pytest.mark.parametrize("speckle_filter", ["BOXCAR", "REFINED LEE", "LEE SIGMA"])
+    @pytest.mark.parametrize("output_format", ["LINEAR", "DB"])
+    def test_matches_sequential(self, scene, dem, speckle_filter, output_format):
+        with en.use_local_backend():
+            col = en.ImageCollection([en.from_numpy(scene, BANDS)])
+            fused = pipeline.ard_pipeline(
+                col, SPECKLE_FILTER=speckle_filter, DEM=en.Image(dem), FORMAT=output_format
+            )
+            sequential = sf.MonoTemporal_Filter(col.map(bnc.f_mask_edges), 3, speckle_filter)
+            sequential = trf.slope_correction(sequential, "VOLUME", en.Image(dem), 3)
+            if output_format == "DB":
+                sequential = sequential.map(helper.lin_to_db)
+            expected = en.to_numpy(sequential.first())
+            np.testing.assert_allclose(en.to_numpy(fused.first()), expected)
+
+        output = lp.ard_image(
+            scene, BANDS, SPECKLE_FILTER=speckle_filter, dem=dem, FORMAT=output_format
+        )
+        # dB values close to zero have larger relative errors
+        np.testing.assert_allclose(output, expected, rtol=1e-5)
+
+    def test_skipped_steps(self, scene):
+        with en.use_local_backend():
+            col = en.ImageCollection([en.from_numpy(scene, BANDS)])
+            output = pipeline.ard_pipeline(
+                col,
+                APPLY_BORDER_NOISE_CORRECTION=False,
+                SPECKLE_FILTER_FRAMEWORK=None,
+                TERRAIN_FLATTENING_MODEL=None,
+            )
+            np.testing.assert_allclose(en.to_numpy(output.first()), scene)
+
+    def test_in_place(self, scene, dem):
+        expected = lp.ard_image(scene, BANDS, SPECKLE_FILTER="LEE SIGMA", dem=dem, FORMAT="DB")
+        work = scene.copy()
+        output = lp.ard_image(
+            work, BANDS, SPECKLE_FILTER="LEE SIGMA", dem=dem, FORMAT="DB", out=work
+        )
+        assert output is work
+        np.testing.assert_allclose(output, expected)
+
+    def test_filter_out(self, scene):
+        expected = lsf.leesigma(scene, 5, BANDS, block_rows=8)
+        out = np.empty_like(scene)
+        assert lsf.leesigma(scene, 5, BANDS, block_rows=8, out=out) is out
+        np.testing.assert_array_equal(out, expected)
+        lsf.leesigma(out, 5, BANDS, block_rows=8, out=out)
+        np.testing.assert_array_equal(out, lsf.leesigma(expected, 5, BANDS, block_rows=8))
+
+    def test_validation(self, scene):
+        with pytest.raises(ValueError, match="FORMAT"):
+            pipeline.ard_function(None, FORMAT="NATURAL")
+        with pytest.raises(ValueError, match="FORMAT"):
+            wrapper.ard_wrapper(None, output_format="NATURAL")
+        with pytest.raises(ValueError, match="out"):
+            lsf.boxcar(scene, 3, BANDS, out=np.empty((2, 40, 50)))
+
+
+class TestFloat32:
+    @pytest.mark.parametrize(
+        "speckle_filter", ["BOXCAR", "LEE", "GAMMA MAP", "REFINED LEE", "LEE SIGMA"]
+    )
+    @pytest.mark.parametrize("terrain_flattening_model", ["VOLUME", "DIRECT"])
+    def test_matches_float64(self, scene, dem, speckle_filter, terrain_flattening_model):
+        kwargs = {
+            "SPECKLE_FILTER": speckle_filter,
+            "SPECKLE_FILTER_KERNEL_SIZE": 5,
+            "TERRAIN_FLATTENING_MODEL": terrain_flattening_model,
+            # gentle slopes: next to the layover the terrain factor diverges
+            "dem": dem / 10,
+        }
+        expected = lp.ard_image(scene, BANDS, **kwargs)
+        output = lp.ard_image(scene, BANDS, dtype=np.float32, **kwargs)
+        assert output.dtype == np.float32
+        np.testing.assert_allclose(output, expected, rtol=5e-6)
+        np.testing.assert_array_equal(np.isnan(output), np.isnan(expected))
+        # the type of the scene by default
+        db = lp.ard_image(scene.astype(np.float32), BANDS, FORMAT="DB", **kwargs)
+        assert db.dtype == np.float32
+        expected = lp.ard_image(scene, BANDS, FORMAT="DB", **kwargs)
+        np.testing.assert_allclose(db, expected, atol=2e-5)
+
+    def test_peak_memory(self, make_scene):
+        scene = make_scene(6, (512, 512)).astype(np.float32)
+        x, y = np.meshgrid(np.arange(512.0), np.arange(512.0))
+        geometry = ltrf.terrain_geometry(120 * np.sin(x / 40) * np.cos(y / 55), 10.0)
+        tracemalloc.start()
+        try:
+            lp.ard_image(scene, BANDS, SPECKLE_FILTER="LEE", geometry=geometry, HEADING=-167.0)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        # the output, the float64 window sums of one band and the terrain work arrays
+        assert peak < 5 * scene.nbytes
+
+
+class TestScratchPool:
+    def test_reuse(self):
+        pool = scratch.ScratchPool()
+        first = pool.get("work", (4, 5), np.float32)
+        assert pool.get("work", (4, 5), np.float32) is first
+        assert pool.get("other", (4, 5), np.float32) is not first
+        assert pool.get("work", (4, 6), np.float32) is not first
+        assert pool.get("work", (4, 6), np.float64).dtype == np.float64
+        assert pool.nbytes == 4 * 5 * 4 + 4 * 6 * 8
+        pool.clear()
+        assert pool.nbytes == 0
+
+    def test_use_pool(self):
+        assert scratch.buffer("work", (3,), float) is not scratch.buffer("work", (3,), float)
+        with scratch.use_pool() as pool:
+            assert scratch.buffer("work", (3,), float) is scratch.buffer("work", (3,), float)
+        assert pool.nbytes == 24
+
+    def test_filters_in_a_pool(self, scene, dem):
+        expected = lp.ard_image(scene, BANDS, SPECKLE_FILTER="GAMMA MAP", dem=dem)
+        with scratch.use_pool() as pool:
+            for _ in range(2):
+                output = lp.ard_image(scene, BANDS, SPECKLE_FILTER="GAMMA MAP", dem=dem)
+                np.testing.assert_array_equal(output, expected)
+        assert pool.nbytes > 0
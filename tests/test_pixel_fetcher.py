@@ -0,0 +1,165 @@
+"""Test the tiled pixel fetcher and its cache against a local mock of the REST API."""
+
+import asyncio
+import io
+import os
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip("aiohttp")
+from aiohttp import web  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+
+from gee_s1_processing import pixel_fetcher as pf  # noqa: E402
+from gee_s1_processing.async_client import AsyncClient  # noqa: E402
+
+SCALE = 10
+BOUNDS = (600000, 4999000, 601230, 5000000)  # 123 x 100 pixels
+
+
+def scene(x, y):
+    # value of a pixel from the coordinates of its top left corner
+    return x + y / 1e4
+
+
+class MockComputePixels:
+    def __init__(self):
+        self.requests = []
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/v1/projects/{project}/image:computePixels", self.compute_pixels)
+        return app
+
+    async def compute_pixels(self, request):
+        body = await request.json()
+        self.requests.append(body)
+        dimensions = body["grid"]["dimensions"]
+        transform = body["grid"]["affineTransform"]
+        cols = np.arange(dimensions["width"]) * transform["scaleX"] + transform["translateX"]
+        rows = np.arange(dimensions["height"]) * transform["scaleY"] + transform["translateY"]
+        bands = body["bandIds"]
+        pixels = np.zeros((dimensions["height"], dimensions["width"]), [(b, "<f8") for b in bands])
+        for i, band in enumerate(bands):
+            pixels[band] = scene(cols[None, :], rows[:, None]) + i
+        buffer = io.BytesIO()
+        np.save(buffer, pixels)
+        return web.Response(body=buffer.getvalue())
+
+
+def fetch(mock, **kwargs):
+    async def main():
+        async with TestServer(mock.app()) as server:
+            url = str(server.make_url("/v1"))
+            async with AsyncClient("test", url) as client:
+                return await pf.fetch_pixels(
+                    client, {"image": 1}, BOUNDS, SCALE, "EPSG:32631", ["VV", "VH"], **kwargs
+                )
+
+    return asyncio.run(main())
+
+
+class TestPixelFetcher:
+    def test_assembly(self):
+        mock = MockComputePixels()
+        pixels = fetch(mock, tile_size=32)
+        assert pixels.shape == (2, 100, 123)
+        assert len(mock.requests) == 4 * 4
+        x = BOUNDS[0] + SCALE * np.arange(123)
+        y = BOUNDS[3] - SCALE * np.arange(100)
+        np.testing.assert_array_equal(pixels[0], scene(x[None, :], y[:, None]))
+        np.testing.assert_array_equal(pixels[1], pixels[0] + 1)
+
+    def test_cache(self, tmp_path):
+        mock = MockComputePixels()
+        cache = pf.TileCache(tmp_path)
+        first = fetch(mock, tile_size=64, cache=cache, pipeline_hash="a")
+        assert len(mock.requests) == 4
+        np.testing.assert_array_equal(
+            fetch(mock, tile_size=64, cache=cache, pipeline_hash="a"), first
+        )
+        assert len(mock.requests) == 4
+        # other parameters or another tiling are other tiles
+        fetch(mock, tile_size=64, cache=cache, pipeline_hash="b")
+        fetch(mock, tile_size=50, cache=cache, pipeline_hash="a")
+        assert len(mock.requests) == 4 + 4 + 6
+        # the default hash is the one of the expression
+        fetch(mock, tile_size=64, cache=cache)
+        fetch(mock, tile_size=64, cache=cache)
+        assert len(mock.requests) == 14 + 4
+
+    def test_lru_eviction(self, tmp_path):
+        tile = np.zeros((2, 8, 8))
+        cache = pf.TileCache(tmp_path, max_bytes=3 * (tile.nbytes + 128))
+        for i, key in enumerate("abc"):
+            cache.put(key, tile + i)
+            os.utime(tmp_path / f"{key}.npy", ns=(i, i))
+        # a hit makes "a" the most recently used tile, "b" is evicted first
+        np.testing.assert_array_equal(cache.get("a"), tile)
+        cache.put("d", tile + 3)
+        assert cache.get("b") is None
+        assert all(cache.get(key) is not None for key in "acd")
+        assert cache.size() <= cache.max_bytes
+
+    def test_running_size(self, tmp_path, monkeypatch):
+        tile = np.zeros((2, 8, 8))
+        cache = pf.TileCache(tmp_path, max_bytes=3 * (tile.nbytes + 128))
+        scans = []
+        entries = cache._entries
+        monkeypatch.setattr(cache, "_entries", lambda: scans.append(1) or entries())
+        for key in "abc":
+            cache.put(key, tile)
+        cache.put("a", tile + 1)
+        # one scan on the first put, none while the cache fits
+        assert len(scans) == 1
+        cache.put("d", tile)
+        assert len(scans) == 2
+        assert cache._bytes == cache.size() <= cache.max_bytes
+
+    def test_unreadable_tile(self, tmp_path, monkeypatch):
+        tile = np.zeros((2, 8, 8))
+        cache = pf.TileCache(tmp_path)
+        for key in "ab":
+            cache.put(key, tile)
+        # a truncated tile is a miss, and is removed from the cache and its size
+        (tmp_path / "a.npy").write_bytes((tmp_path / "a.npy").read_bytes()[:100])
+        total = cache._bytes
+        assert cache.get("a") is None
+        assert not (tmp_path / "a.npy").exists()
+        assert cache._bytes == total - 100
+        # a tile evicted between the read and the touch is not created again
+        load = np.load
+
+        def load_then_evict(path):
+            tile = load(path)
+            path.unlink()
+            return tile
+
+        monkeypatch.setattr(pf.np, "load", load_then_evict)
+        np.testing.assert_array_equal(cache.get("b"), tile)
+        assert not (tmp_path / "b.npy").exists()
+
+    def test_cache_off_the_event_loop(self, tmp_path, monkeypatch):
+        cache = pf.TileCache(tmp_path)
+        threads = set()
+        for name in ["get", "put"]:
+            method = getattr(cache, name)
+
+            def record(*args, method=method):
+                threads.add(threading.get_ident())
+                return method(*args)
+
+            monkeypatch.setattr(cache, name, record)
+        fetch(MockComputePixels(), tile_size=64, cache=cache, pipeline_hash="a")
+        assert threads
+        assert threading.get_ident() not in threads
+
+    def test_errors(self, tmp_path):
+        with pytest.raises(ValueError, match="max_bytes"):
+            pf.TileCache(tmp_path, max_bytes=0)
+        with pytest.raises(ValueError, match="bounds"):
+            asyncio.run(pf.fetch_pixels(None, {}, (1, 0, 0, 1), SCALE))
+        assert pf.parameter_hash(a=1, b=[2]) == pf.parameter_hash(b=[2], a=1)
+        assert pf.parameter_hash(a=1) != pf.parameter_hash(a=2)
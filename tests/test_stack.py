@@ -0,0 +1,89 @@
+"""Test the memory-mapped stacks and the multi-temporal filter of their windows."""
+
+import numpy as np
+import pytest
+
+from gee_s1_processing.local import multitemporal
+from gee_s1_processing.local import stack as lstack
+
+BANDS = ["VV", "VH", "angle"]
+
+
+@pytest.fixture
+def series(tmp_path, make_scene):
+    rng = np.random.default_rng(6)
+    stack = lstack.Stack.create(tmp_path / "stack", 12, BANDS, (30, 40), np.float64)
+    images = []
+    for t in range(12):
+        image = make_scene(rng, (30, 40), angles=(30, 45))
+        images.append(image)
+        # two orbits, interleaved
+        metadata = lstack.SceneMetadata(
+            f"2022-01-{t + 1:02d}T06:00:00", [37, 88][t % 2], ("VV", "VH")
+        )
+        stack.write(t, image, metadata)
+    stack.flush()
+    return images, tmp_path / "stack"
+
+
+class TestStack:
+    def test_round_trip(self, series):
+        images, directory = series
+        stack = lstack.Stack.open(directory)
+        assert isinstance(stack.data, np.memmap)
+        assert stack.data.shape == (12, 3, 30, 40)
+        assert stack.bandNames == BANDS
+        assert stack.metadata[3] == lstack.SceneMetadata("2022-01-04T06:00:00", 88, ("VV", "VH"))
+        np.testing.assert_array_equal(stack.data[5], images[5])
+        with pytest.raises(ValueError, match="read-only"):
+            stack.data[0, 0, 0, 0] = 1
+
+    def test_zero_copy_window(self, series):
+        _, directory = series
+        stack = lstack.Stack.open(directory)
+        window = stack.window(4, slice(5, 15), slice(10, 30))
+        assert window.shape == (3, 10, 20)
+        assert np.shares_memory(window, stack.data)
+        for _, _, image in stack.scenes(stack.select(37), slice(5, 15), slice(10, 30)):
+            assert np.shares_memory(image, stack.data)
+
+    def test_select(self, series):
+        _, directory = series
+        stack = lstack.Stack.open(directory)
+        assert stack.select(37) == [0, 2, 4, 6, 8, 10]
+        assert stack.select(start="2022-01-03", end="2022-01-06") == [2, 3, 4]
+
+    def test_temporal_neighbours(self, series):
+        _, directory = series
+        stack = lstack.Stack.open(directory)
+        assert lstack.temporal_neighbours(stack, [8], 3) == [4, 6, 8]
+        # the start of an orbit is completed with later acquisitions
+        assert lstack.temporal_neighbours(stack, [1, 10], 3) == [1, 3, 5, 6, 8, 10]
+
+    @pytest.mark.parametrize("times", [None, [1, 8, 9], [10, 11]])
+    @pytest.mark.parametrize(
+        ("SPECKLE_FILTER", "window"),
+        [
+            ("LEE", (slice(4, 24), slice(6, 30))),
+            ("LEE SIGMA", (slice(4, 24), slice(6, 30))),
+            # the halo is clipped at the scene edges
+            ("REFINED LEE", (slice(None, 12), slice(30, None))),
+        ],
+    )
+    def test_stack_filter(self, series, times, SPECKLE_FILTER, window):
+        images, directory = series
+        stack = lstack.Stack.open(directory)
+        expected = dict(
+            multitemporal.MultiTemporal_Filter(
+                [(t, [37, 88][t % 2], image) for t, image in enumerate(images)],
+                3,
+                SPECKLE_FILTER,
+                4,
+                BANDS,
+            )
+        )
+        output = dict(lstack.stack_filter(stack, 3, SPECKLE_FILTER, 4, times, *window))
+        assert sorted(output) == sorted(range(12) if times is None else times)
+        for t, filtered in output.items():
+            # the window of the filter run over the whole scenes, without seams
+            np.testing.assert_allclose(filtered, expected[t][:, window[0], window[1]])
@@ -0,0 +1,103 @@
+"""Test the tiled processing of the local backend against whole scene results."""
+
+import numpy as np
+import pytest
+
+from gee_s1_processing.local import pipeline as lp
+from gee_s1_processing.local import speckle_filter as lsf
+from gee_s1_processing.local import terrain_flattening as ltrf
+from gee_s1_processing.local import tiling
+
+BANDS = ["VV", "VH", "angle"]
+
+
+@pytest.fixture
+def scene(make_scene):
+    return make_scene(5, (70, 90), nan=np.s_[0, 30:34, 40:45], angles=(29, 47))
+
+
+@pytest.fixture
+def dem(make_dem):
+    return make_dem((70, 90))
+
+
+class TestTiling:
+    def test_tiles_cover_the_scene(self):
+        count = np.zeros((70, 90), dtype=int)
+        for tile in tiling.tiles((70, 90), 32, 5):
+            count[tile.write] += 1
+            window = np.zeros((70, 90), dtype=bool)
+            window[tile.read] = True
+            assert window[tile.write].all()
+            assert tile.read[0].stop - tile.read[0].start <= 32 + 2 * 5
+        np.testing.assert_array_equal(count, 1)
+
+    @pytest.mark.parametrize(
+        ("speckle_filter", "kernel_size"),
+        [("BOXCAR", 7), ("GAMMA MAP", 5), ("REFINED LEE", 7), ("LEE SIGMA", 9)],
+    )
+    def test_spatial_filter(self, scene, speckle_filter, kernel_size):
+        whole = lsf.spatial_filter(scene, kernel_size, speckle_filter, BANDS)
+        tiled = tiling.tiled_spatial_filter(
+            scene, kernel_size, speckle_filter, BANDS, tile_size=16, max_workers=1
+        )
+        # the summed-area tables start at each tile, so only round-off differs
+        np.testing.assert_allclose(tiled, whole, rtol=1e-9)
+        np.testing.assert_array_equal(np.isnan(tiled), np.isnan(whole))
+
+    @pytest.mark.parametrize("buffer", [0, 30, 1000])
+    def test_slope_correction(self, scene, dem, buffer):
+        whole = ltrf.slope_correction(scene, BANDS, "VOLUME", buffer, dem)
+        tiled = tiling.tiled_slope_correction(
+            scene, BANDS, "VOLUME", buffer, dem, tile_size=16, max_workers=1
+        )
+        np.testing.assert_array_equal(tiled, whole)
+        geometry = ltrf.terrain_geometry(dem, 10.0)
+        tiled = tiling.tiled_slope_correction(
+            scene, BANDS, "VOLUME", buffer, geometry=geometry, tile_size=16, max_workers=1
+        )
+        np.testing.assert_array_equal(tiled, whole)
+
+    @pytest.mark.parametrize("speckle_filter", ["LEE", "LEE SIGMA"])
+    def test_ard_image_in_a_process_pool(self, tmp_path, scene, dem, speckle_filter):
+        whole = lp.ard_image(scene, BANDS, SPECKLE_FILTER=speckle_filter, dem=dem, FORMAT="DB")
+        out = np.lib.format.open_memmap(tmp_path / "ard.npy", "w+", float, scene.shape)
+        tiled = tiling.tiled_ard_image(
+            scene,
+            BANDS,
+            SPECKLE_FILTER=speckle_filter,
+            dem=dem,
+            FORMAT="DB",
+            tile_size=24,
+            max_workers=2,
+            out=out,
+        )
+        assert tiled is out
+        np.testing.assert_allclose(tiled, whole, rtol=1e-9)
+        np.testing.assert_array_equal(np.isnan(tiled), np.isnan(whole))
+
+    def test_ard_image_float32(self, scene, dem):
+        whole = lp.ard_image(scene, BANDS, SPECKLE_FILTER="GAMMA MAP", dem=dem, dtype=np.float32)
+        tiled = tiling.tiled_ard_image(
+            scene,
+            BANDS,
+            SPECKLE_FILTER="GAMMA MAP",
+            dem=dem,
+            tile_size=24,
+            max_workers=1,
+            dtype=np.float32,
+        )
+        assert tiled.dtype == np.float32
+        np.testing.assert_allclose(tiled, whole, rtol=1e-6)
+        np.testing.assert_array_equal(np.isnan(tiled), np.isnan(whole))
+        # the work arrays of the tiles are released with the scene
+        assert tiling._TILE_POOL.nbytes == 0
+
+    def test_halo(self):
+        assert tiling.speckle_filter_halo("REFINED LEE", 3) == 3
+        assert tiling.speckle_filter_halo("LEE SIGMA", 7) == 4
+        assert tiling.terrain_flattening_halo(0) == 1
+        assert tiling.terrain_flattening_halo(25, 10.0, dem=False) == 3
+        assert tiling.terrain_flattening_halo(10**6) == 31
+        with pytest.raises(ValueError, match="SPECKLE_FILTER"):
+            tiling.speckle_filter_halo("MEDIAN", 3)
@@ -0,0 +1,154 @@
+"""Test the tracing spans, metrics and sinks."""
+
+import io
+import json
+import logging
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+import pytest
+
+from gee_s1_processing import tracing
+from gee_s1_processing.local import pipeline as lp
+
+
+class RecordingSink(tracing.Sink):
+    def __init__(self):
+        self.started = []
+        self.spans = []
+        self.metrics = []
+
+    def start(self, span):
+        self.started.append(span.name)
+
+    def end(self, span):
+        self.spans.append(span)
+
+    def metric(self, name, value, attributes):
+        self.metrics.append((name, value, attributes))
+
+
+# run in its own interpreter, the offline initialization must not leak into the GEE tests
+OFFLINE_WRAPPER = textwrap.dedent(
+    """
+    import io
+    import json
+
+    from gee_s1_processing import graph_stats, tracing, wrapper
+
+    graph_stats.initialize_offline()
+    stream = io.StringIO()
+    with tracing.use_sink(tracing.JsonLinesSink(stream)):
+        wrapper.ard_wrapper(graph_stats.default_collection(), speckle_filter="LEE")
+        wrapper.speckle_filter_wrapper(graph_stats.default_collection())
+    spans = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [span["name"] for span in spans] == ["wrapper.ard", "wrapper.speckle_filter"]
+    assert spans[0]["attributes"]["filter"] == "LEE"
+    assert spans[0]["duration"] > 0
+    """
+)
+
+
+class TestTracing:
+    def test_nested_spans(self):
+        sink = RecordingSink()
+        with tracing.use_sink(sink), tracing.span("outer", a=1) as outer:
+            with tracing.span("inner") as inner:
+                inner.set(b=2)
+            tracing.metric("size", 3, unit="bytes")
+        assert sink.started == ["outer", "inner"]
+        assert [span.name for span in sink.spans] == ["inner", "outer"]
+        assert inner.parent_id == outer.span_id
+        assert inner.trace_id == outer.trace_id
+        assert outer.parent_id is None
+        assert inner.attributes == {"b": 2}
+        assert outer.duration >= inner.duration >= 0
+        assert sink.metrics == [("size", 3, {"unit": "bytes"})]
+        # nothing is sent once the sink is removed
+        with tracing.span("after"):
+            tracing.metric("size", 4)
+        assert len(sink.spans) == 2
+        assert len(sink.metrics) == 1
+
+    def test_error(self):
+        sink = RecordingSink()
+        with (
+            pytest.raises(ValueError, match="bad"),
+            tracing.use_sink(sink),
+            tracing.span("failing"),
+        ):
+            raise ValueError("bad")
+        assert sink.spans[0].status == "ERROR"
+        assert sink.spans[0].attributes["error"] == "ValueError: bad"
+
+    def test_get_info(self):
+        class Value:
+            def getInfo(self):
+                return 42
+
+        sink = RecordingSink()
+        with tracing.use_sink(sink):
+            assert tracing.get_info(Value()) == 42
+        assert sink.spans[0].name == "ee.getInfo"
+        assert sink.spans[0].attributes == {"type": "Value"}
+
+    def test_json_lines_sink(self, tmp_path):
+        sink = tracing.JsonLinesSink(tmp_path / "trace.jsonl")
+        with tracing.use_sink(sink):
+            with tracing.span("stage", filter="LEE"):
+                pass
+            tracing.metric("count", 2)
+        sink.close()
+        records = [json.loads(line) for line in (tmp_path / "trace.jsonl").read_text().splitlines()]
+        assert [record["type"] for record in records] == ["span", "metric"]
+        assert records[0]["name"] == "stage"
+        assert records[0]["attributes"] == {"filter": "LEE"}
+        assert records[1]["value"] == 2
+
+    def test_logging_sink(self):
+        stream = io.StringIO()
+        logger = logging.getLogger("test_tracing")
+        logger.addHandler(logging.StreamHandler(stream))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        with tracing.use_sink(tracing.LoggingSink(logger)), tracing.span("stage"):
+            pass
+        assert stream.getvalue().startswith("stage OK in ")
+
+    def test_opentelemetry_sink(self):
+        pytest.importorskip("opentelemetry")
+        # without an SDK the spans are not recorded, only the calls are checked
+        with (
+            tracing.use_sink(tracing.OpenTelemetrySink()),
+            tracing.span("outer", a=[1]),
+            tracing.span("inner"),
+        ):
+            tracing.metric("size", 1)
+
+    def test_local_stages(self, make_scene):
+        scene = make_scene(0, (20, 30), angles=(29, 47))
+        sink = RecordingSink()
+        with tracing.use_sink(sink):
+            lp.ard_image(scene, ["VV", "VH", "angle"], dem=np.zeros((20, 30)), FORMAT="DB")
+        stages = [span for span in sink.spans if span.parent_id is None]
+        assert [span.name for span in stages] == [
+            "local.border_noise",
+            "local.speckle_filter",
+            "local.terrain_flattening",
+            "local.db",
+        ]
+        assert stages[1].attributes == {"filter": "BOXCAR", "kernel_size": 3}
+        # the window sums of the filter record their strategy
+        windows = [span for span in sink.spans if span.name == "local.window_sums"]
+        assert windows
+        assert {span.parent_id for span in windows} == {stages[1].span_id}
+        assert {span.attributes["strategy"] for span in windows} == {"DIRECT"}
+
+    def test_wrapper_spans(self):
+        result = subprocess.run(
+            [sys.executable, "-c", OFFLINE_WRAPPER], check=True, capture_output=True, text=True
+        )
+        # the wrappers do not print anymore
+        assert result.stdout == ""